@@ -1,13 +1,14 @@
-from DiscreteEventSimulator import Simulator
+from DiscreteEventSimulator import Event, Simulator
 from datetime import datetime
 from croniter import croniter
-import pytz
+import time_zones
 
 
 class CronSimulator(Simulator):
 
     def __init__(self, start_time, end_time, default_location, **kwargs):
         self.default_location = default_location
+        self._zone_tables = None
         start_timestamp = self.localized_timestamp(*start_time)
         end_timestamp = self.localized_timestamp(*end_time)
 
@@ -15,30 +16,51 @@ class CronSimulator(Simulator):
                            start_timestamp,
                            end_timestamp,
                            **kwargs)
+        self._zone_tables = {}
 
-    def localized_timestamp(self, year, month, day, hour, minute,
-                            second, tz=None):
+    def zone_table(self, tz=None):
+        """Return the cached `time_zones.ZoneTable` for a location.
+
+        The table covers the simulation from the current time to the end
+        time, and is built the first time the location is used.
+        """
         tz = tz or self.default_location
+        try:
+            return self._zone_tables[tz]
+        except KeyError:
+            table = time_zones.ZoneTable(tz, self.time, self.end_time)
+            self._zone_tables[tz] = table
+            return table
 
-        zone = pytz.timezone(tz)
-        time = datetime(year, month, day, hour, minute, second)
+    def extend_end_time(self, new_end_time):
+        Simulator.extend_end_time(self, new_end_time)
+        self._zone_tables = {}
 
-        timestamp = zone.localize(time).timestamp()
+    def localized_timestamp(self, year, month, day, hour, minute,
+                            second, tz=None):
+        tz = tz or self.default_location
 
-        return timestamp
+        if self._zone_tables is None:
+            return time_zones.localized_timestamp(tz, year, month, day, hour,
+                                                  minute, second)
+        return self.zone_table(tz).localized_timestamp(year, month, day, hour,
+                                                       minute, second)
 
-    def timestamp_to_datetime(self, timestamp, tz=None):
-        tz = tz or self.default_location
+    def localized_timestamps(self, wall_times, tz=None):
+        """Convert an array of local wall clock times to timestamps.
 
-        # Convert timestamp to an aware datetime with a UTC time zone
-        utc_zone = pytz.timezone("UTC")
-        utc_time = utc_zone.localize(datetime.utcfromtimestamp(timestamp))
+        Args:
+            wall_times: NumPy array of `datetime64` values, or of seconds from
+                1970-01-01 00:00:00 on the local wall clock
+            tz: Location of the wall clock, the default location if None
 
-        # Convert UTC datetime to a specific timezone
-        zone = pytz.timezone(tz)
-        time = zone.normalize(utc_time.astimezone(zone))
+        Returns:
+            numpy.ndarray: float timestamps
+        """
+        return self.zone_table(tz).to_timestamps(wall_times)
 
-        return time
+    def timestamp_to_datetime(self, timestamp, tz=None):
+        return self.zone_table(tz).to_datetime(timestamp)
 
     def localize_cron_string(self, cron_instruction):
         if isinstance(cron_instruction, str):
@@ -50,14 +72,22 @@ class CronSimulator(Simulator):
     def schedule(self, time, priority, callback, *args, **kwargs):
         timestamp = self.localized_timestamp(*time)
 
-        Simulator.schedule(self,
-                           timestamp,
-                           priority,
-                           callback,
-                           *args,
-                           **kwargs)
+        return Simulator.schedule(self,
+                                  timestamp,
+                                  priority,
+                                  callback,
+                                  *args,
+                                  **kwargs)
 
     def cron_schedule(self, cron_instruction, start, end, priority, callback, *args, **kwargs):
+        """Schedule `callback` to run at every occurrence of a cron string.
+
+        Only the next occurrence is held in the event queue.  When it fires,
+        the following occurrence is armed, so memory doesn't grow with the
+        length of the simulation.  Occurrences after `end` are not scheduled.
+
+        Returns: a `CronSeries` that can cancel, pause or resume the series.
+        """
         if not start:
             cron_start = self.time
         else:
@@ -71,24 +101,175 @@ class CronSimulator(Simulator):
         local_cron_instruction = self.localize_cron_string(cron_instruction)
         start_datetime = self.timestamp_to_datetime(cron_start, local_cron_instruction[1])
         cron_iterator = croniter(local_cron_instruction[0], start_datetime)
-        zone = pytz.timezone(local_cron_instruction[1])
-
-        while True:
-            next_event = cron_iterator.get_next(datetime)
-            next_event = zone.normalize(next_event)
-            event_timestamp = self.localized_timestamp(next_event.year,
-                                                       next_event.month,
-                                                       next_event.day,
-                                                       next_event.hour,
-                                                       next_event.minute,
-                                                       next_event.second,
-                                                       local_cron_instruction[1])
-            Simulator.schedule(self,
-                               event_timestamp,
-                               priority,
-                               callback,
-                               *args,
-                               **kwargs)
-
-            if event_timestamp > cron_end:
-                break
\ No newline at end of file
+
+        series = CronSeries(self, cron_iterator, local_cron_instruction[1],
+                            cron_end, priority, callback, args, kwargs)
+        series.resume()
+        return series
+
+
+class CronSeries(object):
+    """Handle for a recurring series of events scheduled from a cron string.
+
+    The series reuses a single `Event`, which is moved to the next occurrence
+    each time it fires.  Every occurrence keeps the insertion sequence the
+    series was given when it was created, so events run in the same order as
+    if every occurrence had been scheduled up front.
+
+    Attributes:
+        simulator: The `CronSimulator` running the series
+        priority: Priority of every `Event` in the series
+        callback: Function to call at each occurrence
+        args: Positional arguments to pass to `callback`
+        kwargs: Keyword arguments to pass to `callback`
+        end: Timestamp after which there are no more occurrences
+        event: The `Event` for the next occurrence
+        active: True while the next occurrence is waiting in the queue
+        paused: True while the series is paused
+        finished: True once the series has been cancelled or has passed `end`
+    """
+
+    def __init__(self, simulator, cron_iterator, location, end, priority,
+                 callback, args, kwargs):
+        """Initialize the CronSeries object."""
+        self.simulator = simulator
+        self.priority = priority
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.end = end
+        self.active = False
+        self.paused = True
+        self.finished = False
+        self._pending = False
+        self._cron_iterator = cron_iterator
+        self._location = location
+        self._zone = time_zones.get_zone(location)
+        self.event = Event(None, priority, self._fire, (), None,
+                           next(simulator._sequence))
+
+    @property
+    def next_time(self):
+        """The timestamp of the next occurrence, or None if there isn't one."""
+        if self._pending:
+            return self.event.time
+        return None
+
+    @property
+    def event_callback(self):
+        """The callback run when `event` fires."""
+        return self.callback
+
+    def _next_timestamp(self):
+        next_event = self._cron_iterator.get_next(datetime)
+        next_event = self._zone.normalize(next_event)
+        return self.simulator.localized_timestamp(next_event.year,
+                                                  next_event.month,
+                                                  next_event.day,
+                                                  next_event.hour,
+                                                  next_event.minute,
+                                                  next_event.second,
+                                                  self._location)
+
+    def _arm(self, timestamp):
+        # Put the series `Event` back in the queue for `timestamp`
+        if timestamp > self.end:
+            self.finished = True
+            self._pending = False
+            return
+        event = self.event
+        event.time = timestamp
+        event.valid = True
+        event.simulator = self.simulator
+        self.simulator.queue.push(event)
+        self._pending = True
+        self.active = True
+
+    def _fire(self, env):
+        self.active = False
+        self._pending = False
+        if self.kwargs:
+            self.callback(env, *self.args, **self.kwargs)
+        else:
+            self.callback(env, *self.args)
+        if not (self.paused or self.finished):
+            self._arm(self._next_timestamp())
+
+    def cancel(self):
+        """Stop the series permanently."""
+        self.pause()
+        self.finished = True
+        self._pending = False
+
+    def pause(self):
+        """Stop the series until `resume` is called."""
+        self.paused = True
+        if self.active:
+            self.active = False
+            self.simulator.cancel(self.event)
+
+    def resume(self):
+        """Start or restart the series.
+
+        Occurrences that fell while the series was paused are skipped.
+        """
+        if not self.paused or self.finished:
+            return
+        self.paused = False
+        now = self.simulator.time
+        if self._pending and self.event.time >= now:
+            timestamp = self.event.time
+        else:
+            timestamp = self._next_timestamp()
+            while timestamp < now:
+                timestamp = self._next_timestamp()
+        if self.event.time is not None:
+            # The cancelled entry may still be in the queue, so the event
+            # needs a sequence that the entry doesn't have
+            self.event.sequence = next(self.simulator._sequence)
+        self._arm(timestamp)
+
+
+def test():
+    """ Run a suite of test functions """
+
+    def log_time(env, name):
+        env.log.append((env.timestamp_to_datetime(env.time).hour, name))
+
+    # Only the next occurrence of each series is held in the queue, and
+    # nothing after the end of a series is run
+    s = CronSimulator((2017, 1, 1, 0, 0, 0), (2017, 1, 3, 0, 0, 0),
+                      'Australia/Brisbane', log=[])
+    hourly = s.cron_schedule("0 * * * *", None, None, 1, log_time, 'hourly')
+    s.cron_schedule("30 9 * * *", None, (2017, 1, 1, 12, 0, 0), 1, log_time,
+                    'daily')
+    assert len(s.queue) == 2
+    s.run()
+    assert s.log.count((9, 'daily')) == 1
+    assert len(s.log) == 2 * 24 + 1
+    assert hourly.finished and hourly.next_time is None
+
+    # A paused series skips the occurrences it misses and can be cancelled
+    def pause(env, series):
+        series.pause()
+
+    def resume(env, series):
+        series.resume()
+
+    def cancel(env, series):
+        series.cancel()
+
+    s = CronSimulator((2017, 1, 1, 0, 0, 0), (2017, 1, 2, 0, 0, 0),
+                      'Australia/Brisbane', log=[])
+    hourly = s.cron_schedule("0 * * * *", None, None, 1, log_time, 'hourly')
+    s.schedule((2017, 1, 1, 2, 30, 0), 0, pause, hourly)
+    s.schedule((2017, 1, 1, 5, 30, 0), 0, resume, hourly)
+    s.schedule((2017, 1, 1, 8, 30, 0), 0, cancel, hourly)
+    s.run()
+    print(s.log)
+    assert [hour for hour, _ in s.log] == [1, 2, 6, 7, 8]
+    assert len(s.queue) == 0
+
+
+if __name__ == '__main__':
+    test()
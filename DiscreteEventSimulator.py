@@ -11,38 +11,74 @@ run a certain time and with a certain priority. Once started, the next event on
 the heap is continually called until there are none left or a time limit is
 exceeded.
 """
-import heapq
+import gc
+import itertools
+
+from event_queue import HeapQueue
+from process import Process
 
 
 class Event(object):
     """The `Event` class is used to hold information about schedulable events.
 
+    `Event` objects use `__slots__` so they carry no per-instance `__dict__`,
+    and an empty `kwargs` dictionary is stored as None.  The queue doesn't hold
+    the `Event` itself but a `(time, priority, sequence, event)` tuple, so
+    ordering is done by native tuple comparison and `sequence` gives a stable
+    first in, first out order for events with equal time and priority.  The
+    tuple trades memory for speed: a pending event with its queue entry takes
+    slightly more memory than an `Event` with a `__dict__` compared directly,
+    see `benchmark.compare_event_representation`.
+
     Attributes:
         time: The time that the `Event` will be called
         priority: Used to indicate the importance of the `Event`
+        sequence: Insertion order of the `Event`, used to break ties between
+            events with the same `time` and `priority`
         valid: Determines if the callback function in called when the
                `Event` object is called.  Set to true when instantiated.
         callback: Function to run when the `Event` object is called
         args: Positional arguments to pass to the `callback` attribute
-        kwargs: Keyword arguments to pass to the `callback` attribute
+        kwargs: Keyword arguments to pass to the `callback` attribute, or None
+            if there are none
+        simulator: The `Simulator` whose queue holds the `Event`, or None if
+            it isn't waiting in a queue
+        index: Position of the `Event` in an addressable queue such as
+            `event_queue.IndexedHeapQueue`, otherwise None
     """
 
-    def __init__(self, time, priority, callback, args, kwargs):
+    __slots__ = ('time', 'priority', 'sequence', 'valid', 'callback', 'args',
+                 'kwargs', 'simulator', 'index')
+
+    def __init__(self, time, priority, callback, args, kwargs, sequence=0):
         """Initialize the Event object."""
         self.time = time
         self.priority = priority
+        self.sequence = sequence
         self.valid = True
         self.callback = callback
         self.args = args
-        self.kwargs = kwargs
+        self.kwargs = kwargs or None
+        self.simulator = None
+        self.index = None
+
+    @property
+    def sort_key(self):
+        """tuple: The `(time, priority, sequence)` key the queue orders by."""
+        return self.time, self.priority, self.sequence
 
     def invalidate(self):
         """Invalidate the Event.
 
         Set the `valid` attribute to False.  This prevents the `Event` object
-        from being called
+        from being called.  If the `Event` is waiting in a `Simulator` queue,
+        the queue is told so that it can drop the `Event` or keep count of it
+        as a tombstone.
         """
-        self.valid = False
+        if self.valid:
+            self.valid = False
+            if self.simulator is not None:
+                self.simulator._discard(self)
 
     def reschedule(self, time):
         """Return a rescheduled event.
@@ -58,7 +94,8 @@ class Event(object):
             Event: new rescheduled event
         """
         self.invalidate()
-        return Event(time, self.priority, self.callback, self.args, self.kwargs)
+        return Event(time, self.priority, self.callback, self.args,
+                     self.kwargs, self.sequence)
 
     def __call__(self, env):
         """Define callable behaviour of the `Event` Object.
@@ -71,13 +108,17 @@ class Event(object):
             env (Simulator):
         """
         if self.valid:
-            self.callback(env, *self.args, **self.kwargs)
+            if self.kwargs:
+                self.callback(env, *self.args, **self.kwargs)
+            else:
+                self.callback(env, *self.args)
 
     def __lt__(self, other):
         """Less than comparison for `Event` objects.
 
         Less than comparison of `Event` objects by first comparing the time, if
-        `time` attributes are equal then `priority` attributes are compared.
+        `time` attributes are equal then `priority` attributes are compared,
+        and finally the insertion `sequence`.
 
         Args:
             other (Event): Other `Event` object to compare to
@@ -85,7 +126,81 @@ class Event(object):
         Returns:
             bool: The return value.  True if `self` is less than `other`
         """
-        return [self.time, self.priority] < [other.time, other.priority]
+        return ((self.time, self.priority, self.sequence) <
+                (other.time, other.priority, other.sequence))
+
+    def __repr__(self):
+        """Return a debugging representation of the `Event`."""
+        return 'Event(time={!r}, priority={!r}, callback={!r})'.format(
+            self.time, self.priority, self.callback)
+
+
+class EventSource(object):
+    """Handle for a stream of events pulled lazily from an iterator.
+
+    The source reuses a single `Event`, which holds the next item of the
+    iterator.  When it fires, the item's callback is run and then the
+    following item is pulled and put back in the queue, so only one entry per
+    source is ever waiting in the queue.  Every item keeps the insertion
+    sequence the source was given when it was added, so events run in the
+    same order as if every item had been scheduled up front.
+
+    Attributes:
+        simulator: The `Simulator` running the source
+        event: The `Event` holding the next item
+        finished: True once the iterator is exhausted or the source cancelled
+    """
+
+    def __init__(self, simulator, iterator):
+        """Initialize the EventSource object."""
+        self.simulator = simulator
+        self.finished = False
+        self._iterator = iterator
+        self._callback = None
+        self._args = ()
+        self.event = Event(None, None, self._fire, (), None,
+                           next(simulator._sequence))
+
+    @property
+    def next_time(self):
+        """The time of the next item, or None if there isn't one."""
+        if self.finished:
+            return None
+        return self.event.time
+
+    @property
+    def event_callback(self):
+        """The callback of the next item, run when `event` fires."""
+        return self._callback
+
+    def _pull(self):
+        # Put the next item of the iterator in the queue
+        item = next(self._iterator, None)
+        if item is None:
+            self.finished = True
+            return
+        time, priority, self._callback = item[:3]
+        self._args = item[3] if len(item) > 3 else ()
+        if time < self.simulator.time:
+            raise ValueError("Event sources must yield events in time order")
+        event = self.event
+        event.time = time
+        event.priority = priority
+        event.valid = True
+        event.simulator = self.simulator
+        self.simulator.queue.push(event)
+
+    def _fire(self, env):
+        self._callback(env, *self._args)
+        if not self.finished:
+            self._pull()
+
+    def cancel(self):
+        """Stop the source.  No more items are pulled from the iterator."""
+        if not self.finished:
+            self.finished = True
+            if self.event.simulator is not None:
+                self.simulator.cancel(self.event)
 
 
 class Simulator(object):
@@ -110,6 +225,34 @@ class Simulator(object):
     Attributes:
         start_time: The time that the simulation will begin
         end_time: The time that the simulation will end
+        queue: Class of the queue backend that holds pending `Event` objects,
+            `event_queue.HeapQueue` by default.  `event_queue.CalendarQueue`
+            only pays off for models that keep about 100,000 or more events
+            with evenly spread numeric times pending while each event
+            schedules the next, where it ran 10% to 30% faster in the hold
+            benchmark.  With fewer pending events, or when events are
+            scheduled up front and then run, it is slower than the heap, by
+            about 2x in the `schedule_run` workloads.
+            `event_queue.IndexedHeapQueue` reschedules and cancels events in
+            place without leaving tombstones.
+
+            Example:
+
+            simulation = Simulator(0, 1000, queue=CalendarQueue)
+
+        compaction_threshold: Cancelled and rescheduled events leave
+            tombstones in queues that delete lazily.  Once tombstones make up
+            more than this fraction of the queue, they are removed and the
+            queue rebuilt.
+        compactions: The number of times the queue has been compacted
+        instrument: An `instrumentation.Instrument` that profiles `run`, or
+            None to run without instrumentation
+        recorders: `recorder.Recorder` objects holding samples of the state
+            of the simulation, keyed by name.  See `record`.
+        seed: Root seed of the simulation's random number streams, an int,
+            a `numpy.random.SeedSequence`, or None for fresh entropy.  See
+            `stream`.
+
         kwargs: Keyword arguments that will be added as dynamic attributes of
             the `Simulator` object. For example, they can be used to hold a data
             structure or connection to a database that holds information about
@@ -126,21 +269,35 @@ class Simulator(object):
         @DynamicAttrs
     """
 
-    def __init__(self, start_time, end_time, **kwargs):
+    # The queue isn't compacted while it holds fewer entries than this
+    MINIMUM_COMPACTION_SIZE = 64
+
+    def __init__(self, start_time, end_time, queue=HeapQueue,
+                 compaction_threshold=0.5, seed=None, **kwargs):
         """Initialize the Simulator object."""
         assert end_time > start_time
-        self.queue = []
+        assert 0 < compaction_threshold <= 1
+        self.queue = queue()
         self.time = start_time
         self.end_time = end_time
         self.current_event = None
+        self.compaction_threshold = compaction_threshold
+        self.compactions = 0
+        self.instrument = None
+        self.recorders = {}
+        self.seed = seed
+        self._streams = None
+        self._sequence = itertools.count()
         for key, values in kwargs.items():
             setattr(self, key, values)
 
     def schedule(self, time, priority, callback, *args, **kwargs):
         """Schedule an event to be executed at a later point in time.
 
-        Creates an `Event` object and places it in a heapq data structure.  The
-        next `Event` to call will always be at the top of the ordered heap.
+        Creates an `Event` object and places it in the event queue.  The next
+        `Event` to call will always be at the front of the queue.
+        Events with equal `time` and `priority` are run in the order they were
+        scheduled.
         ``callback`` is a callable which executes the event-specific behavior;
         the optional ``args`` and ``kwargs`` arguments will be passed to the
         event callback at invocation time.
@@ -157,14 +314,151 @@ class Simulator(object):
         Returns: an `Event` object which can be used to reschedule the event.
         """
         assert time >= self.time
-        event = Event(time, priority, callback, args, kwargs)
+        sequence = next(self._sequence)
+        event = Event(time, priority, callback, args, kwargs, sequence)
+        event.simulator = self
         try:
-            heapq.heappush(self.queue, event)
+            self.queue.push(event)
         except TypeError:
             print(event)
             raise
         return event
 
+    def schedule_many(self, times, priorities, callback, args_columns=(),
+                      args=()):
+        """Schedule many events for the same callback in one call.
+
+        Creates an `Event` for every element of `times` and merges them all
+        into the event queue at once, which lets the queue rebuild itself in
+        a single pass instead of pushing each event, with the cyclic garbage
+        collector paused while the batch is built.  Events with equal time
+        and priority are run in the order they appear in `times`.
+
+        Example:
+
+        simulation.schedule_many(numpy.array([5.0, 1.0, 3.0]), 1, customer,
+                                 args_columns=[[10, 20, 30]])
+
+        is equivalent to
+
+        simulation.schedule(5.0, 1, customer, 10)
+        simulation.schedule(1.0, 1, customer, 20)
+        simulation.schedule(3.0, 1, customer, 30)
+
+        Args:
+            times: Sequence or NumPy array of times to execute `callback`
+            priorities: A single priority for every event, or a list, tuple or
+                NumPy array with a priority for each event
+            callback: Function to call at each of the `times`
+            args_columns: Sequence of columns of positional arguments.  Each
+                column has one value per event, and the n-th values of all the
+                columns are passed to the n-th call of `callback`.
+            args: Positional arguments passed to every call of `callback`,
+                before the arguments from `args_columns`
+
+        Returns: a list of the scheduled `Event` objects.
+
+        Raises:
+            ValueError: if the priorities or argument columns don't have the
+                same length as `times`
+        """
+        times = _column(times)
+        count = len(times)
+        if not count:
+            return []
+        assert min(times) >= self.time
+
+        if isinstance(priorities, (list, tuple)) or \
+                getattr(priorities, 'ndim', 0):
+            priorities = _column(priorities)
+            if len(priorities) != count:
+                raise ValueError("times and priorities must be the same "
+                                 "length")
+        else:
+            priorities = itertools.repeat(priorities)
+
+        columns = [_column(column) for column in args_columns]
+        if any(len(column) != count for column in columns):
+            raise ValueError("times and args_columns must be the same length")
+        shared = tuple(args)
+        if columns:
+            arguments = (shared + row for row in zip(*columns))
+        else:
+            arguments = itertools.repeat(shared)
+
+        # Every object created here stays alive, so the cyclic garbage
+        # collector would only repeatedly scan the growing batch for nothing
+        collector_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            events = []
+            append = events.append
+            for time, priority, args, sequence in zip(times,
+                                                      priorities,
+                                                      arguments,
+                                                      self._sequence):
+                event = Event(time, priority, callback, args, None, sequence)
+                event.simulator = self
+                append(event)
+            self.queue.extend(events)
+        finally:
+            if collector_enabled:
+                gc.enable()
+        return events
+
+    def add_source(self, source):
+        """Schedule the events of an iterator, pulling them one at a time.
+
+        `source` is an iterable, usually a generator, yielding
+        `(time, priority, callback, args)` tuples in time order; `args` may be
+        left out.  Only the next item of each source waits in the queue, and
+        the item after it is pulled once it has run, so models that run for
+        years don't need to schedule their whole future up front.
+
+        Example:
+
+        def daily_orders(database):
+            for day in itertools.count():
+                yield (3600 + day * 86400, 0, order, (database,))
+
+        simulation.add_source(daily_orders(database))
+
+        Args:
+            source: Iterable of `(time, priority, callback, args)` tuples
+
+        Returns: an `EventSource` which can be used to cancel the source.
+
+        Raises:
+            ValueError: if the source yields a time before the current time
+        """
+        event_source = EventSource(self, iter(source))
+        event_source._pull()
+        return event_source
+
+    def process(self, generator, delay=0, priority=1):
+        """Start a process written as a generator.
+
+        The generator yields a delay to wait for that much time, or a
+        `process.Signal` or `process.Process` to wait until it is triggered.
+        See `process` for details.
+
+        Example:
+
+        def customer(env):
+            yield 60
+            env.served += 1
+
+        simulation.process(customer(simulation), delay=10)
+
+        Args:
+            generator: The generator to run
+            delay: Time from now to the first step of the generator
+            priority: Priority of the events that resume the process
+
+        Returns: a `process.Process`, which can be waited for or cancelled.
+        """
+        return Process(self, generator, delay, priority)
+
     def schedule_relative(self,
                           offset_time,
                           priority,
@@ -196,17 +490,97 @@ class Simulator(object):
         """
         Reschedule an `Event` to take place at a different point in time.
 
+        The `Event` is moved in place, so the handle returned by `schedule`
+        stays valid and no new `Event` is created.  It is placed after any
+        other events already scheduled for the same time and priority.  An
+        `Event` that has already run or been cancelled is scheduled again.
+
         Args:
             old_event (Event): The event to be rescheduled
             time: Reschedule the old event at the new new `time` attribute
 
         Returns:
-            Event: A new rescheduled event
+            Event: The rescheduled event, which is `old_event` itself
         """
         assert time >= self.time
-        new_event = old_event.reschedule(time)
-        heapq.heappush(self.queue, new_event)
-        return new_event
+        return self._requeue(old_event, time, old_event.priority)
+
+    def change_priority(self, event, priority):
+        """Change the priority of a scheduled `Event` in place.
+
+        Args:
+            event (Event): The event to change
+            priority: The new priority of the event
+
+        Returns:
+            Event: The changed event, which is `event` itself
+        """
+        return self._requeue(event, event.time, priority)
+
+    def _requeue(self, event, time, priority):
+        queued = event.valid and event.simulator is self
+        event.time = time
+        event.priority = priority
+        event.sequence = next(self._sequence)
+        if queued:
+            self.queue.update(event)
+            self._check_compaction()
+        else:
+            event.valid = True
+            event.simulator = self
+            self.queue.push(event)
+        return event
+
+    def cancel(self, event):
+        """Cancel a scheduled `Event` so that it is never called.
+
+        The `Event` is invalidated.  Queues that delete lazily leave it in
+        place as a tombstone, which is O(1), and tombstones are removed in
+        bulk once they pass the `compaction_threshold` fraction of the queue.
+
+        Args:
+            event (Event): The event to cancel
+        """
+        event.invalidate()
+
+    def _discard(self, event):
+        # Called by an `Event` in the queue when it is invalidated
+        event.simulator = None
+        self.queue.discard(event)
+        self._check_compaction()
+
+    def _check_compaction(self):
+        dead = self.queue.dead
+        if dead:
+            size = len(self.queue) + dead
+            if (size >= self.MINIMUM_COMPACTION_SIZE and
+                    dead > self.compaction_threshold * size):
+                self.compact()
+
+    @property
+    def tombstones(self):
+        """int: The number of dead entries still in the queue."""
+        return self.queue.dead
+
+    def compact(self):
+        """Remove all tombstones from the queue and rebuild it."""
+        self.queue.compact()
+        self.compactions += 1
+
+    def queue_statistics(self):
+        """Return the number of live and dead entries in the queue.
+
+        Returns:
+            dict: `size` is the number of entries in the queue, `live` the
+            number of valid events, `dead` the number of tombstones and
+            `compactions` the number of times the queue has been compacted.
+        """
+        live = len(self.queue)
+        dead = self.queue.dead
+        return {'size': live + dead,
+                'live': live,
+                'dead': dead,
+                'compactions': self.compactions}
 
     def extend_end_time(self, new_end_time):
         """Extend the tim that the simulation is allowed to run.
@@ -227,7 +601,71 @@ class Simulator(object):
         """
         self.end_time = self.time
 
-    def run(self):
+    def recorder(self, name, **kwargs):
+        """Return the `recorder.Recorder` called `name`, creating it if needed.
+
+        Args:
+            name: Name of the recorder
+            **kwargs: Options passed to `recorder.Recorder` when it is created,
+                such as a `path` to memory-map or a SQLite `database` to copy
+                the samples to
+        """
+        try:
+            return self.recorders[name]
+        except KeyError:
+            # Imported here so that models that don't record don't need NumPy
+            from recorder import Recorder
+            recorder = self.recorders[name] = Recorder(**kwargs)
+            return recorder
+
+    def stream(self, name):
+        """Return the random number stream of the component called `name`.
+
+        Each component gets an independent `streams.Stream`, derived from
+        `seed` and the name, so replications are reproduced from their seed.
+
+        Example:
+
+        def customer(env):
+            env.schedule(env.time + env.stream('customers').exponential(1800),
+                         1, customer)
+        """
+        if self._streams is None:
+            # Imported here so that models that don't draw don't need NumPy
+            from streams import RandomStreams
+            self._streams = RandomStreams(self.seed)
+        return self._streams.stream(name)
+
+    def record(self, name, value):
+        """Record `value` at the current time in the recorder called `name`.
+
+        Example:
+
+        def customer(env):
+            env.stock -= 1
+            env.record('stock', env.stock)
+
+        ...
+        simulation.run()
+        resampled = zero_order_resample(simulation.recorder('stock').data(),
+                                        sample_points)
+        """
+        try:
+            recorder = self.recorders[name]
+        except KeyError:
+            recorder = self.recorder(name)
+        recorder.append(self.time, value)
+
+    def peek(self):
+        """Return the next `Event` to be run without removing it.
+
+        Returns:
+            Event: The next valid `Event` in the queue, or None if the queue is
+            empty
+        """
+        return self.queue.peek()
+
+    def run(self, until=None, max_events=None):
         """Start running the simulation.
 
         Run continually takes the next `Event` object from the heap and executes
@@ -236,11 +674,285 @@ class Simulator(object):
         `Simulation` object is passed to the next `Event` when called.  This
         allows scheduled user defined functions to be aware of the simulation
         environment.
+
+        The next `Event` is only removed from the queue once it is known that
+        it will be run, so a run that stops at `until`, `max_events` or
+        `end_time` can be resumed by calling `run` again without losing any
+        events.
+
+        Example:
+
+        while simulation.peek() is not None:
+            simulation.run(until=simulation.time + 86400)
+            report_progress(simulation)
+
+        Args:
+            until: Stop before running any `Event` later than this time.  If
+                there are no more events to run before `until`, the simulation
+                time is advanced to `until`, limited to `end_time`.
+            max_events: Stop after running this many events
+
+        Returns:
+            int: The number of events that were run
         """
-        while self.queue:
-            event = heapq.heappop(self.queue)
-            self.current_event = event
-            if self.end_time < event.time:
+        if self.instrument is not None:
+            return self.instrument.run(self, until, max_events)
+
+        queue = self.queue
+        peek = queue.peek
+        pop = queue.pop
+        count = 0
+        while max_events is None or count < max_events:
+            event = peek()
+            if (event is None or self.end_time < event.time or
+                    (until is not None and until < event.time)):
+                if until is not None:
+                    horizon = min(until, self.end_time)
+                    if self.time < horizon:
+                        self.time = horizon
                 break
+            pop()
+            event.simulator = None
+            self.current_event = event
             self.time = event.time
             event(self)
+            count += 1
+        return count
+
+    def step(self):
+        """Run the next `Event` if it is due before `end_time`.
+
+        Returns:
+            Event: The `Event` that was run, or None if there wasn't one
+        """
+        if self.run(max_events=1):
+            return self.current_event
+        return None
+
+
+def _column(values):
+    """Return `values` as a list, converting NumPy arrays to Python scalars."""
+    if hasattr(values, 'tolist'):
+        return values.tolist()
+    return list(values)
+
+
+def test():
+    """ Run a suite of test functions """
+
+    # Events with the same time and priority run in the order scheduled
+    log = []
+
+    def actor(env, name):
+        log.append((env.time, name))
+
+    simulation = Simulator(0, 1000)
+    for name in 'abcde':
+        simulation.schedule(10, 1, actor, name)
+    simulation.schedule(10, 0, actor, 'first')
+    simulation.schedule(5, 9, actor, 'earliest')
+    simulation.run()
+
+    print(log)
+    assert log == [(5, 'earliest'), (10, 'first'), (10, 'a'), (10, 'b'),
+                   (10, 'c'), (10, 'd'), (10, 'e')]
+
+    # Every queue backend runs the same events in exactly the same order,
+    # including events scheduled, rescheduled and cancelled while the
+    # simulation is running
+    import random
+    from event_queue import CalendarQueue, IndexedHeapQueue
+    backends = (HeapQueue, CalendarQueue, IndexedHeapQueue)
+
+    def recorder(env, name):
+        env.log.append((env.time, name))
+        generator = env.generator
+        if name > 0 and name % 7 == 0:
+            env.schedule(env.time + generator.uniform(0, 50),
+                         generator.randint(0, 2), recorder, -name)
+        if name % 11 == 0:
+            env.schedule(env.time, 0, recorder, name + 0.5)
+        if name % 5 == 0:
+            event = env.handles[generator.randrange(len(env.handles))]
+            env.reschedule(event, env.time + generator.uniform(0, 20))
+        if name % 13 == 0:
+            env.cancel(env.handles[generator.randrange(len(env.handles))])
+
+    logs = []
+    for backend in backends:
+        generator = random.Random(1)
+        simulation = Simulator(0, 10000, queue=backend, log=[],
+                               generator=generator)
+        simulation.handles = [
+            simulation.schedule(generator.randint(0, 1000),
+                                generator.randint(0, 2), recorder, name)
+            for name in range(2000)]
+        simulation.run()
+        logs.append(simulation.log)
+
+    print([len(log) for log in logs])
+    assert all(log == logs[0] for log in logs)
+
+    # Cancelled events never run.  Lazy queues count them as tombstones and
+    # are compacted once they pass the compaction threshold, the indexed
+    # queue removes them straight away
+    for backend in backends:
+        log = []
+        simulation = Simulator(0, 10000, queue=backend)
+        events = [simulation.schedule(name, 1, actor, name)
+                  for name in range(1000)]
+        for event in events[:600]:
+            simulation.cancel(event)
+        statistics = simulation.queue_statistics()
+        print(statistics)
+        assert statistics['live'] == 400
+        assert statistics['size'] in (400, 499)
+        simulation.run()
+        assert log == [(name, name) for name in range(600, 1000)]
+        assert simulation.queue_statistics()['dead'] == 0
+
+    # A rescheduled event keeps its handle
+    for backend in backends:
+        log = []
+        simulation = Simulator(0, 10000, queue=backend)
+        event = simulation.schedule(10, 1, actor, 'moved')
+        simulation.schedule(20, 1, actor, 'fixed')
+        assert simulation.reschedule(event, 30) is event
+        assert simulation.change_priority(event, 0) is event
+        assert simulation.reschedule(event, 20) is event
+        simulation.run()
+        assert log == [(20, 'moved'), (20, 'fixed')]
+
+    # Scheduling in bulk runs events in the same order as one at a time
+    for backend in backends:
+        generator = random.Random(2)
+        times = [generator.randint(0, 100) for _ in range(500)]
+        priorities = [generator.randint(0, 2) for _ in range(500)]
+        names = list(range(500))
+
+        log = []
+        simulation = Simulator(0, 10000, queue=backend)
+        simulation.schedule(50, 1, actor, 'before')
+        for time, priority, name in zip(times, priorities, names):
+            simulation.schedule(time, priority, actor, name)
+        simulation.run()
+        expected = log
+
+        log = []
+        simulation = Simulator(0, 10000, queue=backend)
+        simulation.schedule(50, 1, actor, 'before')
+        simulation.schedule_many(times, priorities, actor, [names])
+        simulation.run()
+        assert log == expected
+
+    # Small batches added to a large indexed queue are sifted in one at a
+    # time, and keep every event's index
+    log = []
+    simulation = Simulator(0, 10 ** 6, queue=IndexedHeapQueue)
+    generator = random.Random(3)
+    simulation.schedule_many(
+        [generator.randint(0, 10 ** 5) for _ in range(100000)], 1, actor,
+        args=('bulk',))
+    for name in range(200):
+        simulation.schedule_many([generator.randint(0, 10 ** 5)], 0, actor,
+                                 args=(name,))
+    heap = simulation.queue._heap
+    assert all(entry[3].index == index for index, entry in enumerate(heap))
+    simulation.run()
+    assert len(log) == 100200
+    assert [time for time, _ in log] == sorted(time for time, _ in log)
+
+    # Arguments shared by every event come before the column arguments
+    log = []
+    simulation = Simulator(0, 10)
+    simulation.schedule_many([2, 1], 1, lambda env, *args: log.append(args),
+                             args_columns=[['a', 'b']], args=('shared',))
+    simulation.schedule_many([3], 1, actor, args=('c',))
+    simulation.run()
+    assert log == [('shared', 'b'), ('shared', 'a'), (3, 'c')]
+
+    # A bounded run can be resumed without losing events
+    log = []
+    simulation = Simulator(0, 100)
+    for time in range(0, 100, 10):
+        simulation.schedule(time, 1, actor, time)
+    assert simulation.run(until=25) == 3
+    assert simulation.time == 25
+    assert simulation.run(max_events=2) == 2
+    assert simulation.step() is not None
+    assert simulation.time == 50
+    simulation.stop()
+    assert simulation.run() == 0
+    simulation.extend_end_time(1000)
+    assert simulation.run() == 4
+    assert log == [(time, time) for time in range(0, 100, 10)]
+    assert simulation.step() is None
+
+    # Event sources run in the same order as scheduling every event up front,
+    # with only one entry per source in the queue
+    def items(name, step):
+        for time in range(0, 1000, step):
+            yield (time, time % 2, actor, ((name, time),))
+
+    for backend in (HeapQueue, CalendarQueue, IndexedHeapQueue):
+        log = []
+        simulation = Simulator(0, 500, queue=backend)
+        simulation.schedule(30, 1, actor, 'before')
+        for name, step in (('a', 3), ('b', 5)):
+            for item in items(name, step):
+                simulation.schedule(item[0], item[1], item[2], *item[3])
+        simulation.schedule(30, 1, actor, 'after')
+        simulation.run()
+        expected = log
+
+        log = []
+        queue_sizes = []
+        simulation = Simulator(0, 500, queue=backend)
+        simulation.schedule(30, 1, actor, 'before')
+        simulation.add_source(items('a', 3))
+        source = simulation.add_source(items('b', 5))
+        simulation.schedule(30, 1, actor, 'after')
+        simulation.add_source(iter([(10, 0, lambda env: queue_sizes.append(
+            len(env.queue)))]))
+        simulation.run()
+        assert log == expected
+        assert queue_sizes == [4]
+        assert source.next_time == 505
+
+    # A source can be cancelled and must yield times in order
+    log = []
+    simulation = Simulator(0, 100)
+    source = simulation.add_source(items('a', 10))
+    simulation.schedule(25, 0, lambda env: source.cancel())
+    simulation.run()
+    assert log == [(0, ('a', 0)), (10, ('a', 10)), (20, ('a', 20))]
+    assert source.finished and source.next_time is None
+
+    simulation = Simulator(0, 100)
+    simulation.add_source(iter([(5, 0, actor, (1,)), (4, 0, actor, (2,))]))
+    try:
+        simulation.run()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Out of order source items must be rejected")
+
+    # Simulations with the same seed draw the same numbers per component
+    arrivals = []
+
+    def arrival(env):
+        arrivals.append(env.time)
+        env.schedule(env.time + env.stream('arrivals').exponential(5), 1,
+                     arrival)
+
+    for _ in range(2):
+        simulation = Simulator(0, 100, seed=11)
+        simulation.stream('other').uniform()
+        simulation.schedule(0, 1, arrival)
+        simulation.run()
+    assert len(arrivals) > 20
+    assert arrivals[:len(arrivals) // 2] == arrivals[len(arrivals) // 2:]
+
+
+if __name__ == '__main__':
+    test()
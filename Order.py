@@ -4,8 +4,10 @@ import csv
 import sqlite3
 import datetime
 
-import simpy
-from simpy.util import start_delayed
+import numpy
+
+from DiscreteEventSimulator import Simulator
+from perishables import BatchLedger
 
 
 def init_order_table(db):
@@ -34,6 +36,29 @@ def insert_order(order_ts, display_ts, expiry_ts, db):
     db.commit()
 
 
+# Insert many orders with a single statement and commit
+
+def insert_orders(orders, db):
+    for order_ts, display_ts, expiry_ts in orders:
+        if not (0 <= order_ts <= display_ts <= expiry_ts):
+            raise Exception("Order dates are not in the correct sequence")
+
+    cur = db.cursor()
+    cur.executemany("INSERT INTO ORDER_SCHEDULE\
+                    VALUES(null, ?, ?, ?)", orders)
+    db.commit()
+
+
+# Load every order into a perishables.BatchLedger in one query
+
+def load_order_ledger(db, ledger, quantity=1):
+    cur = db.cursor()
+    cur.execute("SELECT ORDER_TIME, DISPLAY_TIME, PRODUCT_EXPIRY\
+                FROM ORDER_SCHEDULE")
+    orders = numpy.array(cur.fetchall(), dtype=float).reshape(-1, 3)
+    ledger.add_many(orders[:, 0], orders[:, 1], orders[:, 2], quantity)
+
+
 # Calculate how many seconds are in an
 # interval specified in days, hours and minutes
 
@@ -89,12 +114,11 @@ def generate_recurring_weekly_order(order,
                                     numberOfOrders,
                                     db):
     try:
+        orders = []
         for orderNumber in range(0, numberOfOrders):
             offset = recurrencePeriod * orderNumber
-            insert_order(order + offset,
-                         display + offset,
-                         expiry + offset,
-                         db)
+            orders.append((order + offset, display + offset, expiry + offset))
+        insert_orders(orders, db)
     except TypeError:
         print("Invalid parameters to generate order")
         raise
@@ -102,8 +126,8 @@ def generate_recurring_weekly_order(order,
 
 def placeOrder(env, db, stock):
     print("tesdt")
-    print(env.now)
-    yield env.timeout(1)
+    print(env.time)
+    yield 1
 
 
 database = sqlite3.connect(':memory:')
@@ -128,10 +152,13 @@ generate_recurring_weekly_order(timeToSeconds(0,  1, 20,  0),
 print_order_table(database)
 
 
-env = simpy.Environment()
+env = Simulator(0, 200)
+ledger = BatchLedger(env)
+load_order_ledger(database, ledger)
+print(ledger.next_display, ledger.next_transition)
 
-start_delayed(env, placeOrder(env, database, 10), 10)
-start_delayed(env, placeOrder(env, database, 10), 100)
+env.process(placeOrder(env, database, 10), delay=10)
+env.process(placeOrder(env, database, 10), delay=100)
 
 
-env.run(until=200)
+env.run()
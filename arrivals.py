@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+arrivals.py
+
+Generate customer arrival times in bulk from a cumulative sales profile.
+
+A cumulative sales profile, such as the `salesData` week in test.py, gives
+the total sales up to each time.  Customers arrive as the cumulative sales
+pass successive totals, the gap between two totals being what a customer
+spends, so arrivals are dense when the profile is steep and absent while it
+is flat.  Rather than drawing one spend, inverting the profile and scheduling
+an event at a time, the spends are drawn in batches, summed into totals with
+`numpy.cumsum`, and every total is inverted through the profile in one call.
+
+Example
+
+profile = piece_wise.function(salesData, periodic=True)
+times = arrival_times(profile, simulation_period, exponential_spend(200),
+                      numpy.random.default_rng(seed))
+simulator.schedule_many(times, 1, customer, args=(database,))
+
+or, to generate the arrivals as the simulation reaches them
+
+simulator.add_source(arrival_source(profile, simulation_period,
+                                    exponential_spend(200), 1, customer,
+                                    (database,)))
+"""
+
+import numpy
+
+import piece_wise
+
+
+# Smallest number of spends drawn at a time
+BATCH_SIZE = 4096
+
+
+def exponential_spend(mean, whole_dollars=True):
+    """Return a spend distribution with exponentially distributed spends.
+
+    With `whole_dollars` the spends are rounded down to whole dollars, as
+    `int(random.expovariate(1 / mean))` does.
+
+    Returns:
+        function: called as `spend(generator, size)`, returning an array of
+        `size` spends drawn from the `numpy.random.Generator`
+    """
+    def spend(generator, size):
+        spends = generator.exponential(mean, size)
+        if whole_dollars:
+            spends = numpy.floor(spends)
+        return spends
+    return spend
+
+
+def _total_batches(total, spend, generator, batch_size, adaptive):
+    # Yield batches of arrival totals below `total`.  Adaptive batches are
+    # sized to reach `total` at the average spend so far.
+    if generator is None:
+        generator = numpy.random.default_rng()
+
+    if total > 0:
+        yield numpy.zeros(1)
+    reached = 0.0
+    drawn = 0
+    size = batch_size
+    while reached < total:
+        batch = numpy.cumsum(spend(generator, size), dtype=float)
+        batch += reached
+        reached = batch[-1]
+        drawn += size
+        yield batch[:numpy.searchsorted(batch, total, side='left')]
+
+        # Draw about as many spends as the average so far says are left
+        if adaptive and reached > 0:
+            size = max(batch_size,
+                       int(1.05 * (total - reached) * drawn / reached) + 1)
+
+
+def arrival_totals(total, spend, generator=None, batch_size=BATCH_SIZE):
+    """Return the cumulative sales totals at which customers arrive.
+
+    The first customer arrives at a total of zero and each later customer
+    when the sales since the previous one reach that customer's spend.
+
+    Args:
+        total: Customers arrive while the cumulative sales are below this
+        spend: Spend distribution, such as the result of `exponential_spend`
+        generator: `numpy.random.Generator`, a new unseeded one if None
+        batch_size: Smallest number of spends drawn at a time.  After the
+            first batch, enough spends are drawn to reach `total` at the
+            average spend so far.
+
+    Returns:
+        numpy.ndarray: non-decreasing totals, all below `total`
+    """
+    batches = [numpy.zeros(0)]
+    batches.extend(_total_batches(total, spend, generator, batch_size, True))
+    return numpy.concatenate(batches)
+
+
+def _as_profile(profile):
+    if isinstance(profile, piece_wise.function):
+        return profile
+    return piece_wise.function(numpy.asarray(profile), periodic=True)
+
+
+def arrival_times(profile, horizon, spend, generator=None,
+                  batch_size=BATCH_SIZE):
+    """Return the times customers arrive before `horizon`.
+
+    Args:
+        profile: Cumulative sales profile, a `piece_wise.function` or an
+            array of `(time, cumulative sales)` rows.  An array is taken to
+            repeat, as a periodic `piece_wise.function`.
+        horizon: Customers arrive before the cumulative sales reach those at
+            this time
+        spend: Spend distribution, such as the result of `exponential_spend`
+        generator: `numpy.random.Generator`, a new unseeded one if None
+        batch_size: Smallest number of spends drawn at a time
+
+    Returns:
+        numpy.ndarray: non-decreasing arrival times
+    """
+    profile = _as_profile(profile)
+    totals = arrival_totals(profile.interpolate(horizon), spend, generator,
+                            batch_size)
+    return profile.interpolate(totals, invert=True)
+
+
+def arrival_source(profile, horizon, spend, priority, callback, args=(),
+                   generator=None, batch_size=BATCH_SIZE):
+    """Yield customer arrival events for `Simulator.add_source`.
+
+    Arrivals are generated the same way as by `arrival_times`, a batch of
+    `batch_size` at a time as the simulation reaches them, so a long
+    simulation starts without generating every arrival first.
+
+    Args:
+        profile, horizon, spend, generator: As for `arrival_times`
+        priority: Priority of the arrival events
+        callback: Function called at each arrival
+        args: Positional arguments to pass to `callback`
+        batch_size: Number of arrivals generated at a time
+
+    Yields:
+        tuple: `(time, priority, callback, args)` for each arrival
+    """
+    profile = _as_profile(profile)
+    for totals in _total_batches(profile.interpolate(horizon), spend,
+                                 generator, batch_size, False):
+        for time in profile.interpolate(totals, invert=True).tolist():
+            yield (time, priority, callback, args)
+
+
+def test():
+    """ Run a suite of test functions """
+
+    import random
+
+    sales_data = numpy.array([[(0 * 24 + 0) * 3600, 0],
+                              [(0 * 24 + 8) * 3600, 0],
+                              [(0 * 24 + 21) * 3600, 3000],
+                              [(1 * 24 + 8) * 3600, 3000],
+                              [(1 * 24 + 21) * 3600, 6000],
+                              [(2 * 24 + 8) * 3600, 6000],
+                              [(2 * 24 + 21) * 3600, 9000],
+                              [(3 * 24 + 8) * 3600, 9000],
+                              [(3 * 24 + 21) * 3600, 12000],
+                              [(4 * 24 + 8) * 3600, 12000],
+                              [(4 * 24 + 21) * 3600, 15000],
+                              [(5 * 24 + 8) * 3600, 15000],
+                              [(5 * 24 + 17) * 3600, 22500],
+                              [(6 * 24 + 9) * 3600, 22500],
+                              [(6 * 24 + 18) * 3600, 30000],
+                              [(6 * 24 + 24) * 3600, 30000],
+                              ])
+    seconds_per_week = 7 * 86400
+    weeks = 100
+    profile = piece_wise.function(sales_data, periodic=True)
+
+    # The bulk totals follow the same spends as a loop drawing one at a time
+    totals = arrival_totals(5000, lambda generator, size: numpy.full(size, 7),
+                            batch_size=100)
+    assert totals.tolist() == list(range(0, 5000, 7))
+
+    times = arrival_times(sales_data, weeks * seconds_per_week,
+                          exponential_spend(200),
+                          numpy.random.default_rng(0))
+    assert numpy.all(numpy.diff(times) >= 0)
+    assert times[0] == 0 and times[-1] < weeks * seconds_per_week
+
+    # The loop test.py used to generate arrivals with
+    generator = random.Random(0)
+    dollars = 0
+    loop_times = []
+    while (dollars < weeks * 30000):
+        loop_times.append(profile.interpolate(dollars, invert=True))
+        dollars += int(generator.expovariate(1 / 200))
+
+    # Both give the same number of arrivals, at the same times of the week,
+    # within sampling error
+    print(len(times), len(loop_times))
+    assert abs(len(times) - len(loop_times)) < 4 * numpy.sqrt(len(times))
+    bins = numpy.arange(0, seconds_per_week + 1, 6 * 3600)
+    histogram = numpy.histogram(times % seconds_per_week, bins)[0]
+    loop_histogram = numpy.histogram(
+        numpy.array(loop_times) % seconds_per_week, bins)[0]
+    difference = numpy.abs(histogram - loop_histogram)
+    assert numpy.all(difference <= 5 * numpy.sqrt(histogram + loop_histogram)
+                     + 5)
+
+    # The lazy source yields the same arrivals
+    source = arrival_source(sales_data, weeks * seconds_per_week,
+                            exponential_spend(200), 1, print, ('customer',),
+                            numpy.random.default_rng(0), batch_size=1000)
+    assert [item[0] for item in source] == times.tolist()
+    assert len(arrival_times(sales_data, 0, exponential_spend(200))) == 0
+
+    # No arrivals while the store is closed before 8am on the first day
+    time_of_week = times % seconds_per_week
+    assert not numpy.any((time_of_week > 0) & (time_of_week < 8 * 3600))
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,904 @@
+#!/usr/bin/env python
+
+"""
+benchmark.py
+
+Benchmarks for the discrete event simulator and the analysis functions.
+
+The suite times a fixed, seeded set of workloads, each taking the best of
+several repeats.  Results can be saved as a baseline and later runs compared
+against it, flagging any workload that has slowed down by more than a
+tolerance.
+
+    python benchmark.py                         run the suite
+    python benchmark.py --save                  store the results as baseline
+    python benchmark.py --compare               compare against the baseline
+    python benchmark.py --filter cron           only run matching workloads
+    python benchmark.py --reports               print the comparison reports
+
+Baselines depend on the machine, so save a fresh one before comparing on a
+different machine.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import random
+import time
+import tracemalloc
+
+import numpy
+
+import arrivals
+import partition
+import piece_wise
+import resources
+import retail_analyser
+import step_series
+import streams
+from DiscreteEventSimulator import Simulator
+from event_queue import CalendarQueue, HeapQueue, IndexedHeapQueue
+
+
+class LegacyEvent(object):
+    """Copy of the original `Event` class, kept as a benchmark reference.
+
+    Every instance carries a `__dict__` and comparisons build two lists.
+    """
+
+    def __init__(self, time, priority, callback, args, kwargs):
+        self.time = time
+        self.priority = priority
+        self.valid = True
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, env):
+        if self.valid:
+            self.callback(env, *self.args, **self.kwargs)
+
+    def __lt__(self, other):
+        return [self.time, self.priority] < [other.time, other.priority]
+
+
+class LegacySimulator(object):
+    """Minimal copy of the original heap of `LegacyEvent` objects."""
+
+    def __init__(self, start_time, end_time):
+        self.queue = []
+        self.time = start_time
+        self.end_time = end_time
+
+    def schedule(self, time, priority, callback, *args, **kwargs):
+        event = LegacyEvent(time, priority, callback, args, kwargs)
+        heapq.heappush(self.queue, event)
+        return event
+
+    def run(self):
+        while self.queue:
+            event = heapq.heappop(self.queue)
+            if self.end_time < event.time:
+                break
+            self.time = event.time
+            event(self)
+
+
+def _noop(env):
+    pass
+
+
+def _random_times(number_of_events, seed=0):
+    generator = random.Random(seed)
+    return [generator.uniform(0, number_of_events)
+            for _ in range(number_of_events)]
+
+
+def events_per_second(simulator_class, number_of_events, **kwargs):
+    """Time scheduling then running `number_of_events` random events.
+
+    Returns:
+        float: events scheduled and run per second of wall time
+    """
+    times = _random_times(number_of_events)
+    simulator = simulator_class(0, number_of_events + 1, **kwargs)
+    start = time.perf_counter()
+    for event_time in times:
+        simulator.schedule(event_time, 1, _noop)
+    simulator.run()
+    elapsed = time.perf_counter() - start
+    return number_of_events / elapsed
+
+
+def bytes_per_event(simulator_class, number_of_events):
+    """Measure the memory held by the queue for each pending event.
+
+    Returns:
+        float: bytes allocated per scheduled event
+    """
+    times = _random_times(number_of_events)
+    simulator = simulator_class(0, number_of_events + 1)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for event_time in times:
+        simulator.schedule(event_time, 1, _noop)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / number_of_events
+
+
+def compare_event_representation(number_of_events=200000):
+    """Compare the slotted `Event` against `LegacyEvent`.
+
+    The slotted `Event` is faster to schedule and run, because the heap
+    compares `(time, priority, sequence, event)` tuples natively, but it
+    doesn't save memory.  The heap tuple costs about as much as the
+    `__dict__` and empty `kwargs` dictionary it replaced, and the
+    `sequence`, `simulator` and `index` slots added for FIFO ties,
+    rescheduling and `IndexedHeapQueue` cost more, so a pending event takes
+    roughly 5% more memory than a `LegacyEvent` (about 211 against 200
+    bytes).
+    """
+    print('Event representation, {} events'.format(number_of_events))
+    for name, simulator_class in (('legacy', LegacySimulator),
+                                  ('current', Simulator)):
+        rate = events_per_second(simulator_class, number_of_events)
+        size = bytes_per_event(simulator_class, number_of_events)
+        print('    {:8s} {:12,.0f} events/s {:8.1f} bytes/event'.format(
+            name, rate, size))
+
+
+def hold_events_per_second(queue, pending_events, number_of_events):
+    """Classic "hold" benchmark for a queue backend.
+
+    The queue is filled with `pending_events` events and each event that runs
+    schedules a replacement a random time later, so the queue size stays
+    constant while `number_of_events` events are run.
+
+    Returns:
+        float: events run per second of wall time
+    """
+    generator = random.Random(0)
+    draws = [generator.expovariate(1.0) for _ in range(1024)]
+
+    def hold(env, index):
+        env.schedule(env.time + draws[index & 1023] * pending_events, 1,
+                     hold, index + 1)
+
+    simulator = Simulator(0, float('inf'), queue=queue)
+    for index in range(pending_events):
+        simulator.schedule(draws[index & 1023] * pending_events, 1, hold,
+                           index)
+    pop = simulator.queue.pop
+    start = time.perf_counter()
+    for _ in range(number_of_events):
+        event = pop()
+        simulator.time = event.time
+        event(simulator)
+    elapsed = time.perf_counter() - start
+    return number_of_events / elapsed
+
+
+def compare_queue_backends(number_of_events=200000):
+    """Compare queue backends with a constant number of pending events."""
+    print('Queue backends, {} hold events'.format(number_of_events))
+    for pending_events in (1000, 100000):
+        for name, queue in (('heap', HeapQueue),
+                            ('calendar', CalendarQueue)):
+            rate = hold_events_per_second(queue, pending_events,
+                                          number_of_events)
+            print('    {:8s} {:8d} pending {:12,.0f} events/s'.format(
+                name, pending_events, rate))
+
+
+def reschedules_per_second(queue, pending_events, number_of_reschedules):
+    """Time repeatedly pushing back timeouts that are pending in the queue.
+
+    Returns:
+        float: reschedules per second of wall time
+    """
+    generator = random.Random(0)
+    simulator = Simulator(0, float('inf'), queue=queue)
+    timeouts = [simulator.schedule(generator.uniform(0, pending_events), 1,
+                                   _noop)
+                for _ in range(pending_events)]
+    targets = [generator.randrange(pending_events)
+               for _ in range(number_of_reschedules)]
+    start = time.perf_counter()
+    for index in targets:
+        timeout = timeouts[index]
+        simulator.reschedule(timeout, timeout.time + pending_events)
+    elapsed = time.perf_counter() - start
+    return number_of_reschedules / elapsed
+
+
+def compare_reschedule(number_of_reschedules=200000):
+    """Compare lazy and in-place rescheduling across queue backends."""
+    print('Reschedule, {} reschedules'.format(number_of_reschedules))
+    for name, queue in (('heap', HeapQueue),
+                        ('calendar', CalendarQueue),
+                        ('indexed', IndexedHeapQueue)):
+        rate = reschedules_per_second(queue, 10000, number_of_reschedules)
+        print('    {:8s} {:12,.0f} reschedules/s'.format(name, rate))
+
+
+def compare_bulk_schedule(sizes=(10 ** 5, 10 ** 6)):
+    """Compare `Simulator.schedule_many` with a loop of `schedule` calls.
+
+    Pass 10 ** 7 in `sizes` for the largest runs, which need several
+    gigabytes of memory.
+    """
+    print('Bulk scheduling')
+    for size in sizes:
+        times = numpy.random.default_rng(0).uniform(0, size, size)
+        values = numpy.arange(size)
+
+        simulator = Simulator(0, size + 1)
+        start = time.perf_counter()
+        for event_time, value in zip(times.tolist(), values.tolist()):
+            simulator.schedule(event_time, 1, _noop, value)
+        loop = time.perf_counter() - start
+        del simulator
+
+        simulator = Simulator(0, size + 1)
+        start = time.perf_counter()
+        simulator.schedule_many(times, 1, _noop, args_columns=[values])
+        bulk = time.perf_counter() - start
+        del simulator
+
+        print('    {:10d} events  loop {:7.2f} s  schedule_many {:7.2f} s  '
+              '{:5.1f}x'.format(size, loop, bulk, loop / bulk))
+
+
+def _sorted_folded_monte_carlo(percentiles, data, number_of_folds):
+    # The full sort implementation folded_monte_carlo used to have
+    sorted_data = numpy.sort(data.reshape(number_of_folds, -1), axis=0)
+    records_to_select = (numpy.rint(percentiles * (number_of_folds - 1)
+                         / 100)).astype(int)
+    return sorted_data[records_to_select, :]
+
+
+def compare_folded_monte_carlo(shapes=((100, 10080), (1000, 10080),
+                                       (10000, 1008))):
+    """Compare partial selection with sorting every sample instance.
+
+    `shapes` are `(number_of_folds, samples_per_fold)` pairs.
+    """
+    print('Folded Monte Carlo')
+    percentiles = numpy.array([0, 10, 50, 90, 100])
+    for number_of_folds, samples_per_fold in shapes:
+        data = numpy.random.default_rng(0).integers(
+            0, 100, number_of_folds * samples_per_fold)
+
+        start = time.perf_counter()
+        expected = _sorted_folded_monte_carlo(percentiles, data,
+                                              number_of_folds)
+        sort = time.perf_counter() - start
+
+        start = time.perf_counter()
+        selected = retail_analyser.folded_monte_carlo(percentiles, data,
+                                                      number_of_folds)
+        partition = time.perf_counter() - start
+        assert numpy.array_equal(selected, expected)
+
+        print('    {:6d} folds of {:6d}  sort {:7.3f} s  partition {:7.3f} s  '
+              '{:5.1f}x'.format(number_of_folds, samples_per_fold, sort,
+                                partition, sort / partition))
+
+
+def compare_folded_percentile_memory(weeks=(100, 1000),
+                                     samples_per_week=2016):
+    """Compare the peak memory of `retail_analyser.FoldedPercentileStream`
+    with `folded_monte_carlo` over the whole series."""
+    print('Folded percentile memory, {} samples a week'.format(
+        samples_per_week))
+    percentiles = numpy.array([0, 10, 50, 90, 100])
+    for number_of_weeks in weeks:
+        generator = numpy.random.default_rng(0)
+
+        tracemalloc.start()
+        stream = retail_analyser.FoldedPercentileStream(percentiles,
+                                                        samples_per_week)
+        for _ in range(number_of_weeks):
+            stream.add_fold(generator.integers(0, 100, samples_per_week))
+        stream.percentiles()
+        streamed = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        data = generator.integers(0, 100, number_of_weeks * samples_per_week)
+        retail_analyser.folded_monte_carlo(percentiles, data.astype(float),
+                                           number_of_weeks)
+        whole = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print('    {:5d} weeks  stream {:8.2f} MB  whole series {:8.2f} MB'
+              .format(number_of_weeks, streamed / 1e6, whole / 1e6))
+
+
+def compare_arrival_generation(weeks=(100, 1000)):
+    """Compare generating and scheduling customers one at a time with
+    `arrivals.arrival_times` and `Simulator.schedule_many`."""
+    print('Customer arrivals, $200 average spend')
+    profile = piece_wise.function(_SALES_DATA, periodic=True)
+    for number_of_weeks in weeks:
+        horizon = number_of_weeks * 604800
+        total = profile.interpolate(horizon)
+
+        simulator = Simulator(0, horizon)
+        start = time.perf_counter()
+        dollars = 0
+        while dollars < total:
+            simulator.schedule(profile.interpolate(dollars, invert=True), 1,
+                               _noop)
+            dollars += int(random.expovariate(1 / 200))
+        loop = time.perf_counter() - start
+        count = len(simulator.queue)
+        del simulator
+
+        simulator = Simulator(0, horizon)
+        start = time.perf_counter()
+        times = arrivals.arrival_times(profile, horizon,
+                                       arrivals.exponential_spend(200),
+                                       numpy.random.default_rng(0))
+        simulator.schedule_many(times, 1, _noop)
+        bulk = time.perf_counter() - start
+        del simulator
+
+        print('    {:5d} weeks {:9d} customers  loop {:7.3f} s  bulk {:7.3f} s'
+              '  {:5.1f}x'.format(number_of_weeks, count, loop, bulk,
+                                  loop / bulk))
+
+
+def _ticks(interval, horizon):
+    for tick_time in range(0, horizon, interval):
+        yield (tick_time, 1, _noop, ())
+
+
+def compare_event_sources(years=10, interval=300):
+    """Compare scheduling a long run up front with an event source."""
+    horizon = years * 365 * 86400
+    print('Event sources, {} years of events every {} s'.format(
+        years, interval))
+
+    simulator = Simulator(0, horizon)
+    start = time.perf_counter()
+    for tick_time in range(0, horizon, interval):
+        simulator.schedule(tick_time, 1, _noop)
+    setup = time.perf_counter() - start
+    size = len(simulator.queue)
+    simulator.run()
+    total = time.perf_counter() - start
+    del simulator
+    print('    up front  setup {:7.3f} s  queue {:9d}  total {:7.2f} s'.format(
+        setup, size, total))
+
+    simulator = Simulator(0, horizon)
+    start = time.perf_counter()
+    simulator.add_source(_ticks(interval, horizon))
+    setup = time.perf_counter() - start
+    size = len(simulator.queue)
+    simulator.run()
+    total = time.perf_counter() - start
+    print('    source    setup {:7.3f} s  queue {:9d}  total {:7.2f} s'.format(
+        setup, size, total))
+
+
+def _place_orders(env, interval, count):
+    # The Order.py process, placing `count` orders `interval` apart
+    for _ in range(count):
+        yield interval
+
+
+def _simpy_place_orders(env, interval, count):
+    for _ in range(count):
+        yield env.timeout(interval)
+
+
+def compare_simpy(processes=1000, orders=200):
+    """Compare the process layer with SimPy on the Order.py workload.
+
+    Every process starts after a delay and places an order at a fixed
+    interval, as the processes in Order.py do.  On the machine the baseline
+    was saved on, five runs gave the `Simulator` 8% to 17% fewer steps per
+    second than SimPy, with about 45% less peak memory.
+    """
+    print('Order processes, {} processes of {} orders'.format(processes,
+                                                              orders))
+    try:
+        import simpy
+        from simpy.util import start_delayed
+    except ImportError:
+        print('    SimPy is not installed')
+        return
+
+    def run_simulator():
+        simulator = Simulator(0, float('inf'))
+        for index in range(processes):
+            simulator.process(_place_orders(simulator, 7 + index % 5, orders),
+                              delay=1 + index)
+        simulator.run()
+
+    def run_simpy():
+        environment = simpy.Environment()
+        for index in range(processes):
+            start_delayed(environment,
+                          _simpy_place_orders(environment, 7 + index % 5,
+                                              orders),
+                          1 + index)
+        environment.run()
+
+    for name, run in (('simpy', run_simpy), ('simulator', run_simulator)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        for _ in range(3):
+            start = time.perf_counter()
+            run()
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print('    {:10s} {:12,.0f} steps/s  peak {:8.1f} kB'.format(
+            name, processes * orders / elapsed, peak / 1024))
+
+
+def _partition_store(index, seed):
+    # A store of the partition test model, run for a year
+    simulator = partition._test_partition(index, seed)
+    simulator.extend_end_time(365 * 86400)
+    return simulator
+
+
+def _partition_events(simulator):
+    return len(simulator.log)
+
+
+def compare_partitioned(stores=8, workers=(1, 2, 4, 8)):
+    """Compare running a store network on different numbers of processes.
+
+    Scaling needs as many CPUs as workers.
+    """
+    print('Partitioned stores, {} stores for a year, {} CPUs'.format(
+        stores, os.cpu_count()))
+    lookahead = {}
+    for store in range(1, stores + 1):
+        lookahead[(store, 0)] = 600
+        lookahead[(0, store)] = 86400
+    for number_of_workers in workers:
+        start = time.perf_counter()
+        events = partition.run_partitioned(
+            _partition_store, _partition_events, stores + 1, lookahead,
+            seed=0, workers=number_of_workers)
+        elapsed = time.perf_counter() - start
+        print('    {:3d} workers {:12,.0f} events/s'.format(
+            number_of_workers, sum(events) / elapsed))
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'benchmark_baseline.json')
+
+# Registered workloads, name -> function returning the callable to time
+WORKLOADS = {}
+
+
+def workload(name, repeat=3):
+    """Register a function that sets up a workload.
+
+    The function returns a callable, and the callable is what is timed.
+    """
+    def register(setup):
+        WORKLOADS[name] = (setup, repeat)
+        return setup
+    return register
+
+
+def _schedule_run(size, queue):
+    times = _random_times(size)
+
+    def run():
+        simulator = Simulator(0, size + 1, queue=queue)
+        for event_time in times:
+            simulator.schedule(event_time, 1, _noop)
+        simulator.run()
+    return run
+
+
+for _size in (10 ** 3, 10 ** 4, 10 ** 5):
+    for _name, _queue in (('heap', HeapQueue),
+                          ('calendar', CalendarQueue),
+                          ('indexed', IndexedHeapQueue)):
+        workload('schedule_run/{}/{}'.format(_name, _size))(
+            lambda size=_size, queue=_queue: _schedule_run(size, queue))
+
+
+@workload('schedule_many/100000')
+def _schedule_many():
+    times = numpy.random.default_rng(0).uniform(0, 10 ** 5, 10 ** 5)
+
+    def run():
+        simulator = Simulator(0, 10 ** 5 + 1)
+        simulator.schedule_many(times, 1, _noop)
+        simulator.run()
+    return run
+
+
+def _small_batches(queue):
+    # One event batches added to a large queue
+    times = numpy.random.default_rng(0).uniform(0, 10 ** 5, 2 * 10 ** 5)
+
+    def run():
+        simulator = Simulator(0, 10 ** 5 + 1, queue=queue)
+        simulator.schedule_many(times, 1, _noop)
+        for event_time in times[:200].tolist():
+            simulator.schedule_many([event_time], 0, _noop)
+    return run
+
+
+for _name, _queue in (('heap', HeapQueue),
+                      ('calendar', CalendarQueue),
+                      ('indexed', IndexedHeapQueue)):
+    workload('schedule_many/small_batches/{}'.format(_name))(
+        lambda queue=_queue: _small_batches(queue))
+
+
+def _reschedule_heavy(queue):
+    generator = random.Random(0)
+    pending = 10000
+    targets = [generator.randrange(pending) for _ in range(50000)]
+
+    def run():
+        simulator = Simulator(0, float('inf'), queue=queue)
+        timeouts = [simulator.schedule(index, 1, _noop)
+                    for index in range(pending)]
+        for index in targets:
+            timeout = timeouts[index]
+            simulator.reschedule(timeout, timeout.time + pending)
+        simulator.run()
+    return run
+
+
+def _cancel_heavy(queue):
+    times = _random_times(50000)
+
+    def run():
+        simulator = Simulator(0, 50001, queue=queue)
+        events = [simulator.schedule(event_time, 1, _noop)
+                  for event_time in times]
+        for event in events[::5]:
+            simulator.reschedule(event, event.time + 1)
+        for index, event in enumerate(events):
+            if index % 5:
+                simulator.cancel(event)
+        simulator.run()
+    return run
+
+
+for _name, _queue in (('heap', HeapQueue),
+                      ('calendar', CalendarQueue),
+                      ('indexed', IndexedHeapQueue)):
+    workload('reschedule/{}'.format(_name))(
+        lambda queue=_queue: _reschedule_heavy(queue))
+    workload('cancel/{}'.format(_name))(
+        lambda queue=_queue: _cancel_heavy(queue))
+
+
+def _cron(cron_string, location, start, end):
+    from CronDiscreteEventSimulator import CronSimulator
+
+    def run():
+        simulator = CronSimulator(start, end, location)
+        simulator.cron_schedule(cron_string, None, None, 1, _noop)
+        simulator.run()
+    return run
+
+
+workload('cron/hourly_4_years', repeat=1)(
+    lambda: _cron('0 * * * *', 'Australia/Sydney',
+                  (2015, 1, 1, 0, 0, 0), (2019, 1, 1, 0, 0, 0)))
+workload('cron/dst_windows')(
+    lambda: _cron('*/15 1-3 * * *', 'America/New_York',
+                  (2016, 1, 1, 0, 0, 0), (2018, 1, 1, 0, 0, 0)))
+
+
+_SALES_DATA = numpy.array([[(0 * 24 + 0) * 3600, 0],
+                           [(0 * 24 + 8) * 3600, 0],
+                           [(0 * 24 + 21) * 3600, 3000],
+                           [(1 * 24 + 8) * 3600, 3000],
+                           [(1 * 24 + 21) * 3600, 6000],
+                           [(2 * 24 + 8) * 3600, 6000],
+                           [(2 * 24 + 21) * 3600, 9000],
+                           [(3 * 24 + 8) * 3600, 9000],
+                           [(3 * 24 + 21) * 3600, 12000],
+                           [(4 * 24 + 8) * 3600, 12000],
+                           [(4 * 24 + 21) * 3600, 15000],
+                           [(5 * 24 + 8) * 3600, 15000],
+                           [(5 * 24 + 17) * 3600, 22500],
+                           [(6 * 24 + 9) * 3600, 22500],
+                           [(6 * 24 + 18) * 3600, 30000],
+                           [(6 * 24 + 24) * 3600, 30000],
+                           ])
+
+
+@workload('piece_wise/interpolate_inverse')
+def _interpolate_inverse():
+    profile = piece_wise.function(_SALES_DATA)
+    targets = numpy.random.default_rng(0).uniform(0, 30000, 20000).tolist()
+
+    def run():
+        for target in targets:
+            profile.interpolate(target, invert=True)
+    return run
+
+
+@workload('piece_wise/interpolate')
+def _interpolate():
+    profile = piece_wise.function(_SALES_DATA)
+    targets = numpy.random.default_rng(0).uniform(0, 604800, 20000).tolist()
+
+    def run():
+        for target in targets:
+            profile.interpolate(target)
+    return run
+
+
+@workload('piece_wise/interpolate_inverse_array')
+def _interpolate_inverse_array():
+    # 100 weeks of cumulative sales, inverted in one call
+    profile = piece_wise.function(_SALES_DATA, periodic=True)
+    targets = numpy.random.default_rng(0).uniform(0, 100 * 30000, 10 ** 6)
+
+    def run():
+        profile.interpolate(targets, invert=True)
+    return run
+
+
+@workload('piece_wise/interpolate_array')
+def _interpolate_array():
+    profile = piece_wise.function(_SALES_DATA, periodic=True)
+    targets = numpy.random.default_rng(0).uniform(0, 100 * 604800, 10 ** 6)
+
+    def run():
+        profile.interpolate(targets)
+    return run
+
+
+@workload('arrivals/100_weeks')
+def _arrivals():
+    profile = piece_wise.function(_SALES_DATA, periodic=True)
+
+    def run():
+        simulator = Simulator(0, 100 * 604800)
+        times = arrivals.arrival_times(profile, 100 * 604800,
+                                       arrivals.exponential_spend(200),
+                                       numpy.random.default_rng(0))
+        simulator.schedule_many(times, 1, _noop)
+    return run
+
+
+@workload('sources/100000')
+def _sources():
+    def run():
+        simulator = Simulator(0, 10 ** 6)
+        for offset in range(10):
+            simulator.add_source(_ticks(100, 10 ** 6 - offset))
+        simulator.run()
+    return run
+
+
+@workload('process/100000')
+def _processes():
+    def run():
+        simulator = Simulator(0, float('inf'))
+        for index in range(1000):
+            simulator.process(_place_orders(simulator, 7 + index % 5, 100),
+                              delay=1 + index)
+        simulator.run()
+    return run
+
+
+def _collect(env, amount):
+    pass
+
+
+def _backorder(env, stock):
+    stock.get(1).add_callback(_collect)
+
+
+def _deliver(env, stock):
+    stock.put(24)
+
+
+@workload('resources/backorders_100000')
+def _backorders():
+    # Customers wait for stock that arrives in cartons of 24
+    def run():
+        simulator = Simulator(0, float('inf'))
+        stock = resources.Container(simulator)
+        simulator.schedule_many(range(100000), 1, _backorder, args=(stock,))
+        simulator.schedule_many(range(0, 100000, 24), 2, _deliver,
+                                args=(stock,))
+        simulator.run()
+    return run
+
+
+@workload('streams/exponential_1000000')
+def _stream_draws():
+    def run():
+        exponential = streams.RandomStreams(0).stream('customers').exponential
+        for _ in range(10 ** 6):
+            exponential(200)
+    return run
+
+
+@workload('streams/expovariate_1000000')
+def _expovariate_draws():
+    # The one at a time draws streams replace, as a reference
+    def run():
+        expovariate = random.Random(0).expovariate
+        for _ in range(10 ** 6):
+            expovariate(1 / 200)
+    return run
+
+
+@workload('step_series/window_queries')
+def _window_queries():
+    generator = numpy.random.default_rng(0)
+    times = numpy.cumsum(generator.exponential(60, 10 ** 7))
+    values = generator.integers(0, 100, 10 ** 7)
+    windows = numpy.sort(generator.uniform(0, times[-1], (1000, 2)), axis=1)
+
+    def run():
+        series = step_series.StepSeries(times, values)
+        series.mean(windows[:, 0], windows[:, 1])
+        for start, end in windows.tolist():
+            series.minimum(start, end)
+            series.maximum(start, end)
+    return run
+
+
+@workload('retail_analyser/zero_order_resample')
+def _zero_order_resample():
+    generator = numpy.random.default_rng(0)
+    times = numpy.sort(generator.uniform(0, 6e7, 10 ** 6))
+    data_set = numpy.vstack([times, generator.integers(0, 100, 10 ** 6)])
+    sample_points = numpy.arange(0, 6e7, 30)
+
+    def run():
+        retail_analyser.zero_order_resample(data_set, sample_points)
+    return run
+
+
+@workload('retail_analyser/folded_monte_carlo')
+def _folded_monte_carlo():
+    # 100 weeks sampled every minute
+    data = numpy.random.default_rng(0).integers(0, 100, 100 * 10080)
+    percentiles = numpy.array([0, 10, 50, 90, 100])
+
+    def run():
+        retail_analyser.folded_monte_carlo(percentiles, data, 100)
+    return run
+
+
+@workload('retail_analyser/folded_monte_carlo_batch')
+def _folded_monte_carlo_batch():
+    # 20 series of 50 weeks sampled every 5 minutes, and a partial week
+    data = numpy.random.default_rng(0).integers(0, 100,
+                                                (20, 50 * 2016 + 1000))
+    percentiles = numpy.array([0, 10, 50, 90, 100])
+
+    def run():
+        retail_analyser.folded_monte_carlo(percentiles, data,
+                                           samples_per_fold=2016)
+    return run
+
+
+def run_suite(pattern=None):
+    """Run the registered workloads whose names contain `pattern`.
+
+    Returns:
+        dict: best time in seconds of each workload, keyed by name
+    """
+    results = {}
+    for name, (setup, repeat) in WORKLOADS.items():
+        if pattern and pattern not in name:
+            continue
+        run = setup()
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+        print('{:45s} {:10.4f} s'.format(name, best))
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Return the stored baseline results, or an empty dict if none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Merge `results` into the stored baseline."""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Compare results with a baseline.
+
+    Returns:
+        list: names of the workloads more than `tolerance` slower than the
+        baseline
+    """
+    regressions = []
+    print()
+    print('{:45s} {:>10s} {:>10s} {:>7s}'.format('workload', 'baseline',
+                                                 'current', 'ratio'))
+    for name, seconds in sorted(results.items()):
+        if name not in baseline:
+            print('{:45s} {:>10s} {:10.4f}'.format(name, '-', seconds))
+            continue
+        ratio = seconds / baseline[name]
+        status = ''
+        if ratio > 1 + tolerance:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            status = 'faster'
+        print('{:45s} {:10.4f} {:10.4f} {:7.2f} {}'.format(
+            name, baseline[name], seconds, ratio, status))
+    return regressions
+
+
+def main(arguments=None):
+    """Command line entry point.  Returns an exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--filter', help='only run workloads containing this')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare the results with the baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help='baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown before flagging a regression')
+    parser.add_argument('--reports', action='store_true',
+                        help='print the implementation comparison reports')
+    options = parser.parse_args(arguments)
+
+    if options.reports:
+        compare_event_representation()
+        compare_queue_backends()
+        compare_reschedule()
+        compare_bulk_schedule()
+        compare_folded_monte_carlo()
+        compare_folded_percentile_memory()
+        compare_arrival_generation()
+        compare_event_sources()
+        compare_simpy()
+        compare_partitioned()
+        return 0
+
+    results = run_suite(options.filter)
+    status = 0
+    if options.compare:
+        if compare(results, load_baseline(options.baseline),
+                   options.tolerance):
+            status = 1
+    if options.save:
+        save_baseline(results, options.baseline)
+    return status
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,5 +1,4 @@
 from CronDiscreteEventSimulator import CronSimulator
-from random import randint
 import csv
 
 
@@ -12,7 +11,7 @@ def empty_rubbish(env):
 
 
 def take_out_trash(env):
-    env.rubbish_level += randint(0, 10)
+    env.rubbish_level += env.stream('rubbish').integers(0, 11)
 
 s = CronSimulator((2016, 12, 1, 0, 0, 0, 'Australia/Sydney'),
                   (2017, 5, 31, 23, 59, 59, 'America/New_York'),
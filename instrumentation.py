@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+"""
+instrumentation.py
+
+Optional profiling of the events run by a `Simulator`.
+
+Attach an `Instrument` to a `Simulator` and its `run` method switches to an
+instrumented loop that counts and times the events of every callback, samples
+the size of the event queue over simulated time, and calls observer hooks
+before and after each event.  Without an `Instrument` the plain loop is used,
+so there is no cost when instrumentation is off.
+
+Example
+
+instrument = Instrument(sample_interval=3600)
+simulation = Simulator(0, 1000, instrument=instrument)
+...
+simulation.run()
+print(instrument.report())
+instrument.to_csv('callbacks.csv')
+instrument.dump_stats('simulation.prof')   # for pstats, snakeviz, etc.
+"""
+
+import csv
+import marshal
+import time
+from array import array
+
+import numpy
+
+
+def event_callback(callback):
+    """Return the user callback an event's callback runs.
+
+    Cron series, event sources and processes schedule a method of their own
+    that runs the user's callback, or resumes the user's generator.  They
+    expose what they run as `event_callback`, which is returned instead of
+    the method.
+    """
+    owner = getattr(callback, '__self__', None)
+    if owner is not None:
+        return getattr(owner, 'event_callback', callback)
+    return callback
+
+
+def _code_of(callback):
+    # The code object of a function, method or generator, or None
+    code = getattr(callback, '__code__', None)
+    if code is None:
+        code = getattr(getattr(callback, '__func__', None), '__code__', None)
+    if code is None:
+        code = getattr(callback, 'gi_code', None)
+    return code
+
+
+def callback_name(callback):
+    """Return a readable name for an event callback."""
+    name = getattr(callback, '__qualname__', None)
+    if name is None:
+        return repr(callback)
+    module = getattr(callback, '__module__', None)
+    if module:
+        return module + '.' + name
+    return name
+
+
+class CallbackStatistics(object):
+    """Count and wall time of the events run for one callback.
+
+    Attributes:
+        code: Code object of the callback, or None if it has none
+        count: Number of events run
+        total_time: Wall time spent in the callback, in seconds
+        durations: Wall time of every event, if durations are kept
+    """
+
+    __slots__ = ('code', 'count', 'total_time', 'durations')
+
+    def __init__(self, code=None):
+        """Initialize the CallbackStatistics object."""
+        self.code = code
+        self.count = 0
+        self.total_time = 0.0
+        self.durations = array('d')
+
+
+class Instrument(object):
+    """Collects profiling information from `Simulator.run`.
+
+    Attributes:
+        sample_interval: Simulated time between samples of the queue size, or
+            None to not sample it
+        keep_durations: Keep the wall time of every event so percentiles can
+            be reported.  Uses 8 bytes per event.
+        callbacks: `CallbackStatistics` for every callback, keyed by the
+            `callback_name` of its `event_callback`.  No reference to the
+            callbacks themselves is kept, so they can be garbage collected.
+        queue_samples: `(time, live, dead)` samples of the queue size
+        events: Number of events run
+        wall_time: Wall time spent inside `Simulator.run`
+    """
+
+    def __init__(self, sample_interval=None, keep_durations=True):
+        """Initialize the Instrument object."""
+        self.sample_interval = sample_interval
+        self.keep_durations = keep_durations
+        self.callbacks = {}
+        self.queue_samples = []
+        self.events = 0
+        self.wall_time = 0.0
+        self._before = []
+        self._after = []
+        self._next_sample = None
+
+    def add_observer(self, before=None, after=None):
+        """Add hooks that are called before and after every event.
+
+        Args:
+            before: Function called as `before(simulator, event)` before each
+                event is run
+            after: Function called as `after(simulator, event)` after each
+                event is run
+        """
+        if before is not None:
+            self._before.append(before)
+        if after is not None:
+            self._after.append(after)
+
+    def _sample(self, simulator, now):
+        queue = simulator.queue
+        self.queue_samples.append((now, len(queue), queue.dead))
+        interval = self.sample_interval
+        while self._next_sample <= now:
+            self._next_sample += interval
+
+    def run(self, simulator, until=None, max_events=None):
+        """Instrumented version of `Simulator.run`."""
+        queue = simulator.queue
+        peek = queue.peek
+        pop = queue.pop
+        callbacks = self.callbacks
+        before = self._before
+        after = self._after
+        keep_durations = self.keep_durations
+        clock = time.perf_counter
+        if self.sample_interval is not None and self._next_sample is None:
+            self._next_sample = simulator.time
+
+        count = 0
+        start = clock()
+        while max_events is None or count < max_events:
+            event = peek()
+            if (event is None or simulator.end_time < event.time or
+                    (until is not None and until < event.time)):
+                if until is not None:
+                    horizon = min(until, simulator.end_time)
+                    if simulator.time < horizon:
+                        simulator.time = horizon
+                break
+            if (self._next_sample is not None and
+                    event.time >= self._next_sample):
+                self._sample(simulator, event.time)
+            pop()
+            event.simulator = None
+            simulator.current_event = event
+            simulator.time = event.time
+            for hook in before:
+                hook(simulator, event)
+
+            # Named before the event runs, as an event source moves on to
+            # its next item when it fires
+            callback = event_callback(event.callback)
+            name = callback_name(callback)
+
+            event_start = clock()
+            event(simulator)
+            duration = clock() - event_start
+
+            statistics = callbacks.get(name)
+            if statistics is None:
+                statistics = callbacks[name] = CallbackStatistics(
+                    _code_of(callback))
+            statistics.count += 1
+            statistics.total_time += duration
+            if keep_durations:
+                statistics.durations.append(duration)
+            for hook in after:
+                hook(simulator, event)
+            count += 1
+
+        self.wall_time += clock() - start
+        self.events += count
+        return count
+
+    def callback_report(self, percentiles=(50, 90, 99)):
+        """Return the statistics of each callback.
+
+        Returns:
+            list: a dictionary per callback name with the `name`, `count`,
+            `total_time` and `mean_time` of its events, and a `p<n>` entry
+            for each of the `percentiles` if durations are kept.  Sorted by
+            decreasing total time.
+        """
+        rows = []
+        for name, statistics in self.callbacks.items():
+            count = statistics.count
+            total_time = statistics.total_time
+            row = {'name': name,
+                   'count': count,
+                   'total_time': total_time,
+                   'mean_time': total_time / count if count else 0.0}
+            if self.keep_durations and count:
+                durations = numpy.frombuffer(statistics.durations)
+                values = numpy.percentile(durations, percentiles)
+                for percentile, value in zip(percentiles, values):
+                    row['p{}'.format(percentile)] = float(value)
+            rows.append(row)
+        rows.sort(key=lambda row: row['total_time'], reverse=True)
+        return rows
+
+    def report(self):
+        """Return a structured report of everything collected.
+
+        Returns:
+            dict: `events`, `wall_time` and `events_per_second` for all the
+            runs, `callbacks` from `callback_report` and the `queue_samples`
+        """
+        return {'events': self.events,
+                'wall_time': self.wall_time,
+                'events_per_second': (self.events / self.wall_time
+                                      if self.wall_time else 0.0),
+                'callbacks': self.callback_report(),
+                'queue_samples': list(self.queue_samples)}
+
+    def to_csv(self, path):
+        """Write the callback report to a CSV file."""
+        rows = self.callback_report()
+        fields = ['name', 'count', 'total_time', 'mean_time']
+        if rows:
+            fields += [key for key in rows[0] if key not in fields]
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def queue_samples_to_csv(self, path):
+        """Write the queue size samples, with their tombstone ratio, to CSV."""
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['time', 'live', 'dead', 'tombstone_ratio'])
+            for sample_time, live, dead in self.queue_samples:
+                size = live + dead
+                writer.writerow([sample_time, live, dead,
+                                 dead / size if size else 0.0])
+
+    def dump_stats(self, path):
+        """Write the callback timings in the format read by `pstats.Stats`.
+
+        Each callback appears as a function called directly by the simulator,
+        so tools that read profiler output, such as `pstats` or snakeviz, can
+        be used to explore where simulation time goes.
+        """
+        root = ('DiscreteEventSimulator.py', 0, 'Simulator.run')
+        stats = {}
+        for name, statistics in self.callbacks.items():
+            code = statistics.code
+            if code is None:
+                key = ('~', 0, name)
+            else:
+                key = (code.co_filename, code.co_firstlineno, name)
+            count, _, total_time, _, callers = stats.get(
+                key, (0, 0, 0.0, 0.0, {}))
+            count += statistics.count
+            total_time += statistics.total_time
+            callers[root] = (count, count, total_time, total_time)
+            stats[key] = (count, count, total_time, total_time, callers)
+        stats[root] = (1, 1, 0.0, self.wall_time, {})
+        with open(path, 'wb') as stats_file:
+            marshal.dump(stats, stats_file)
+
+
+def test():
+    """ Run a suite of test functions """
+
+    import os
+    import pstats
+    import tempfile
+    from DiscreteEventSimulator import Simulator
+
+    def fast(env):
+        pass
+
+    def slow(env):
+        sum(range(2000))
+        env.cancel(env.schedule(env.time + 5, 1, fast))
+
+    seen = []
+    instrument = Instrument(sample_interval=10)
+    instrument.add_observer(before=lambda env, event: seen.append(env.time))
+    simulation = Simulator(0, 1000, instrument=instrument)
+    for time_value in range(100):
+        simulation.schedule(time_value, 1, fast)
+        simulation.schedule(time_value, 2, slow)
+    assert simulation.run() == 200
+    assert len(seen) == 200
+
+    report = instrument.report()
+    names = [row['name'].split('.')[-1] for row in report['callbacks']]
+    print(names, report['events_per_second'])
+    assert names == ['slow', 'fast']
+    assert report['callbacks'][0]['count'] == 100
+    assert [sample[0] for sample in report['queue_samples']] == \
+        list(range(0, 100, 10))
+
+    # Processes and event sources are reported by what they run, and the
+    # instrument keeps none of them alive
+    import gc
+    import weakref
+
+    def shopper(env):
+        yield 1
+        yield 2
+
+    def delivery(env):
+        pass
+
+    instrument = Instrument()
+    simulation = Simulator(0, 1000, instrument=instrument)
+    processes = [simulation.process(shopper(simulation), delay=index % 7)
+                 for index in range(5000)]
+    references = [weakref.ref(process) for process in processes]
+    del processes
+    simulation.add_source((step, 1, delivery) for step in range(50))
+    simulation.run()
+    counts = {row['name'].split('.')[-1]: row['count']
+              for row in instrument.callback_report()}
+    print(counts)
+    assert counts == {'shopper': 15000, 'delivery': 50}
+    gc.collect()
+    assert all(reference() is None for reference in references)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'simulation.prof')
+        instrument.dump_stats(path)
+        pstats.Stats(path).sort_stats('tottime')
+        instrument.to_csv(os.path.join(directory, 'callbacks.csv'))
+        instrument.queue_samples_to_csv(os.path.join(directory, 'queue.csv'))
+
+
+if __name__ == '__main__':
+    test()
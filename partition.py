@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+
+"""
+partition.py
+
+Run a model split into partitions, each with its own `Simulator`, on
+several processes.
+
+Partitions, such as the stores and distribution centre of a supply chain,
+only affect each other through timestamped messages sent with
+`Partition.send`.  Every link between two partitions has a lookahead, the
+shortest delay of any message sent along it, such as a minimum delivery lead
+time.  The partitions are run in rounds.  In each round a partition runs the
+events it can be sure no message will arrive before: those earlier than, for
+every partition sending to it, that partition's next event time plus the
+lookahead of the link.  The messages sent during the round are then
+delivered, and the next round starts.
+
+The rounds, and the order messages are delivered in, depend only on the
+model, so the results are the same whatever the number of processes,
+including a sequential run in this process.  They are also the same as a run
+with every partition in one event queue, except for ties: a message is
+numbered for its destination's first in, first out tie-break when it is
+delivered, not when it is sent, so a message and a local event due at the
+same time and priority may run in the other order.  Messages delivered
+together are ordered by their source partition and the order they were sent.
+
+Example
+
+def build_store(index, seed):
+    simulator = Simulator(0, simulation_period, seed=seed)
+    ...
+    # In a callback, order from the distribution centre, partition 0
+    env.partition.send(0, 3600, 1, receive_order, env.partition.index, 24)
+    return simulator
+
+results = run_partitioned(build_store, collect, 11,
+                          {(0, store): 86400 for store in range(1, 11)} |
+                          {(store, 0): 3600 for store in range(1, 11)},
+                          seed=1)
+
+`build_partition`, `collect` and message callbacks are sent to the worker
+processes, so they need to be functions defined at the top level of a
+module.
+"""
+
+import multiprocessing
+import os
+
+from replication import replication_seeds
+
+
+class Partition(object):
+    """The link from a partition's `Simulator` to the other partitions.
+
+    Each partition's `Simulator` has one as its `partition` attribute.
+
+    Attributes:
+        index: Index of the partition
+        simulator: The partition's `Simulator`
+        lookahead: Shortest delay of messages to each partition it can send
+            to, keyed by destination
+        outbox: Messages sent since the last round, as
+            `(time, priority, index, number, callback, args)` tuples
+    """
+
+    def __init__(self, index, simulator, lookahead):
+        """Initialize the Partition object."""
+        self.index = index
+        self.simulator = simulator
+        self.lookahead = lookahead
+        self.outbox = []
+        self._sent = 0
+
+    def _check_link(self, destination, delay):
+        lookahead = self.lookahead.get(destination)
+        if lookahead is None:
+            raise ValueError("There is no link from partition {} to {}".format(
+                self.index, destination))
+        if delay < lookahead:
+            raise ValueError("Messages from partition {} to {} need a delay "
+                             "of at least {}".format(self.index, destination,
+                                                     lookahead))
+
+    def send(self, destination, delay, priority, callback, *args):
+        """Schedule `callback(env, *args)` in another partition.
+
+        Args:
+            destination: Index of the partition to run `callback` in
+            delay: Time from now until `callback` is run.  Must be at least
+                the lookahead of the link to `destination`.
+            priority: Priority of the event in `destination`
+            callback: Top level function to call
+            *args: Positional arguments to pass to `callback`.  They are
+                pickled, so they can't refer to objects of this partition.
+
+        Raises:
+            ValueError: if there is no link to `destination` or `delay` is
+                shorter than its lookahead
+        """
+        self._check_link(destination, delay)
+        self.outbox.append((destination, (self.simulator.time + delay,
+                                          priority, self.index, self._sent,
+                                          callback, args)))
+        self._sent += 1
+
+    def deliver(self, messages):
+        """Schedule the messages sent to this partition."""
+        for time, priority, _, _, callback, args in sorted(
+                messages, key=lambda message: message[:4]):
+            self.simulator.schedule(time, priority, callback, *args)
+
+    def run_before(self, bound):
+        """Run every event earlier than `bound`.
+
+        Returns:
+            tuple: the time of the next event, or None, and the messages sent
+        """
+        simulator = self.simulator
+        peek = simulator.peek
+        step = simulator.step
+        event = peek()
+        while event is not None and event.time < bound:
+            if step() is None:
+                break
+            event = peek()
+        outbox = self.outbox
+        self.outbox = []
+        if event is None or event.time > simulator.end_time:
+            return None, outbox
+        return event.time, outbox
+
+
+def _build(build_partition, index, seed, lookahead):
+    simulator = build_partition(index, seed)
+    simulator.partition = Partition(index, simulator, lookahead)
+    return simulator.partition
+
+
+def _serve(connection, build_partition, collect, assignments):
+    # Worker process: run the assigned partitions as the coordinator says
+    partitions = {index: _build(build_partition, index, seed, lookahead)
+                  for index, seed, lookahead in assignments}
+    connection.send({index: partition.run_before(float('-inf'))
+                     for index, partition in partitions.items()})
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        replies = {}
+        for index, (bound, messages) in command.items():
+            partition = partitions[index]
+            partition.deliver(messages)
+            replies[index] = partition.run_before(bound)
+        connection.send(replies)
+    connection.send({index: collect(partition.simulator)
+                     for index, partition in partitions.items()})
+    connection.close()
+
+
+class _LocalWorker(object):
+    # Runs partitions in this process, with the interface of a pipe
+
+    def __init__(self, build_partition, collect, assignments):
+        self._build_partition = build_partition
+        self._collect = collect
+        self._assignments = assignments
+        self.partitions = {}
+        self._reply = None
+
+    def start(self):
+        self.partitions = {index: _build(self._build_partition, index, seed,
+                                         lookahead)
+                           for index, seed, lookahead in self._assignments}
+        self._reply = {index: partition.run_before(float('-inf'))
+                       for index, partition in self.partitions.items()}
+
+    def send(self, command):
+        if command is None:
+            self._reply = {index: self._collect(partition.simulator)
+                           for index, partition in self.partitions.items()}
+            return
+        self._reply = {}
+        for index, (bound, messages) in command.items():
+            partition = self.partitions[index]
+            partition.deliver(messages)
+            self._reply[index] = partition.run_before(bound)
+
+    def recv(self):
+        return self._reply
+
+
+def run_partitioned(build_partition,
+                    collect,
+                    number_of_partitions,
+                    lookahead,
+                    seed=None,
+                    workers=None):
+    """Run a partitioned model with conservative synchronization.
+
+    Args:
+        build_partition: Function taking a partition index and a
+            `numpy.random.SeedSequence` and returning the partition's
+            `Simulator`, ready to run
+        collect: Function taking a partition's `Simulator` after the run and
+            returning its result
+        number_of_partitions: Number of partitions
+        lookahead: Dictionary of the shortest message delay of each link,
+            keyed by `(source, destination)` partition indices.  Partitions
+            can only send messages along these links.  Every lookahead must
+            be greater than zero.
+        seed: Root seed for the partition seeds, spawned as in
+            `replication.replication_seeds`
+        workers: Number of worker processes, at most one per partition, the
+            number of CPUs if None.  With one worker the partitions are run in
+            this process.
+
+    Returns:
+        list: the result of `collect` for each partition, in index order
+    """
+    if any(delay <= 0 for delay in lookahead.values()):
+        raise ValueError("Every lookahead must be greater than zero")
+    outgoing = [{} for _ in range(number_of_partitions)]
+    incoming = [[] for _ in range(number_of_partitions)]
+    for (source, destination), delay in lookahead.items():
+        outgoing[source][destination] = delay
+        incoming[destination].append((source, delay))
+
+    seeds = replication_seeds(seed, number_of_partitions)
+    workers = min(workers or os.cpu_count() or 1, number_of_partitions)
+    assignments = [[] for _ in range(workers)]
+    for index in range(number_of_partitions):
+        assignments[index % workers].append((index, seeds[index],
+                                             outgoing[index]))
+
+    processes = []
+    if workers == 1:
+        connections = [_LocalWorker(build_partition, collect, assignments[0])]
+        connections[0].start()
+    else:
+        context = multiprocessing.get_context()
+        connections = []
+        for worker_assignments in assignments:
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve,
+                                      args=(child, build_partition, collect,
+                                            worker_assignments),
+                                      daemon=True)
+            process.start()
+            child.close()
+            connections.append(parent)
+            processes.append(process)
+
+    try:
+        # Time of the next event of every partition, None if it has none
+        # before its end_time, and the messages waiting for each partition
+        next_times = [None] * number_of_partitions
+        inboxes = [[] for _ in range(number_of_partitions)]
+
+        def receive(connection):
+            for index, (next_time, outbox) in connection.recv().items():
+                next_times[index] = next_time
+                for destination, message in outbox:
+                    inboxes[destination].append(message)
+
+        for connection in connections:
+            receive(connection)
+
+        while True:
+            # Earliest time each partition could next do anything
+            earliest = []
+            for index in range(number_of_partitions):
+                times = [message[0] for message in inboxes[index]]
+                if next_times[index] is not None:
+                    times.append(next_times[index])
+                earliest.append(min(times) if times else None)
+            if all(time is None for time in earliest):
+                break
+
+            # Earliest time each partition could be active, including after
+            # messages from partitions that are themselves woken by messages
+            active = [float('inf') if time is None else time
+                      for time in earliest]
+            for _ in range(number_of_partitions):
+                changed = False
+                for (source, destination), delay in lookahead.items():
+                    if active[source] + delay < active[destination]:
+                        active[destination] = active[source] + delay
+                        changed = True
+                if not changed:
+                    break
+
+            # Run each partition up to the earliest time a message could
+            # arrive.  The partition with the earliest time always runs,
+            # because every lookahead is greater than zero.
+            commands = [{} for _ in connections]
+            for index in range(number_of_partitions):
+                if earliest[index] is None:
+                    continue
+                bound = min([active[source] + delay
+                             for source, delay in incoming[index]],
+                            default=float('inf'))
+                if earliest[index] < bound:
+                    commands[index % workers][index] = (bound, inboxes[index])
+                    inboxes[index] = []
+
+            for connection, command in zip(connections, commands):
+                if command:
+                    connection.send(command)
+            for connection, command in zip(connections, commands):
+                if command:
+                    receive(connection)
+
+        results = [None] * number_of_partitions
+        for connection in connections:
+            connection.send(None)
+        for connection in connections:
+            for index, result in connection.recv().items():
+                results[index] = result
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+    return results
+
+
+# A distribution centre, partition 0, supplying stores, the other partitions
+
+def _receive_order(env, store, cartons):
+    env.log.append((env.time, 'order', store, cartons))
+    env.partition.send(store, 86400 + 3600 * store, 1, _receive_delivery,
+                       cartons)
+
+
+def _receive_delivery(env, cartons):
+    env.stock += 24 * cartons
+    env.log.append((env.time, 'delivery', cartons))
+
+
+def _customer(env):
+    if env.stock > 0:
+        env.stock -= 1
+    env.log.append((env.time, 'customer', env.stock))
+    env.schedule(env.time + env.stream('customers').exponential(1800), 1,
+                 _customer)
+
+
+def _place_order(env):
+    cartons = max(0, (60 - env.stock) // 24)
+    if cartons:
+        env.partition.send(0, 600, 1, _receive_order, env.partition.index,
+                           cartons)
+    env.schedule(env.time + 86400, 0, _place_order)
+
+
+def _test_partition(index, seed):
+    from DiscreteEventSimulator import Simulator
+
+    simulator = Simulator(0, 30 * 86400, log=[], stock=50, seed=seed)
+    if index:
+        simulator.schedule(3600, 0, _place_order)
+        simulator.schedule(0, 1, _customer)
+    return simulator
+
+
+def _test_collect(simulator):
+    return simulator.log
+
+
+class _SequentialPartition(Partition):
+    # Sends messages straight into the destination's queue
+
+    def __init__(self, index, simulator, lookahead, simulators):
+        Partition.__init__(self, index, simulator, lookahead)
+        self._simulators = simulators
+
+    def send(self, destination, delay, priority, callback, *args):
+        self._check_link(destination, delay)
+        self._simulators[destination].schedule(self.simulator.time + delay,
+                                               priority, callback, *args)
+
+
+def _run_sequential(build_partition, collect, number_of_partitions,
+                    lookahead, seed=None):
+    # Reference run with every partition in one event queue, for testing
+    seeds = replication_seeds(seed, number_of_partitions)
+    simulators = [build_partition(index, seeds[index])
+                  for index in range(number_of_partitions)]
+    queue = type(simulators[0].queue)()
+    sequence = simulators[0]._sequence
+    events = []
+    for simulator in simulators:
+        while simulator.peek() is not None:
+            events.append(simulator.queue.pop())
+    # Number the initial events as if the partitions had been built into
+    # one Simulator in index order
+    for event in events:
+        event.sequence = next(sequence)
+        queue.push(event)
+    for index, simulator in enumerate(simulators):
+        simulator.queue = queue
+        simulator._sequence = sequence
+        simulator.partition = _SequentialPartition(
+            index, simulator,
+            {destination: delay
+             for (source, destination), delay in lookahead.items()
+             if source == index},
+            simulators)
+    while True:
+        event = queue.peek()
+        if event is None or event.simulator.step() is None:
+            break
+    return [collect(simulator) for simulator in simulators]
+
+
+def test():
+    """ Run a suite of test functions """
+
+    lookahead = {}
+    for store in range(1, 5):
+        lookahead[(store, 0)] = 600
+        lookahead[(0, store)] = 86400
+    sequential = run_partitioned(_test_partition, _test_collect, 5, lookahead,
+                                 seed=3, workers=1)
+    parallel = run_partitioned(_test_partition, _test_collect, 5, lookahead,
+                               seed=3, workers=3)
+    print([len(log) for log in sequential])
+    assert sequential == parallel
+
+    # The same as a run with every partition in one event queue
+    assert sequential == _run_sequential(_test_partition, _test_collect, 5,
+                                         lookahead, seed=3)
+    assert any(entry[1] == 'order' for entry in sequential[0])
+    assert any(entry[1] == 'delivery' for entry in sequential[1])
+    for log in sequential:
+        assert [entry[0] for entry in log] == sorted(entry[0] for entry in log)
+        assert all(entry[0] <= 30 * 86400 for entry in log)
+
+    # Messages must respect the lookahead of their link
+    try:
+        run_partitioned(_test_partition, _test_collect, 5,
+                        {(store, 0): 601 for store in range(1, 5)},
+                        seed=3, workers=1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A message shorter than the lookahead was sent")
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""
+perishables.py
+
+An in-memory ledger of perishable stock, kept as batches.
+
+Each batch is ordered at one time, can be put on display from its display
+time and is thrown away at its expiry time, like the rows of Order.py's
+ORDER_SCHEDULE table.  The ledger keeps batches waiting to be displayed in a
+heap by display time, and the batches on display in a heap by expiry time, so
+the next display and the next expiry are read off the top of a heap, and
+stock is sold first expired, first out.  With a fixed shelf life that is also
+first in, first out.
+
+Bound to a `Simulator`, the ledger schedules a single event, reused for every
+transition, at the earlier of the next display and the next expiry, rather
+than an event per batch up front.
+
+Example
+
+simulation = Simulator(0, 20 * 604800)
+ledger = BatchLedger(simulation, on_expire=record_waste)
+ledger.add_recurring(72000, 295200, 867600, 604800, 20, quantity=24)
+
+def customer(env):
+    if not ledger.consume(1):
+        env.lost_sales += 1
+"""
+
+import heapq
+import itertools
+
+import numpy
+
+
+class Batch(object):
+    """A batch of perishable stock.
+
+    Attributes:
+        order_time: Time the batch was ordered
+        display_time: Time the batch can be put on display
+        expiry_time: Time the batch expires
+        quantity: Quantity of the batch not yet sold or expired
+    """
+
+    __slots__ = ('order_time', 'display_time', 'expiry_time', 'quantity')
+
+    def __init__(self, order_time, display_time, expiry_time, quantity):
+        """Initialize the Batch object."""
+        self.order_time = order_time
+        self.display_time = display_time
+        self.expiry_time = expiry_time
+        self.quantity = quantity
+
+    def __repr__(self):
+        return 'Batch({}, {}, {}, {})'.format(self.order_time,
+                                              self.display_time,
+                                              self.expiry_time, self.quantity)
+
+
+class BatchLedger(object):
+    """Perishable stock on order and on display.
+
+    Attributes:
+        simulator: The `Simulator` the ledger schedules its transitions in,
+            or None to advance the ledger by hand with `advance`
+        on_hand: Quantity on display
+        expired: Quantity that has expired unsold
+        time: Time the ledger has been advanced to
+    """
+
+    def __init__(self, simulator=None, on_display=None, on_expire=None,
+                 priority=0):
+        """Initialize the BatchLedger object.
+
+        Args:
+            simulator: The `Simulator` to schedule transitions in
+            on_display: Function called as `on_display(env, batch)` when a
+                batch is put on display
+            on_expire: Function called as `on_expire(env, batch)` when a
+                batch expires, with the quantity thrown away still in
+                `batch.quantity`
+            priority: Priority of the transition events.  The default runs
+                them before other events at the same time.
+        """
+        self.simulator = simulator
+        self.on_display = on_display
+        self.on_expire = on_expire
+        self.priority = priority
+        self.on_hand = 0
+        self.expired = 0
+        self.time = simulator.time if simulator is not None else None
+        self._sequence = itertools.count()
+        # (display_time, sequence, batch) and (expiry_time, sequence, batch)
+        self._on_order = []
+        self._on_display = []
+        self._event = None
+        self._scheduled = None
+
+    def __len__(self):
+        return len(self._on_order) + len(self._on_display)
+
+    @property
+    def next_display(self):
+        """Time the next batch can be put on display, or None."""
+        return self._on_order[0][0] if self._on_order else None
+
+    @property
+    def next_expiry(self):
+        """Time the next batch on display expires, or None."""
+        return self._on_display[0][0] if self._on_display else None
+
+    @property
+    def next_transition(self):
+        """Earlier of `next_display` and `next_expiry`, or None."""
+        times = [heap[0][0] for heap in (self._on_order, self._on_display)
+                 if heap]
+        return min(times) if times else None
+
+    def batches(self):
+        """Return the batches on display, in the order they are sold."""
+        return [entry[2] for entry in sorted(self._on_display)]
+
+    def add(self, order_time, display_time, expiry_time, quantity=1):
+        """Add a batch.
+
+        Returns:
+            Batch: the new batch
+
+        Raises:
+            ValueError: if the times are not in order
+        """
+        if not (0 <= order_time <= display_time <= expiry_time):
+            raise ValueError("Order dates are not in the correct sequence")
+        batch = Batch(order_time, display_time, expiry_time, quantity)
+        heapq.heappush(self._on_order,
+                       (display_time, next(self._sequence), batch))
+        self._schedule()
+        return batch
+
+    def add_many(self, order_times, display_times, expiry_times, quantities=1):
+        """Add a batch for each element of the arrays.
+
+        The batches are checked together and heapified in one go rather than
+        pushed one at a time.
+
+        Args:
+            order_times, display_times, expiry_times: Array-likes of times
+            quantities: Array-like of quantities, or a single quantity for
+                every batch
+
+        Raises:
+            ValueError: if the times of any batch are not in order
+        """
+        order_times, display_times, expiry_times, quantities = \
+            numpy.broadcast_arrays(order_times, display_times, expiry_times,
+                                   quantities)
+        if not numpy.all((0 <= order_times) & (order_times <= display_times) &
+                         (display_times <= expiry_times)):
+            raise ValueError("Order dates are not in the correct sequence")
+        sequence = self._sequence
+        self._on_order.extend(
+            (display_time, next(sequence),
+             Batch(order_time, display_time, expiry_time, quantity))
+            for order_time, display_time, expiry_time, quantity in zip(
+                order_times.tolist(), display_times.tolist(),
+                expiry_times.tolist(), quantities.tolist()))
+        heapq.heapify(self._on_order)
+        self._schedule()
+
+    def add_recurring(self, order_time, display_time, expiry_time,
+                      recurrence_period, number_of_orders, quantity=1):
+        """Add `number_of_orders` batches, one every `recurrence_period`.
+
+        The bulk form of Order.py's `generate_recurring_weekly_order`.
+        """
+        offsets = numpy.arange(number_of_orders) * recurrence_period
+        self.add_many(order_time + offsets, display_time + offsets,
+                      expiry_time + offsets, quantity)
+
+    def consume(self, quantity):
+        """Sell up to `quantity` from the batches on display, earliest expiry
+        first.
+
+        Returns:
+            the quantity sold, less than `quantity` if there wasn't enough
+        """
+        on_display = self._on_display
+        sold = 0
+        while on_display and sold < quantity:
+            batch = on_display[0][2]
+            taken = min(batch.quantity, quantity - sold)
+            batch.quantity -= taken
+            sold += taken
+            if not batch.quantity:
+                heapq.heappop(on_display)
+        self.on_hand -= sold
+        self._schedule()
+        return sold
+
+    def advance(self, time):
+        """Put on display and expire the batches due up to `time`.
+
+        A ledger bound to a `Simulator` is advanced by its own events.
+        """
+        env = self.simulator
+        on_order = self._on_order
+        on_display = self._on_display
+        while True:
+            display = on_order[0][0] if on_order and \
+                on_order[0][0] <= time else None
+            expiry = on_display[0][0] if on_display and \
+                on_display[0][0] <= time else None
+            if expiry is not None and (display is None or expiry <= display):
+                _, _, batch = heapq.heappop(on_display)
+                self.on_hand -= batch.quantity
+                self.expired += batch.quantity
+                if self.on_expire is not None:
+                    self.on_expire(env, batch)
+            elif display is not None:
+                _, sequence, batch = heapq.heappop(on_order)
+                heapq.heappush(on_display,
+                               (batch.expiry_time, sequence, batch))
+                self.on_hand += batch.quantity
+                if self.on_display is not None:
+                    self.on_display(env, batch)
+            else:
+                break
+        self.time = time
+
+    def _schedule(self):
+        # Keep the transition event at the next transition
+        simulator = self.simulator
+        if simulator is None:
+            return
+        time = self.next_transition
+        if time is None or time == self._scheduled:
+            return
+        time = max(time, simulator.time)
+        if self._event is None:
+            self._event = simulator.schedule(time, self.priority,
+                                             self._transition)
+        else:
+            simulator.reschedule(self._event, time)
+        self._scheduled = time
+
+    def _transition(self, env):
+        self._scheduled = None
+        self.advance(env.time)
+        self._schedule()
+
+
+def test():
+    """ Run a suite of test functions """
+
+    from DiscreteEventSimulator import Simulator
+
+    week = 604800
+    day = 86400
+
+    # By hand, batches go on display, are sold earliest expiry first and
+    # expire
+    ledger = BatchLedger()
+    ledger.add(0, 10, 100, quantity=5)
+    ledger.add(0, 20, 50, quantity=5)
+    assert ledger.next_display == 10 and ledger.next_expiry is None
+    ledger.advance(20)
+    assert ledger.on_hand == 10 and ledger.next_expiry == 50
+    assert ledger.consume(7) == 7
+    assert [batch.quantity for batch in ledger.batches()] == [3]
+    ledger.advance(100)
+    assert ledger.on_hand == 0 and ledger.expired == 3 and len(ledger) == 0
+    assert ledger.consume(1) == 0
+    try:
+        ledger.add(10, 5, 20)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A batch displayed before it was ordered")
+
+    # Bound to a simulator, one event is reused for every transition
+    log = []
+
+    def record(kind):
+        return lambda env, batch: log.append((env.time, kind,
+                                              batch.quantity))
+
+    def customer(env):
+        if not ledger.consume(1):
+            log.append((env.time, 'lost', 1))
+
+    simulation = Simulator(0, 20 * week)
+    ledger = BatchLedger(simulation, on_display=record('display'),
+                         on_expire=record('expire'))
+    ledger.add_recurring(72000, 3 * day + 36000, week + 3 * day, week, 20,
+                         quantity=24)
+    ledger.add_recurring(day + 72000, 4 * day + 36000, week + 4 * day, week,
+                         20, quantity=24)
+    assert len(simulation.queue) == 1
+    simulation.schedule_many(numpy.arange(0, 20 * week, 3600 * 5), 1,
+                             customer)
+    simulation.run()
+
+    displays = [entry for entry in log if entry[1] == 'display']
+    expiries = [entry for entry in log if entry[1] == 'expire']
+    lost = [entry for entry in log if entry[1] == 'lost']
+    print(len(displays), len(expiries), len(lost), ledger.expired)
+    assert len(displays) == 40 and 0 < len(expiries) <= 40
+    assert [entry[0] for entry in log] == sorted(entry[0] for entry in log)
+    # Every unit is sold, expired or still on hand
+    customers = len(numpy.arange(0, 20 * week, 3600 * 5))
+    assert customers - len(lost) + ledger.expired + ledger.on_hand == 40 * 24
+    assert ledger.expired == sum(entry[2] for entry in expiries)
+    # Customers before the first display find nothing
+    assert lost[0][0] == 0 and lost[14][0] < 3 * day + 36000
+
+    # A batch added before the scheduled transition moves the event forward
+    simulation = Simulator(0, 100)
+    ledger = BatchLedger(simulation)
+    ledger.add(0, 50, 60)
+    ledger.add(0, 10, 20, quantity=2)
+    simulation.run(until=15)
+    assert ledger.on_hand == 2 and len(simulation.queue) == 1
+
+    # Selling out the batch expiring next moves the event to the next expiry
+    ledger.add(0, 15, 40)
+    simulation.run(until=16)
+    assert ledger.consume(2) == 2
+    assert simulation.peek().time == 40
+
+
+if __name__ == '__main__':
+    test()
@@ -1,11 +1,30 @@
+import bisect
+
 import numpy
 
 
+# Types of target handled without numpy
+_SCALARS = (int, float, numpy.number)
+
+
 class function(object):
+    """
+    function is a piece wise linear function through a set of (x, y) points,
+    such as the cumulative sales over a week.  y must never decrease, so the
+    function can also be inverted to find the x at which y reaches a value.
+
+    With periodic=True the function repeats every x[-1] - x[0], rising by
+    y[-1] - y[0] each period, so a weekly sales profile can be evaluated at
+    any time in a multi-week simulation, and inverted for any cumulative
+    sales total, without the caller splitting off whole weeks.
 
-    def __init__(self, data):
+    interpolate accepts a single target or an array of targets.
+    """
+
+    def __init__(self, data, periodic=False):
         self.x = data[:, 0]
         self.y = data[:, 1]
+        self.periodic = periodic
 
         x_difference = self.x[1:] - self.x[:-1]
         y_difference = self.y[1:] - self.y[:-1]
@@ -20,26 +39,101 @@ class function(object):
             raise ValueError("The y data supplied must be in " +
                              "increasing order.  Uniqueness is note required")
 
+        self.x_period = self.x[-1] - self.x[0]
+        self.y_period = self.y[-1] - self.y[0]
+
+        # Slope of each segment in both directions.  Flat segments are never
+        # interpolated across by the inverse, because a target equal to
+        # their y value is found exactly.
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            inverse_slopes = x_difference / y_difference
+        self._slopes = y_difference / x_difference
+        self._inverse_slopes = numpy.where(y_difference > 0,
+                                           inverse_slopes, 0.0)
+
+        # Single targets are looked up with bisect, which is much faster than
+        # calling into numpy for one value
+        self._x_list = self.x.tolist()
+        self._y_list = self.y.tolist()
+        self._slope_list = self._slopes.tolist()
+        self._inverse_slope_list = self._inverse_slopes.tolist()
+
     def interpolate(self, target, **kwargs):
         invert = kwargs.get('invert', False)
 
-        #  if the invert setting is activated, search the dependent variable for target
         if (invert):
-            #  because there can be duplicates in the dependant variable,
-            #  make sure the first one found is returned.
-            locations = (self.y == target)
-            if numpy.any(locations):
-                index = numpy.where(locations)
-                returnVal = self.x[index][0]
+            period, start, rise = self.x_period, self.y[0], self.y_period
+        else:
+            period, start, rise = self.y_period, self.x[0], self.x_period
+
+        #  in periodic mode, split off whole periods and evaluate the
+        #  remainder within the first period
+        if (self.periodic):
+            if rise <= 0:
+                raise ValueError("The y data of a periodic function must " +
+                                 "rise over a period to be inverted")
+            periods = numpy.floor((target - start) / rise)
+            target = target - periods * rise
+
+        if isinstance(target, _SCALARS):
+            if (invert):
+                returnVal = self._scalar_inverse(target)
             else:
-                returnVal = numpy.interp(target, self.y, self.x)
+                returnVal = self._scalar_interpolate(target)
+        elif (invert):
+            returnVal = self._inverse(numpy.asarray(target, dtype=float))
         else:
             returnVal = numpy.interp(target, self.x, self.y)
 
+        if (self.periodic):
+            returnVal = returnVal + periods * period
+
         return returnVal
 
+    def _scalar_interpolate(self, target):
+        x = self._x_list
+        y = self._y_list
+        index = bisect.bisect_right(x, target)
+        if index == 0:
+            return float(y[0])
+        if index == len(x):
+            return float(y[-1])
+        return self._slope_list[index - 1] * (target - x[index - 1]) + \
+            y[index - 1]
 
-if __name__ == '__main__':
+    def _scalar_inverse(self, target):
+        #  because there can be duplicates in the dependant variable, the
+        #  first x with a y equal to the target is returned.  bisect_left
+        #  finds the first y at or above the target, which is either the
+        #  target itself or the top of the segment to interpolate along.
+        x = self._x_list
+        y = self._y_list
+        index = bisect.bisect_left(y, target)
+        if index == len(y):
+            return float(x[-1])
+        if y[index] == target or index == 0:
+            return float(x[index])
+        return self._inverse_slope_list[index - 1] * (target - y[index - 1]) \
+            + x[index - 1]
+
+    def _inverse(self, target):
+        # The same search as _scalar_inverse, with searchsorted
+        y = self.y
+        index = numpy.searchsorted(y, target, side='left')
+        index = numpy.clip(index, 1, len(y) - 1)
+        lower = index - 1
+        returnVal = self._inverse_slopes[lower] * (target - y[lower]) + \
+            self.x[lower]
+        returnVal = numpy.where(y[index] == target, self.x[index], returnVal)
+
+        # Targets outside y are clamped, as numpy.interp does
+        returnVal = numpy.where(target <= y[0], self.x[0], returnVal)
+        returnVal = numpy.where(target > y[-1], self.x[-1], returnVal)
+        return returnVal
+
+
+def test():
+    """ Run a suite of test functions """
 
     data = numpy.array([[0, 0], [10, 20], [20, 50], [30, 50]])
     salesData = numpy.array([[(0 * 24 + 0) * 3600, 0],
@@ -67,3 +161,46 @@ if __name__ == '__main__':
 
     invertedTest = f.interpolate(22500, invert=True)
     print (invertedTest)
+    assert invertedTest == (5 * 24 + 17) * 3600
+
+    # The inverse matches scanning y for the first exact match, and
+    # numpy.interp otherwise, for single targets and arrays
+    def scanned_inverse(profile, target):
+        locations = (profile.y == target)
+        if numpy.any(locations):
+            return profile.x[numpy.where(locations)][0]
+        return numpy.interp(target, profile.y, profile.x)
+
+    for profile in (function(data), f):
+        targets = numpy.concatenate([
+            profile.y, profile.y + 0.5, profile.y - 0.5,
+            numpy.linspace(profile.y[0] - 10, profile.y[-1] + 10, 1001)])
+        expected = [scanned_inverse(profile, target) for target in targets]
+        assert [profile.interpolate(target, invert=True)
+                for target in targets] == expected
+        assert profile.interpolate(targets, invert=True).tolist() == expected
+
+        targets = numpy.linspace(profile.x[0] - 10, profile.x[-1] + 10, 1001)
+        expected = numpy.interp(targets, profile.x, profile.y).tolist()
+        assert [profile.interpolate(target) for target in targets] == expected
+        assert [profile.interpolate(target) for target in targets.tolist()] \
+            == expected
+
+    # A periodic profile replaces splitting off whole weeks with numpy.modf
+    weekly = function(salesData, periodic=True)
+    dollars = numpy.random.default_rng(0).uniform(0, 100 * 30000, 1000)
+    dollars[:3] = [0, 30000, 45000]
+    expected = []
+    for dollar in dollars:
+        weeks = numpy.modf(dollar / 30000)
+        expected.append(weeks[1] * 7 * 86400 +
+                        f.interpolate(weeks[0] * 30000, invert=True))
+    assert numpy.allclose(weekly.interpolate(dollars, invert=True), expected)
+
+    times = weekly.interpolate(dollars, invert=True)
+    assert numpy.allclose(weekly.interpolate(times), dollars)
+    assert weekly.interpolate(7 * 86400 + 30 * 3600) == 30000 + 3000
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""
+process.py
+
+Processes for `DiscreteEventSimulator.Simulator`, written as generators.
+
+A process is a generator that yields what it waits for.  Yielding a number
+waits for that much simulated time.  Yielding a `Signal`, or another
+`Process`, waits until it is triggered, and the `yield` expression then
+evaluates to the value it was triggered with.  Yielding anything else raises
+`TypeError`, and yielding a negative number raises `ValueError`, from the
+event that resumed the process.  This covers what the SimPy
+models here used `env.timeout` and `start_delayed` for, on the same engine
+as the rest of the models.
+
+Each process reuses a single `Event`, rescheduled every time the process
+waits, and a single resume callback, so stepping a process creates no new
+objects.
+
+Example
+
+def place_order(env, database):
+    while True:
+        yield 86400
+        ...
+
+simulation = Simulator(0, 200)
+simulation.process(place_order(simulation, database), delay=10)
+simulation.run()
+"""
+
+import numbers
+
+
+class Signal(object):
+    """Something processes can wait for by yielding it.
+
+    Attributes:
+        simulator: The `Simulator` the signal belongs to
+        triggered: True once `succeed` has been called
+        value: The value the signal was triggered with
+    """
+
+    def __init__(self, simulator):
+        """Initialize the Signal object."""
+        self.simulator = simulator
+        self.triggered = False
+        self.value = None
+        self._waiters = []
+
+    def succeed(self, value=None):
+        """Trigger the signal, resuming every process waiting for it.
+
+        Waiting processes are resumed at the current time, in the order they
+        started waiting, after the event that triggered the signal.
+
+        Raises:
+            RuntimeError: if the signal has already been triggered
+        """
+        if self.triggered:
+            raise RuntimeError("A signal can only be triggered once")
+        self.triggered = True
+        self.value = value
+        waiters = self._waiters
+        self._waiters = []
+        for process in waiters:
+            process._wake(value)
+
+    def add_callback(self, callback, priority=1):
+        """Schedule `callback(env, value)` for when the signal is triggered.
+
+        This lets models written with plain callbacks wait for signals.  The
+        callback runs as an event at the time the signal is triggered, or now
+        if it already has been.
+        """
+        self._wait(_Callback(self.simulator, callback, priority))
+
+    def _wait(self, process):
+        if self.triggered:
+            process._wake(self.value)
+        else:
+            self._waiters.append(process)
+
+
+class _Callback(object):
+    # Waits for a signal on behalf of a callback
+
+    __slots__ = ('simulator', 'callback', 'priority')
+
+    def __init__(self, simulator, callback, priority):
+        self.simulator = simulator
+        self.callback = callback
+        self.priority = priority
+
+    def _wake(self, value):
+        simulator = self.simulator
+        simulator.schedule(simulator.time, self.priority, self.callback, value)
+
+
+class Process(Signal):
+    """A generator run by a `Simulator`.
+
+    A `Process` is also a `Signal`, triggered with the generator's return
+    value when it finishes, so processes can wait for each other.
+
+    Attributes:
+        generator: The generator being run
+        priority: Priority of the events that resume the process
+        event: The `Event` that next resumes the process, reused for every
+            step
+    """
+
+    def __init__(self, simulator, generator, delay=0, priority=1):
+        """Initialize the Process object and schedule its first step."""
+        Signal.__init__(self, simulator)
+        self.generator = generator
+        self.priority = priority
+        self._send = None
+        self._push = simulator.queue.push
+        self._sequence = simulator._sequence
+        self.event = simulator.schedule(simulator.time + delay, priority,
+                                        self._resume)
+
+    @property
+    def alive(self):
+        """bool: True until the generator has finished or been cancelled."""
+        return not self.triggered
+
+    @property
+    def event_callback(self):
+        """The generator resumed when `event` fires."""
+        return self.generator
+
+    def _wake(self, value):
+        if self.triggered:
+            # Cancelled while waiting
+            return
+        self._send = value
+        self.simulator.reschedule(self.event, self.simulator.time)
+
+    def _resume(self, env):
+        value = self._send
+        self._send = None
+        try:
+            target = self.generator.send(value)
+        except StopIteration as stop:
+            self.succeed(stop.value)
+            return
+        kind = type(target)
+        if kind is not int and kind is not float:
+            # Checked after the common int and float delays, as the ABC check
+            # is slow
+            if isinstance(target, Signal):
+                target._wait(self)
+                return
+            if not isinstance(target, numbers.Real):
+                raise TypeError("A process can only yield a delay or a "
+                                "Signal, not {!r}".format(target))
+        if not target >= 0:
+            raise ValueError("A process can't wait for a negative delay, "
+                             "{!r}".format(target))
+        # The same as env.reschedule for an event that has just run
+        event = self.event
+        event.time = env.time + target
+        event.sequence = next(self._sequence)
+        event.valid = True
+        event.simulator = env
+        self._push(event)
+
+    def cancel(self):
+        """Stop the process.  Processes waiting for it are not resumed."""
+        if not self.triggered:
+            self.triggered = True
+            self._waiters = []
+            self.simulator.cancel(self.event)
+            self.generator.close()
+
+
+def test():
+    """ Run a suite of test functions """
+
+    from DiscreteEventSimulator import Simulator
+    # The classes the simulator uses, rather than those of __main__
+    from process import Signal
+
+    log = []
+
+    def clock(env, name, interval):
+        while True:
+            log.append((env.time, name))
+            yield interval
+
+    def worker(env, signal):
+        value = yield signal
+        log.append((env.time, 'worker', value))
+        yield 5
+        return 'done'
+
+    def manager(env, signal, process):
+        yield 3
+        signal.succeed('go')
+        result = yield process
+        log.append((env.time, 'manager', result))
+
+    simulation = Simulator(0, 10)
+    fast = simulation.process(clock(simulation, 'fast', 2), delay=1)
+    simulation.process(clock(simulation, 'slow', 4))
+    signal = Signal(simulation)
+    process = simulation.process(worker(simulation, signal))
+    simulation.process(manager(simulation, signal, process))
+    simulation.schedule(6, 0, lambda env: fast.cancel())
+    never = Signal(simulation)
+    cancelled = simulation.process(worker(simulation, never))
+    simulation.schedule(7, 0, lambda env: (cancelled.cancel(),
+                                           never.succeed('late')))
+    simulation.run()
+
+    print(log)
+    assert log == [(0, 'slow'), (1, 'fast'), (3, 'fast'), (3, 'worker', 'go'),
+                   (4, 'slow'), (5, 'fast'), (8, 'slow'),
+                   (8, 'manager', 'done')]
+    assert not process.alive and process.value == 'done'
+    assert not fast.alive
+
+    # Callbacks can wait for signals too
+    callback_log = []
+    callback_simulation = Simulator(0, 10)
+    ready = Signal(callback_simulation)
+    ready.add_callback(lambda env, value: callback_log.append((env.time,
+                                                               value)))
+    callback_simulation.schedule(4, 1, lambda env: ready.succeed('ready'))
+    callback_simulation.run()
+    ready.add_callback(lambda env, value: callback_log.append('late'))
+    callback_simulation.run()
+    assert callback_log == [(4, 'ready'), 'late']
+
+    # Waiting for a finished process resumes straight away, and stepping a
+    # process reuses its event
+    events = set()
+
+    def waiter(env):
+        yield process
+        for _ in range(3):
+            events.add(id(env.current_event))
+            yield 1
+
+    simulation.extend_end_time(20)
+    simulation.process(waiter(simulation))
+    simulation.run(until=15)
+    assert len(events) == 1
+
+    # Only delays that don't go back in time and signals can be yielded
+    def bad(env, target):
+        yield 1
+        yield target
+
+    for target, error in ((-1, ValueError), ('soon', TypeError)):
+        bad_simulation = Simulator(0, 10)
+        bad_simulation.process(bad(bad_simulation, target))
+        try:
+            bad_simulation.run()
+        except error:
+            assert bad_simulation.time == 1
+        else:
+            raise AssertionError("{!r} was accepted".format(target))
+
+
+if __name__ == '__main__':
+    test()
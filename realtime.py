@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+
+"""
+realtime.py
+
+Run a `Simulator` in step with the wall clock under asyncio.
+
+`RealTimeRunner` runs the events of a simulator when the wall clock reaches
+their time, scaled by a speed factor, so a simulated day can be played out in
+a minute to drive a live dashboard or hardware in the loop.  Between events
+it waits on the asyncio event loop, so other coroutines, such as websocket
+pushes or file writes, keep running, and they can schedule new events into
+the simulation while it runs.  Events that run later than their wall clock
+time, because a callback or the event loop was busy, are counted and their
+lag is reported.
+
+Example
+
+simulation = Simulator(0, 86400)
+...
+runner = RealTimeRunner(simulation, speed=1440)   # a day in a minute
+
+async def dashboard():
+    while runner.running:
+        await push(simulation.state)
+        await asyncio.sleep(1)
+
+async def main():
+    await asyncio.gather(runner.run(), dashboard())
+
+asyncio.run(main())
+print(runner.lag_report())
+"""
+
+import asyncio
+import time
+from array import array
+
+import numpy
+
+
+class RealTimeRunner(object):
+    """Paces the events of a `Simulator` against the wall clock.
+
+    Attributes:
+        simulator: The `Simulator` being run
+        speed: Simulated time units per wall clock second.  Infinity runs
+            events as fast as possible while still yielding to the event
+            loop between events.
+        tolerance: Events run more than this many wall clock seconds late
+            are counted as late
+        running: True while `run` is running
+        events: Number of events run
+        lags: Wall clock seconds each event ran after its due time
+    """
+
+    def __init__(self, simulator, speed=1.0, tolerance=0.01):
+        """Initialize the RealTimeRunner object."""
+        _check_speed(speed)
+        self.simulator = simulator
+        self.speed = speed
+        self.tolerance = tolerance
+        self.running = False
+        self.events = 0
+        self.lags = array('d')
+        self._clock = time.monotonic
+        self._sleep = asyncio.sleep
+        self._wall_start = None
+        self._simulated_start = None
+        self._wakeup = None
+        self._stopping = False
+
+    def _anchor(self):
+        # Line the current simulated time up with the wall clock now
+        self._wall_start = self._clock()
+        self._simulated_start = self.simulator.time
+
+    def now(self):
+        """Return the simulated time the wall clock has reached.
+
+        At infinite speed this is the simulated time itself.
+        """
+        if self._wall_start is None or self.speed == float('inf'):
+            return self.simulator.time
+        elapsed = (self._clock() - self._wall_start) * self.speed
+        return max(self.simulator.time, self._simulated_start + elapsed)
+
+    def due(self, simulated_time):
+        """Return the wall clock time, in `time.monotonic` seconds, at which
+        `simulated_time` is reached."""
+        return self._wall_start + ((simulated_time - self._simulated_start) /
+                                   self.speed)
+
+    def set_speed(self, speed):
+        """Change the speed, carrying on from the current simulated time.
+
+        Raises:
+            ValueError: if `speed` isn't greater than zero
+        """
+        _check_speed(speed)
+        if self._wall_start is not None:
+            self._simulated_start = self.now()
+            self._wall_start = self._clock()
+        self.speed = speed
+        self._wake()
+
+    def schedule(self, time, priority, callback, *args, **kwargs):
+        """Schedule an event while the simulation is running.
+
+        Use this rather than `Simulator.schedule` from other coroutines, so
+        that the runner notices an event due before the one it is waiting
+        for.  A `time` of None schedules the event for `now()`.
+
+        Returns: the scheduled `Event`
+        """
+        if time is None:
+            time = self.now()
+        event = self.simulator.schedule(time, priority, callback, *args,
+                                        **kwargs)
+        self._wake()
+        return event
+
+    def stop(self):
+        """Make `run` return before it runs another event."""
+        self._stopping = True
+        self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _sleep_until(self, wall_time):
+        # Sleep until `wall_time`, or until an event is scheduled or the
+        # speed changes.  Returns True if the full time passed.
+        delay = wall_time - self._clock()
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return True
+        self._wakeup.clear()
+        sleeper = asyncio.ensure_future(self._sleep(delay))
+        waiter = asyncio.ensure_future(self._wakeup.wait())
+        done, pending = await asyncio.wait(
+            (sleeper, waiter), return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return waiter not in done
+
+    async def run(self, until=None):
+        """Run the simulation in step with the wall clock.
+
+        Args:
+            until: Stop before running any event later than this time.  If
+                there is none, the simulated time is advanced to `until`
+                once the wall clock reaches it.  Without `until`, the runner
+                waits for new events until `end_time` is reached or `stop`
+                is called.
+
+        Returns:
+            int: The number of events run
+        """
+        simulator = self.simulator
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.running = True
+        self._anchor()
+        count = 0
+        try:
+            while not self._stopping:
+                # Read every time round, as `set_speed` may have been called
+                infinite = self.speed == float('inf')
+                horizon = simulator.end_time
+                if until is not None:
+                    horizon = min(horizon, until)
+                event = simulator.peek()
+                if event is None or event.time > horizon:
+                    if until is None and event is None and \
+                            horizon == float('inf'):
+                        # Nothing to do until an event is injected
+                        self._wakeup.clear()
+                        await self._wakeup.wait()
+                        continue
+                    if infinite or await self._sleep_until(
+                            self.due(horizon)):
+                        if simulator.time < horizon:
+                            simulator.time = horizon
+                        break
+                    continue
+
+                if not infinite:
+                    due = self.due(event.time)
+                    if not await self._sleep_until(due):
+                        # Woken early, the next event may have changed
+                        continue
+                    lag = self._clock() - due
+                    self.lags.append(lag if lag > 0 else 0.0)
+                simulator.step()
+                count += 1
+                if infinite:
+                    await asyncio.sleep(0)
+        finally:
+            self.running = False
+            self._wakeup = None
+            self.events += count
+        return count
+
+    def lag_report(self, percentiles=(50, 90, 99)):
+        """Return how far behind the wall clock events ran.
+
+        Returns:
+            dict: `events` run, `late` events more than `tolerance` behind,
+            the `mean_lag` and `max_lag` in wall clock seconds, and a
+            `p<n>` entry for each of the `percentiles`
+        """
+        lags = numpy.frombuffer(self.lags) if self.lags else numpy.zeros(1)
+        report = {'events': self.events,
+                  'late': int(numpy.count_nonzero(lags > self.tolerance)),
+                  'mean_lag': float(lags.mean()),
+                  'max_lag': float(lags.max())}
+        for percentile, value in zip(percentiles,
+                                     numpy.percentile(lags, percentiles)):
+            report['p{}'.format(percentile)] = float(value)
+        return report
+
+
+def _check_speed(speed):
+    if not speed > 0:
+        raise ValueError("The speed must be greater than zero")
+
+
+class _FakeTime(object):
+    # Stands in for the wall clock in tests, jumping straight to each wake
+    # time.  `alarms` are `(time, function)` pairs, in time order, called
+    # when a sleep passes their time.
+
+    def __init__(self):
+        self.now = 0.0
+        self.wakes = []
+        self.alarms = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, delay):
+        target = self.now + delay
+        while self.alarms and self.alarms[0][0] < target:
+            self.now, function = self.alarms.pop(0)
+            function()
+            # Give a woken runner the chance to cancel the sleep
+            for _ in range(10):
+                await asyncio.sleep(0)
+        self.now = target
+        self.wakes.append(target)
+
+
+def test():
+    """ Run a suite of test functions """
+
+    from DiscreteEventSimulator import Simulator
+
+    log = []
+
+    def tick(env, name):
+        log.append((env.time, name))
+
+    # Times are multiples of 1 / 1024 seconds, so they are exact
+    fake = _FakeTime()
+
+    def slow(env):
+        fake.now += 128 / 1024
+
+    simulation = Simulator(0, 1000)
+    for event_time in range(0, 200, 16):
+        simulation.schedule(event_time, 1, tick, 'tick')
+    simulation.schedule(64, 0, slow)
+    runner = RealTimeRunner(simulation, speed=1024)
+    runner._clock = fake.clock
+    runner._sleep = fake.sleep
+
+    def inject():
+        runner.schedule(None, 2, tick, 'injected')
+        runner.schedule(runner.now() + 1, 2, tick, 'soon')
+
+    # Injected while the runner sleeps until the tick at 48
+    fake.alarms.append((40 / 1024, inject))
+
+    count = asyncio.run(runner.run(until=200))
+    report = runner.lag_report()
+    print(count, report)
+
+    assert count == 16
+    assert simulation.time == 200
+    assert fake.wakes == [wake / 1024 for wake in (16, 32, 41, 48, 64, 200)]
+    assert [event_time for event_time, name in log
+            if name != 'tick'] == [40, 41]
+    assert [name for _, name in log].count('tick') == 13
+
+    # The slow callback at 64 delays the ticks after it until 192
+    assert list(runner.lags) == [0.0] * 7 + \
+        [lag / 1024 for lag in range(128, -1, -16)]
+    assert report['late'] == 8 and report['max_lag'] == 0.125
+
+    # Slowing down from infinite speed while running paces the later events
+    def slow_down(env):
+        runner.set_speed(1024)
+
+    log.clear()
+    fake.wakes.clear()
+    for event_time in range(200, 300, 10):
+        simulation.schedule(event_time, 1, tick, 'fast')
+    simulation.schedule(250, 2, slow_down)
+    runner.speed = float('inf')
+    start = fake.now
+    assert asyncio.run(runner.run(until=300)) == 11
+    assert fake.wakes == [start + wake / 1024 for wake in (10, 20, 30, 40, 50)]
+    assert len(log) == 10
+
+    # Speeds must be positive
+    for speed in (0, -1):
+        try:
+            runner.set_speed(speed)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("A speed of {} was accepted".format(speed))
+
+
+if __name__ == '__main__':
+    test()
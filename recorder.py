@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+recorder.py
+
+Records `(time, value)` samples of simulation state into growable NumPy
+arrays.
+
+Samples are stored as rows of an n x 2 array, so `Recorder.data` can hand
+them to `retail_analyser.zero_order_resample` as the 2 x n array it expects
+by transposing a view, without copying.  Samples must be recorded in time
+order, which they are when recorded from a running `Simulator`.
+
+The array normally lives in memory.  Given a `path`, it is a memory-mapped
+file instead, grown one chunk at a time, so very long runs are limited by
+disk rather than memory.  Given a SQLite `database`, the samples are also
+written to it with one `executemany` and one commit per chunk, rather than
+one INSERT and commit per sample.
+"""
+
+import os
+
+import numpy
+
+
+class Recorder(object):
+    """Growable, array-backed log of `(time, value)` samples.
+
+    Attributes:
+        chunk_size: Number of rows added to a memory-mapped file at a time,
+            and number of samples written to SQLite at a time
+        path: File backing the samples, or None if they are kept in memory
+        database: SQLite connection the samples are copied to, or None
+        insert_sql: Statement inserting one `(time, value)` sample into
+            `database`, such as "INSERT INTO SOH_LOG VALUES(null, ?, ?)"
+    """
+
+    def __init__(self, capacity=1024, path=None, database=None,
+                 insert_sql=None, chunk_size=65536):
+        """Initialize the Recorder object."""
+        if (database is None) != (insert_sql is None):
+            raise ValueError("database and insert_sql must be given together")
+        self.chunk_size = chunk_size
+        self.path = path
+        self.database = database
+        self.insert_sql = insert_sql
+        self._size = 0
+        self._written = 0
+        if path is None:
+            self._rows = numpy.empty((capacity, 2))
+        else:
+            # Truncate any previous recording
+            open(path, 'wb').close()
+            self._rows = self._map(chunk_size)
+
+    def __len__(self):
+        return self._size
+
+    def _map(self, capacity):
+        # Grow the backing file to `capacity` rows and map it
+        with open(self.path, 'r+b') as backing_file:
+            backing_file.truncate(capacity * 2 * 8)
+        return numpy.memmap(self.path, dtype=float, mode='r+',
+                            shape=(capacity, 2))
+
+    def _grow(self):
+        rows = self._rows
+        if self.path is None:
+            grown = numpy.empty((2 * len(rows), 2))
+            grown[:len(rows)] = rows
+            self._rows = grown
+        else:
+            rows.flush()
+            self._rows = self._map(len(rows) + self.chunk_size)
+
+    def append(self, time, value):
+        """Record `value` at `time`."""
+        size = self._size
+        if size == len(self._rows):
+            self._grow()
+        self._rows[size] = (time, value)
+        self._size = size + 1
+        if (self.database is not None and
+                size + 1 - self._written >= self.chunk_size):
+            self.flush()
+
+    def flush(self):
+        """Write samples not yet in the database, and the memory map, out."""
+        if self.database is not None and self._written < self._size:
+            rows = self._rows[self._written:self._size].tolist()
+            self.database.executemany(self.insert_sql, rows)
+            self.database.commit()
+            self._written = self._size
+        if self.path is not None:
+            self._rows.flush()
+
+    def data(self):
+        """Return the samples as a 2 x n array of times and values.
+
+        The array is a view of the recorder's storage.  It stays valid after
+        more samples are recorded, but doesn't include them.
+        """
+        return self._rows[:self._size].T
+
+    @property
+    def times(self):
+        """numpy.ndarray: View of the times of the samples."""
+        return self._rows[:self._size, 0]
+
+    @property
+    def values(self):
+        """numpy.ndarray: View of the recorded values."""
+        return self._rows[:self._size, 1]
+
+    def save(self, path):
+        """Save the samples to a `.npy` file as a 2 x n array."""
+        numpy.save(path, self.data())
+
+
+def test():
+    """ Run a suite of test functions """
+
+    import sqlite3
+    import tempfile
+    from retail_analyser import zero_order_resample
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = sqlite3.connect(':memory:')
+        database.execute('CREATE TABLE LOG (ID INTEGER PRIMARY KEY, '
+                         'TIME REAL, VALUE REAL)')
+
+        recorders = [
+            Recorder(capacity=2),
+            Recorder(path=os.path.join(directory, 'log.dat'), chunk_size=3),
+            Recorder(database=database,
+                     insert_sql='INSERT INTO LOG VALUES(null, ?, ?)',
+                     chunk_size=4)]
+        samples = [(1, 1), (5, 2), (10, 3), (11, 4), (12, 5), (20, 6)]
+        for recorder in recorders:
+            for time, value in samples:
+                recorder.append(time, value)
+            recorder.flush()
+
+            data = recorder.data()
+            assert data.shape == (2, 6)
+            assert numpy.shares_memory(data, recorder._rows)
+            print(zero_order_resample(data, numpy.array([-10, 1, 2, 10, 30])))
+            assert zero_order_resample(
+                data, numpy.array([-10, 1, 2, 10, 30])).tolist() == \
+                [1, 1, 1, 3, 6]
+
+        assert database.execute('SELECT TIME, VALUE FROM LOG').fetchall() == \
+            [(float(time), float(value)) for time, value in samples]
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+replication.py
+
+Run independent replications of a simulation model on a pool of processes.
+
+Each replication builds its own `Simulator` from a seed, runs it, and writes
+a fixed size NumPy result straight into an array in shared memory, so large
+results are never pickled back to the parent process.  Replication seeds are
+spawned from a single `numpy.random.SeedSequence`, so every replication gets
+an independent, reproducible stream no matter which process runs it or how
+many processes there are.
+
+Example
+
+def build_model(seed):
+    simulator = Simulator(0, simulation_period, seed=seed)
+    ...
+    return simulator
+
+def collect(simulator):
+    return retail_analyser.zero_order_resample(simulator.log, sample_points)
+
+results = run_replications(build_model, collect, 100,
+                           (len(sample_points),), seed=42)
+
+`build_model` and `collect` are sent to the worker processes, so they need to
+be functions defined at the top level of a module.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+
+# Shared result array of the current worker process
+_results = None
+_shared_memory = None
+
+
+def replication_seeds(seed, number_of_replications):
+    """Return one `numpy.random.SeedSequence` per replication.
+
+    Replication `n` always receives the same seed for a given `seed`, however
+    many replications are run.
+    """
+    return numpy.random.SeedSequence(seed).spawn(number_of_replications)
+
+
+def _attach(name, shape, dtype):
+    # Process pool initializer, map the shared result array
+    global _results, _shared_memory
+    _shared_memory = shared_memory.SharedMemory(name=name)
+    _results = numpy.ndarray(shape, dtype=dtype, buffer=_shared_memory.buf)
+
+
+def _run_replication(build_model, collect, index, seed):
+    simulator = build_model(seed)
+    simulator.run()
+    _results[index] = collect(simulator)
+    return index
+
+
+def run_replications(build_model,
+                     collect,
+                     number_of_replications,
+                     result_shape,
+                     dtype=float,
+                     seed=None,
+                     workers=None):
+    """Run seeded replications of a model in parallel.
+
+    Args:
+        build_model: Function taking a `numpy.random.SeedSequence` and
+            returning a `Simulator` ready to run
+        collect: Function taking the `Simulator` after its run and returning
+            an array of shape `result_shape`
+        number_of_replications: Number of replications to run
+        result_shape: Shape of the result of each replication
+        dtype: NumPy data type of the results
+        seed: Root seed for the replication seeds.  If None, fresh entropy is
+            used and the replications aren't reproducible.
+        workers: Number of worker processes, the number of CPUs if None.  With
+            one worker the replications are run in this process.
+
+    Returns:
+        numpy.ndarray: results of shape
+        `(number_of_replications,) + result_shape`, with row `n` holding the
+        result of replication `n`
+    """
+    result_shape = tuple(numpy.atleast_1d(result_shape).tolist())
+    shape = (number_of_replications,) + result_shape
+    dtype = numpy.dtype(dtype)
+    seeds = replication_seeds(seed, number_of_replications)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        results = numpy.empty(shape, dtype=dtype)
+        for index, replication_seed in enumerate(seeds):
+            simulator = build_model(replication_seed)
+            simulator.run()
+            results[index] = collect(simulator)
+        return results
+
+    size = max(1, int(numpy.prod(shape)) * dtype.itemsize)
+    block = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_attach,
+                                 initargs=(block.name, shape, dtype)) as pool:
+            chunk_size = max(1, number_of_replications // (4 * workers))
+            for _ in pool.map(_run_replication,
+                              [build_model] * number_of_replications,
+                              [collect] * number_of_replications,
+                              range(number_of_replications),
+                              seeds,
+                              chunksize=chunk_size):
+                pass
+        results = numpy.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+    return results
+
+
+def _test_model(seed):
+    from DiscreteEventSimulator import Simulator
+
+    def arrival(env):
+        env.count += 1
+        env.log.append(env.count)
+        env.schedule(env.time + env.stream('arrivals').exponential(1.0), 1,
+                     arrival)
+
+    simulator = Simulator(0, 100, count=0, log=[], seed=seed)
+    simulator.schedule(0, 1, arrival)
+    return simulator
+
+
+def _test_collect(simulator):
+    return [simulator.count, simulator.time]
+
+
+def test():
+    """ Run a suite of test functions """
+
+    serial = run_replications(_test_model, _test_collect, 12, 2, seed=7,
+                              workers=1)
+    parallel = run_replications(_test_model, _test_collect, 12, 2, seed=7,
+                                workers=3)
+    print(serial[:, 0])
+    assert numpy.array_equal(serial, parallel)
+    assert len(numpy.unique(serial[:, 0])) > 1
+
+
+if __name__ == '__main__':
+    test()
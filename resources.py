@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+"""
+resources.py
+
+Containers of stock and stores of items shared by the events of a
+`Simulator`.
+
+`Container.get` and `Container.put` return a `Request`, a `process.Signal`
+that is triggered once the request has been filled.  A request that can't
+be filled straight away, such as a customer backorder when there is no stock,
+waits in a queue of waiters, first in first out or by priority.  Waiters are
+only looked at when the level changes in a way that could fill the one at the
+head of the queue, so nothing polls, and the number of events stays
+proportional to the real changes of state.
+
+A process waits for a request by yielding it, and a callback with
+`Request.add_callback`.  `Container.try_get` takes stock only if it is there,
+for lost sales.
+
+Example
+
+def customer(env):
+    request = env.stock.get(1)
+    if not request.triggered:
+        env.backorders += 1
+        request.add_callback(collect_backorder)
+
+simulation = Simulator(0, 1000, backorders=0)
+simulation.stock = Container(simulation, level=50)
+"""
+
+import heapq
+import itertools
+from collections import deque
+
+from process import Signal
+
+
+class Request(Signal):
+    """A request to get or put an amount, triggered once it is filled.
+
+    Attributes:
+        amount: Amount requested, or the item for a `Store.put`
+        priority: Lower priorities are filled first by a container or store
+            with `priority_order`
+        cancelled: True if the request was cancelled before it was filled
+    """
+
+    def __init__(self, simulator, amount, priority):
+        """Initialize the Request object."""
+        Signal.__init__(self, simulator)
+        self.amount = amount
+        self.priority = priority
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop waiting.  A request that has been filled can't be cancelled.
+
+        Returns:
+            bool: True if the request was waiting and is now cancelled
+        """
+        if self.triggered or self.cancelled:
+            return False
+        self.cancelled = True
+        return True
+
+
+class _Waiters(object):
+    # Requests waiting to be filled, first in first out or by priority.
+    # Cancelled requests are dropped lazily when they reach the head.
+
+    def __init__(self, priority_order):
+        self._priority_order = priority_order
+        self._sequence = itertools.count()
+        if priority_order:
+            self._heap = []
+        else:
+            self._queue = deque()
+
+    def __bool__(self):
+        return self.head() is not None
+
+    def __len__(self):
+        if self._priority_order:
+            requests = (entry[2] for entry in self._heap)
+        else:
+            requests = self._queue
+        return sum(not request.cancelled for request in requests)
+
+    def append(self, request):
+        if self._priority_order:
+            heapq.heappush(self._heap, (request.priority,
+                                        next(self._sequence), request))
+        else:
+            self._queue.append(request)
+
+    def head(self):
+        if self._priority_order:
+            heap = self._heap
+            while heap and heap[0][2].cancelled:
+                heapq.heappop(heap)
+            return heap[0][2] if heap else None
+        queue = self._queue
+        while queue and queue[0].cancelled:
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def pop(self):
+        if self._priority_order:
+            return heapq.heappop(self._heap)[2]
+        return self._queue.popleft()
+
+
+class Container(object):
+    """An amount of something, such as the stock on hand of a product.
+
+    Attributes:
+        simulator: The `Simulator` the container belongs to
+        level: The amount in the container
+        capacity: The most the container can hold
+        getters: `Request` objects waiting to get an amount
+        putters: `Request` objects waiting to put an amount
+    """
+
+    def __init__(self, simulator, level=0, capacity=float('inf'),
+                 priority_order=False):
+        """Initialize the Container object.
+
+        Args:
+            simulator: The `Simulator` the container belongs to
+            level: The amount in the container to start with
+            capacity: The most the container can hold
+            priority_order: Fill waiting requests in order of priority, and
+                in the order they were made for equal priorities, rather than
+                first in, first out
+        """
+        if not 0 <= level <= capacity:
+            raise ValueError("The level must be between 0 and the capacity")
+        self.simulator = simulator
+        self.level = level
+        self.capacity = capacity
+        self.getters = _Waiters(priority_order)
+        self.putters = _Waiters(priority_order)
+
+    def get(self, amount, priority=0):
+        """Take `amount` out of the container, waiting until there is enough.
+
+        Returns:
+            Request: triggered with the amount once it has been taken
+        """
+        if amount > self.capacity:
+            raise ValueError("The amount can never fit in the container")
+        request = Request(self.simulator, amount, priority)
+        self.getters.append(request)
+        self._fill()
+        return request
+
+    def put(self, amount, priority=0):
+        """Add `amount` to the container, waiting until there is room.
+
+        Returns:
+            Request: triggered with the amount once it has been added
+        """
+        if amount > self.capacity:
+            raise ValueError("The amount can never fit in the container")
+        request = Request(self.simulator, amount, priority)
+        self.putters.append(request)
+        self._fill()
+        return request
+
+    def try_get(self, amount):
+        """Take `amount` only if it is there and no one is waiting for it.
+
+        Returns:
+            bool: True if the amount was taken
+        """
+        if amount <= self.level and not self.getters:
+            self.level -= amount
+            self._fill()
+            return True
+        return False
+
+    def _fill(self):
+        # Fill waiting requests from the heads of the queues until neither
+        # head can be filled.  Each fill can make room for the other queue.
+        getters = self.getters
+        putters = self.putters
+        while True:
+            getter = getters.head()
+            if getter is not None and getter.amount <= self.level:
+                getters.pop()
+                self.level -= getter.amount
+                getter.succeed(getter.amount)
+                continue
+            putter = putters.head()
+            if putter is not None and \
+                    self.level + putter.amount <= self.capacity:
+                putters.pop()
+                self.level += putter.amount
+                putter.succeed(putter.amount)
+                continue
+            break
+
+
+class Store(object):
+    """A collection of items, such as cartons with their own expiry dates.
+
+    Items are got in the order they were put.
+
+    Attributes:
+        simulator: The `Simulator` the store belongs to
+        items: The items in the store, oldest first
+        capacity: The most items the store can hold
+        getters: `Request` objects waiting to get an item
+        putters: `Request` objects waiting to put an item
+    """
+
+    def __init__(self, simulator, capacity=float('inf'),
+                 priority_order=False):
+        """Initialize the Store object.
+
+        Args:
+            simulator: The `Simulator` the store belongs to
+            capacity: The most items the store can hold
+            priority_order: Fill waiting requests in order of priority rather
+                than first in, first out
+        """
+        self.simulator = simulator
+        self.items = deque()
+        self.capacity = capacity
+        self.getters = _Waiters(priority_order)
+        self.putters = _Waiters(priority_order)
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, priority=0):
+        """Take the oldest item, waiting until there is one.
+
+        Returns:
+            Request: triggered with the item once it has been taken
+        """
+        request = Request(self.simulator, None, priority)
+        self.getters.append(request)
+        self._fill()
+        return request
+
+    def put(self, item, priority=0):
+        """Add `item`, waiting until there is room.
+
+        Returns:
+            Request: triggered with the item once it has been added
+        """
+        request = Request(self.simulator, item, priority)
+        self.putters.append(request)
+        self._fill()
+        return request
+
+    def _fill(self):
+        getters = self.getters
+        putters = self.putters
+        items = self.items
+        while True:
+            if items and getters.head() is not None:
+                getters.pop().succeed(items.popleft())
+                continue
+            putter = putters.head()
+            if putter is not None and len(items) < self.capacity:
+                putters.pop()
+                items.append(putter.amount)
+                putter.succeed(putter.amount)
+                continue
+            break
+
+
+def test():
+    """ Run a suite of test functions """
+
+    from DiscreteEventSimulator import Simulator
+
+    # Backorders wait for deliveries without any polling events
+    log = []
+
+    def customer(env, name, amount):
+        request = env.stock.get(amount)
+        if request.triggered:
+            log.append((env.time, name, 'served'))
+        else:
+            request.add_callback(
+                lambda env, amount: log.append((env.time, name, 'backorder')))
+
+    def delivery(env, amount):
+        env.stock.put(amount)
+
+    simulation = Simulator(0, 100)
+    simulation.stock = Container(simulation, level=3)
+    simulation.schedule(1, 1, customer, 'a', 2)
+    simulation.schedule(2, 1, customer, 'b', 2)
+    simulation.schedule(3, 1, customer, 'c', 1)
+    simulation.schedule(10, 0, delivery, 1)
+    simulation.schedule(20, 0, delivery, 5)
+    events = simulation.run()
+
+    print(log)
+    assert log == [(1, 'a', 'served'), (10, 'b', 'backorder'),
+                   (20, 'c', 'backorder')]
+    assert simulation.stock.level == 4
+    # Five scheduled events and one per filled backorder
+    assert events == 7
+
+    # By priority, the most important waiter is filled first, and a
+    # cancelled request is skipped
+    simulation = Simulator(0, 100)
+    stock = Container(simulation, priority_order=True)
+    low = stock.get(1, priority=5)
+    high = stock.get(1, priority=1)
+    cancelled = stock.get(1, priority=0)
+    assert cancelled.cancel()
+    stock.put(1)
+    assert high.triggered and not low.triggered
+    assert not stock.try_get(1)
+    stock.put(2)
+    assert low.triggered and stock.level == 1 and stock.try_get(1)
+
+    # Puts wait for room, and processes can wait on requests
+    taken = []
+
+    def consumer(env, store):
+        while True:
+            item = yield store.get()
+            taken.append((env.time, item))
+            yield 5
+
+    def producer(env, store):
+        for item in range(4):
+            yield store.put(item)
+            log.append((env.time, 'put', item))
+
+    log = []
+    simulation = Simulator(0, 100)
+    store = Store(simulation, capacity=1)
+    simulation.process(producer(simulation, store))
+    simulation.process(consumer(simulation, store), delay=1)
+    simulation.run()
+    print(taken, log)
+    assert taken == [(1, 0), (6, 1), (11, 2), (16, 3)]
+    assert [entry[0] for entry in log] == [0, 1, 6, 11]
+
+
+if __name__ == '__main__':
+    test()
@@ -59,7 +59,13 @@ def zero_order_resample(data_set, sample_points):
     return (resampled_data)
 
 
-def folded_monte_carlo(percentiles, data, number_of_folds):
+# Up to this many folds, sorting each sample instance is faster than
+# selecting its percentiles
+SORT_FOLDS = 512
+
+
+def folded_monte_carlo(percentiles, data, number_of_folds=None,
+                       samples_per_fold=None):
     """
     folded_monte_carlo take a long array of data and and folds it to simulate
     multiple trials.  This data is then sorted.  Rows are then extracted based
@@ -104,30 +110,285 @@ def folded_monte_carlo(percentiles, data, number_of_folds):
         [39, 48, 32, 40]  80 percent of the time
         [41, 50, 44, 44] 100 percent of the time
 
-    """
+    Only the selected rows are needed, so rather than fully sorting each
+    sample instance, numpy.partition places just those order statistics,
+    and the minimum and maximum are found directly.  With few folds a sort is
+    cheap and is used instead.  Sample instances are processed in blocks, so
+    a memory-mapped series is never copied into memory all at once.
+
+    data can also be a 2 dimensional array holding one series per row, for
+    example one per SKU.  The result then has one set of selected rows per
+    series, with shape (series, percentiles, samples per fold).
 
-    # Convert the data from one long array into a rectangular array
-    # The reshpaed_data array and the data array must have the same number
-    # of elements
-    reshaped_data = data.reshape(number_of_folds, -1)
+    The fold length is samples_per_fold if given, otherwise the length of
+    the series divided by number_of_folds, rounded up.  If the series doesn't
+    end on a fold boundary, the last fold is partial and only the sample
+    instances it covers get an extra value.  With 10 values and 4 samples per
+    fold
 
-    # Sort the data at each sample instance
-    sorted_data = numpy.sort(reshaped_data, axis=0)
+        [12, 50, 19, 4, 14, 48, 32, 22, 39, 31]
 
-    # Conceptually, number of rows makes more sense from this point forward
-    number_of_rows = number_of_folds
+    is folded as
 
-    # Use the values of the percentiles array to determine what rows of the
-    # sorted_data array to select
-    records_to_select = (numpy.rint(percentiles * (number_of_rows - 1)
-                         / 100)).astype(int)
+        [[12, 50, 19,  4],
+         [14, 48, 32, 22],
+         [39, 31]]
 
-    # extract percentile data from the sorted_data array
-    selected_data = sorted_data[records_to_select, :]
+    so the first two sample instances have three values and the last two
+    have two.
+
+    """
 
+    data = numpy.asarray(data)
+    series = data if data.ndim == 2 else data.reshape(1, -1)
+    number_of_series, length = series.shape
+
+    if samples_per_fold is None:
+        samples_per_fold = -(-length // number_of_folds)
+    complete_folds, remainder = divmod(length, samples_per_fold)
+    if number_of_folds is not None and \
+            complete_folds + bool(remainder) != number_of_folds:
+        raise ValueError("The data can't be split into number_of_folds folds")
+
+    selected_data = numpy.empty((number_of_series, len(percentiles),
+                                 samples_per_fold), dtype=series.dtype)
+
+    # Sample instances covered by the partial fold have one more row
+    folded = series[:, :complete_folds * samples_per_fold].reshape(
+        number_of_series, complete_folds, samples_per_fold)
+    groups = [(slice(remainder, samples_per_fold), complete_folds)]
+    if remainder:
+        groups.insert(0, (slice(0, remainder), complete_folds + 1))
+
+    for columns, number_of_rows in groups:
+        # Use the values of the percentiles array to determine what rows of
+        # the sorted data to select
+        records_to_select = (numpy.rint(percentiles * (number_of_rows - 1)
+                             / 100)).astype(int)
+        unique_records, positions = numpy.unique(records_to_select,
+                                                 return_inverse=True)
+
+        # Work through blocks of about a million values at a time
+        block = max(1, 2 ** 20 // (number_of_series * number_of_rows))
+        for start in range(columns.start, columns.stop, block):
+            stop = min(start + block, columns.stop)
+            values = folded[:, :, start:stop]
+            if number_of_rows > complete_folds:
+                last_fold = series[:, complete_folds * samples_per_fold +
+                                   start:complete_folds * samples_per_fold +
+                                   stop]
+                values = numpy.concatenate(
+                    [values, last_fold[:, numpy.newaxis, :]], axis=1)
+
+            if number_of_rows <= SORT_FOLDS:
+                sorted_data = numpy.sort(values, axis=1)
+                selected_data[:, :, start:stop] = \
+                    sorted_data[:, records_to_select]
+                continue
+
+            # Copy each sample instance into a contiguous row.  Partitioning
+            # a row once per record, from the highest record down, is faster
+            # than one partition call with several records.
+            rows = numpy.ascontiguousarray(values.transpose(0, 2, 1))
+            selected = numpy.empty((number_of_series, len(unique_records),
+                                    stop - start), dtype=rows.dtype)
+            unsorted = number_of_rows
+            for index in range(len(unique_records) - 1, -1, -1):
+                record = unique_records[index]
+                if record == number_of_rows - 1:
+                    selected[:, index] = rows.max(axis=2)
+                elif record == 0:
+                    selected[:, index] = rows[:, :, :unsorted].min(axis=2)
+                else:
+                    rows[:, :, :unsorted].partition(record, axis=2)
+                    selected[:, index] = rows[:, :, record]
+                    unsorted = record
+            selected_data[:, :, start:stop] = selected[:, positions]
+
+    if data.ndim != 2:
+        return selected_data[0]
     return (selected_data)
 
 
+class FoldedPercentileStream(object):
+    """
+    FoldedPercentileStream calculates the same percentile rows as
+    folded_monte_carlo, but takes the data one fold at a time so the whole
+    series never needs to be in memory.
+
+    While there are no more than max_exact_folds folds, they are kept and the
+    percentiles are exact.  After that each sample instance keeps a histogram
+    of the values it has seen, using the same bins for every sample instance,
+    and percentiles are read from the histograms.  Memory is then
+    proportional to the samples per fold rather than the total number of
+    samples.  The counts use the smallest unsigned integer type that can hold
+    the number of folds, so with the defaults a week of 5 minute samples per
+    fold holds about 0.3 MB for up to 255 folds and 0.55 MB for up to 65535,
+    where the whole series given to folded_monte_carlo takes 0.016 MB per
+    fold.  The stream is smaller from about 20 folds on, and 100 folds take
+    a fifth of the memory.  nbytes reports the memory held.  An estimate is never further than error_bound from the value
+    folded_monte_carlo would select, and the 0 and 100 percentiles stay
+    exact.  Integer data spanning fewer values than there are bins remains
+    exact.
+
+    When a value falls outside the range of the bins, the bin width is
+    doubled, merging neighbouring bins, until the range covers it.
+
+    For example, to follow a simulation week by week
+
+        stream = FoldedPercentileStream(numpy.array([0, 10, 50, 90, 100]),
+                                        samples_per_week)
+        for week in range(number_of_weeks):
+            simulation.run(until=(week + 1) * seconds_per_week)
+            stream.add_fold(zero_order_resample(simulation_data,
+                                                sample_points_of_week))
+        selected_data = stream.percentiles()
+
+    """
+
+    def __init__(self, percentiles, samples_per_fold, max_exact_folds=16,
+                 bins=128):
+        if bins < 2 or bins % 2:
+            raise ValueError("bins must be an even number of at least 2")
+        self.percentile_values = numpy.asarray(percentiles)
+        self.samples_per_fold = samples_per_fold
+        self.max_exact_folds = max_exact_folds
+        self.bins = bins
+        self.number_of_folds = 0
+
+        self._folds = []
+        self._counts = None
+        self._low = None
+        self._width = None
+        self._integral = True
+        self._minimum = None
+        self._maximum = None
+
+    @property
+    def exact(self):
+        """True while the percentiles are calculated exactly"""
+        return self._counts is None
+
+    @property
+    def error_bound(self):
+        """Largest difference between an estimate and the exact percentile"""
+        if self.exact or (self._integral and self._width == 1):
+            return 0.0
+        return self._width / 2.0
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays of the stream"""
+        arrays = list(self._folds)
+        if self._counts is not None:
+            arrays.append(self._counts)
+        if self._minimum is not None:
+            arrays += [self._minimum, self._maximum]
+        return sum(array.nbytes for array in arrays)
+
+    def add_folds(self, data):
+        """Add a series holding a whole number of folds"""
+        for fold in numpy.asarray(data).reshape(-1, self.samples_per_fold):
+            self.add_fold(fold)
+
+    def add_fold(self, fold):
+        """Add the samples of one fold"""
+        fold = numpy.asarray(fold, dtype=float)
+        if fold.shape != (self.samples_per_fold,):
+            raise ValueError("A fold must hold samples_per_fold samples")
+
+        if self._minimum is None:
+            self._minimum = fold.copy()
+            self._maximum = fold.copy()
+        else:
+            numpy.minimum(self._minimum, fold, out=self._minimum)
+            numpy.maximum(self._maximum, fold, out=self._maximum)
+        self._integral = self._integral and bool(
+            numpy.all(fold == numpy.floor(fold)))
+        self.number_of_folds += 1
+
+        if self._counts is None:
+            self._folds.append(fold)
+            if len(self._folds) > self.max_exact_folds:
+                self._start_histograms()
+        else:
+            self._add_to_histograms(fold)
+
+    def _start_histograms(self):
+        folds = self._folds
+        self._folds = []
+
+        low = numpy.floor(self._minimum.min())
+        span = self._maximum.max() - low
+        if self._integral:
+            # Bins one or a power of two values wide, starting on an integer
+            width = 1.0
+            while width * self.bins <= span:
+                width *= 2
+        else:
+            width = max(span / self.bins * (1 + 1e-9), 1e-12)
+        self._low = low
+        self._width = width
+        self._counts = numpy.zeros((self.samples_per_fold, self.bins),
+                                   dtype=numpy.min_scalar_type(
+                                       self.number_of_folds))
+        for fold in folds:
+            self._add_to_histograms(fold)
+
+    def _add_to_histograms(self, fold):
+        # Widen the counts once a count could overflow
+        dtype = numpy.promote_types(
+            self._counts.dtype, numpy.min_scalar_type(self.number_of_folds))
+        if dtype != self._counts.dtype:
+            self._counts = self._counts.astype(dtype)
+        while fold.min() < self._low:
+            # Double the range to the left
+            merged = self._counts.reshape(self.samples_per_fold, -1, 2).sum(
+                2, dtype=self._counts.dtype)
+            self._counts[:, :self.bins // 2] = 0
+            self._counts[:, self.bins // 2:] = merged
+            self._low -= self._width * self.bins
+            self._width *= 2
+        while fold.max() >= self._low + self._width * self.bins:
+            # Double the range to the right
+            merged = self._counts.reshape(self.samples_per_fold, -1, 2).sum(
+                2, dtype=self._counts.dtype)
+            self._counts[:, :self.bins // 2] = merged
+            self._counts[:, self.bins // 2:] = 0
+            self._width *= 2
+
+        bin_index = ((fold - self._low) // self._width).astype(int)
+        self._counts[numpy.arange(self.samples_per_fold), bin_index] += 1
+
+    def percentiles(self):
+        """
+        Return the rows folded_monte_carlo would select for the folds added
+        so far, exactly or within error_bound
+        """
+        if self.exact:
+            return folded_monte_carlo(self.percentile_values,
+                                      numpy.concatenate(self._folds),
+                                      self.number_of_folds)
+
+        records_to_select = (numpy.rint(self.percentile_values *
+                             (self.number_of_folds - 1) / 100)).astype(int)
+
+        # For each sample instance, find the bin holding each selected rank
+        # No running count exceeds the number of folds, so the counts' own
+        # type holds them
+        cumulative_counts = numpy.cumsum(self._counts, axis=1,
+                                         dtype=self._counts.dtype)
+        selected_bins = numpy.empty((len(records_to_select),
+                                     self.samples_per_fold), dtype=int)
+        for row, record in enumerate(records_to_select):
+            selected_bins[row] = (cumulative_counts <= record).sum(axis=1)
+
+        estimates = self._low + selected_bins * self._width
+        if not (self._integral and self._width == 1):
+            estimates = estimates + self._width / 2.0
+        return numpy.clip(estimates, self._minimum, self._maximum)
+
+
 def test():
     """ Run a suite of test functions """
 
@@ -145,6 +406,73 @@ def test():
 
     print(folded_monte_carlo(percentiles, data, number_of_folds))
 
+    # Batches of series, partial folds and memory-mapped data all give the
+    # same results as sorting each fold separately
+    def sorted_reference(percentiles, folds):
+        rows = []
+        for column in range(len(folds[0])):
+            values = numpy.sort([fold[column] for fold in folds
+                                 if column < len(fold)])
+            records = numpy.rint(percentiles * (len(values) - 1)
+                                 / 100).astype(int)
+            rows.append(values[records])
+        return numpy.array(rows).T
+
+    generator = numpy.random.default_rng(1)
+    percentiles = numpy.array([0, 10, 50, 50, 90, 100])
+    batch = generator.integers(0, 100, (3, 7 * 11 + 4))
+    selected = folded_monte_carlo(percentiles, batch, samples_per_fold=11)
+    assert selected.shape == (3, 6, 11)
+    for series, result in zip(batch, selected):
+        folds = [series[start:start + 11]
+                 for start in range(0, len(series), 11)]
+        assert numpy.array_equal(result, sorted_reference(percentiles, folds))
+    assert numpy.array_equal(selected[1], folded_monte_carlo(
+        percentiles, batch[1], number_of_folds=8))
+
+    import tempfile
+    with tempfile.TemporaryFile() as backing_file:
+        mapped = numpy.memmap(backing_file, dtype=batch.dtype,
+                              shape=batch.shape)
+        mapped[:] = batch
+        assert numpy.array_equal(
+            folded_monte_carlo(percentiles, mapped, samples_per_fold=11),
+            selected)
+
+    # Enough folds to select rather than sort
+    batch = generator.integers(0, 1000, (2, (SORT_FOLDS + 100) * 7 + 3))
+    for series, result in zip(batch, folded_monte_carlo(
+            percentiles, batch, samples_per_fold=7)):
+        folds = [series[start:start + 7]
+                 for start in range(0, len(series), 7)]
+        assert numpy.array_equal(result, sorted_reference(percentiles, folds))
+
+    # Test the FoldedPercentileStream class, exact for a few folds and
+    # within its error bound for many
+    generator = numpy.random.default_rng(0)
+    percentiles = numpy.array([0, 10, 50, 90, 100])
+    for data, folds in ((generator.integers(0, 50, 20 * 7), 20),
+                        (generator.integers(0, 50, 500 * 7), 500),
+                        (generator.normal(0, 10, 500 * 7), 500),
+                        (generator.integers(0, 5000, 500 * 7), 500)):
+        stream = FoldedPercentileStream(percentiles, 7, max_exact_folds=64,
+                                        bins=64)
+        for fold in data.reshape(folds, 7):
+            stream.add_fold(fold)
+        expected = folded_monte_carlo(percentiles, data, folds)
+        error = numpy.abs(stream.percentiles() - expected).max()
+        print(folds, stream.exact, stream.error_bound, error)
+        assert error <= stream.error_bound
+
+    # 100 weeks of 5 minute samples take less memory than the whole series
+    data = generator.integers(0, 60, 100 * 2016)
+    stream = FoldedPercentileStream(percentiles, 2016)
+    stream.add_folds(data)
+    print(stream.nbytes, data.astype(float).nbytes)
+    assert stream.nbytes < data.astype(float).nbytes / 5
+    assert numpy.array_equal(stream.percentiles(),
+                             folded_monte_carlo(percentiles, data, 100))
+
 
 if __name__ == '__main__':
     test()
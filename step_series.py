@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+
+"""
+step_series.py
+
+A step function of time, such as stock on hand, held as sorted arrays of
+change times and values.
+
+The value at a time is the value of the latest change at or before it, and
+before the first change it is the first value, the same zero order hold as
+`retail_analyser.zero_order_resample`.  Changes are appended in time order
+into arrays that grow by doubling, like those of `recorder.Recorder`, and
+queries look times up with `numpy.searchsorted`, for one time or an array of
+them.
+
+Time weighted means come from a running integral of the function kept at each
+change, so the mean over any window takes two lookups.  Minimums and maximums
+over a window come from a pyramid of block minimums and maximums, each level
+summarising `BLOCK` entries of the one below, so a window is covered by at
+most `2 * BLOCK` entries per level.  The pyramid is brought up to date when it
+is queried, so appending stays cheap.
+
+Example
+
+series = StepSeries(*simulator.recorder('SOH').data())
+print(series.value_at(86400), series.mean(0, 604800),
+      series.minimum(0, 604800))
+"""
+
+import numpy
+
+
+# Number of entries of a pyramid level summarised by one of the next level
+BLOCK = 64
+
+
+class _Buffer(object):
+    # A growable array, doubling its capacity when full
+
+    def __init__(self, capacity):
+        self.array = numpy.empty(max(capacity, 1))
+        self.size = 0
+
+    def view(self):
+        return self.array[:self.size]
+
+    def extend(self, values):
+        size = self.size + len(values)
+        if size > len(self.array):
+            grown = numpy.empty(max(size, 2 * len(self.array)))
+            grown[:self.size] = self.array[:self.size]
+            self.array = grown
+        self.array[self.size:size] = values
+        self.size = size
+
+
+class StepSeries(object):
+    """A step function of time with fast point and window queries.
+
+    Attributes:
+        times: View of the times the value changes, in order
+        values: View of the value from each time on
+    """
+
+    def __init__(self, times=(), values=(), capacity=1024):
+        """Initialize the StepSeries object.
+
+        Args:
+            times: Times of the changes, in order, such as the first row of
+                `recorder.Recorder.data`
+            values: Value from each of `times` on
+            capacity: Number of changes to make room for to start with
+        """
+        self._times = _Buffer(max(capacity, len(times)))
+        self._values = _Buffer(max(capacity, len(times)))
+        # Integral of the function from the first change to each change
+        self._integral = _Buffer(max(capacity, len(times)))
+        # Block minimums and maximums, level 1 upwards
+        self._minimums = []
+        self._maximums = []
+        self.extend(times, values)
+
+    def __len__(self):
+        return self._times.size
+
+    @property
+    def times(self):
+        return self._times.view()
+
+    @property
+    def values(self):
+        return self._values.view()
+
+    def append(self, time, value):
+        """Change the value to `value` from `time` on.
+
+        Raises:
+            ValueError: if `time` is before the last change
+        """
+        self.extend((time,), (value,))
+
+    def extend(self, times, values):
+        """Append changes at `times`, in order, to `values`.
+
+        Raises:
+            ValueError: if the times are out of order or before the last
+                change
+        """
+        times = numpy.asarray(times, dtype=float)
+        values = numpy.asarray(values, dtype=float)
+        if times.shape != values.shape or times.ndim != 1:
+            raise ValueError("times and values must be 1-D arrays of the "
+                             "same length")
+        if not len(times):
+            return
+        size = self._times.size
+        if size:
+            last_time = self._times.array[size - 1]
+            last_value = self._values.array[size - 1]
+            last_integral = self._integral.array[size - 1]
+            previous_times = numpy.concatenate(([last_time], times[:-1]))
+            previous_values = numpy.concatenate(([last_value], values[:-1]))
+        else:
+            last_integral = 0.0
+            previous_times = numpy.concatenate((times[:1], times[:-1]))
+            previous_values = numpy.concatenate((values[:1], values[:-1]))
+        steps = times - previous_times
+        if numpy.any(steps < 0):
+            raise ValueError("Changes must be appended in time order")
+        integral = numpy.cumsum(previous_values * steps)
+        integral += last_integral
+        self._times.extend(times)
+        self._values.extend(values)
+        self._integral.extend(integral)
+
+    def _index(self, times):
+        # Index of the change in force at each time, the first before it
+        index = numpy.searchsorted(self.times, times, side='right') - 1
+        return numpy.maximum(index, 0)
+
+    def value_at(self, times):
+        """Return the value at a time or at each of an array of times.
+
+        Raises:
+            IndexError: if the series is empty
+        """
+        if not len(self):
+            raise IndexError("The series is empty")
+        return self.values[self._index(times)]
+
+    def _integral_to(self, times):
+        index = self._index(times)
+        return (self._integral.array[index] +
+                self._values.array[index] * (times - self._times.array[index]))
+
+    def integral(self, start, end):
+        """Return the integral of the function from `start` to `end`.
+
+        `start` and `end` can be arrays of window bounds.
+        """
+        if not len(self):
+            raise IndexError("The series is empty")
+        start = numpy.asarray(start, dtype=float)
+        end = numpy.asarray(end, dtype=float)
+        return self._integral_to(end) - self._integral_to(start)
+
+    def mean(self, start, end):
+        """Return the time weighted mean from `start` to `end`.
+
+        `start` and `end` can be arrays of window bounds, each `end` later
+        than its `start`.
+        """
+        start = numpy.asarray(start, dtype=float)
+        end = numpy.asarray(end, dtype=float)
+        return self.integral(start, end) / (end - start)
+
+    def _build(self):
+        # Summarise the complete blocks added since the last query
+        for pyramid, reduce in ((self._minimums, numpy.min),
+                                (self._maximums, numpy.max)):
+            below = self.values
+            level = 0
+            while len(below) >= BLOCK:
+                if level == len(pyramid):
+                    pyramid.append(_Buffer(len(below) // BLOCK))
+                summary = pyramid[level]
+                complete = len(below) // BLOCK
+                if complete > summary.size:
+                    summary.extend(reduce(
+                        below[summary.size * BLOCK:complete * BLOCK].reshape(
+                            -1, BLOCK), axis=1))
+                below = summary.view()
+                level += 1
+
+    def _reduce(self, start, end, pyramid, reduce):
+        # Reduce the values in force from start to end, taking whole blocks
+        # from the pyramid and the partial blocks at each end from the level
+        # below
+        if not len(self):
+            raise IndexError("The series is empty")
+        if end < start:
+            raise ValueError("The window ends before it starts")
+        low = int(self._index(start))
+        high = max(int(numpy.searchsorted(self.times, end, side='left')),
+                   low + 1)
+        self._build()
+        below = self.values
+        parts = []
+        level = 0
+        while high - low > 2 * BLOCK and level < len(pyramid):
+            head = -(-low // BLOCK) * BLOCK
+            tail = high // BLOCK * BLOCK
+            if low < head:
+                parts.append(reduce(below[low:head]))
+            if tail < high:
+                parts.append(reduce(below[tail:high]))
+            low, high = head // BLOCK, tail // BLOCK
+            below = pyramid[level].view()
+            level += 1
+        parts.append(reduce(below[low:high]))
+        return reduce(parts)
+
+    def minimum(self, start, end):
+        """Return the lowest value from `start` to `end`.
+
+        Changes at `end` itself are not included, unless the window is empty.
+        """
+        return float(self._reduce(start, end, self._minimums, numpy.min))
+
+    def maximum(self, start, end):
+        """Return the highest value from `start` to `end`.
+
+        Changes at `end` itself are not included, unless the window is empty.
+        """
+        return float(self._reduce(start, end, self._maximums, numpy.max))
+
+
+def test():
+    """ Run a suite of test functions """
+
+    from retail_analyser import zero_order_resample
+
+    # The example of zero_order_resample
+    series = StepSeries([1, 5, 10, 11, 12, 20], [1, 2, 3, 4, 5, 6])
+    assert series.value_at(numpy.array([-10, 1, 2, 10, 30])).tolist() == \
+        [1, 1, 1, 3, 6]
+    assert series.value_at(10.5) == 3
+    assert series.integral(0, 12) == 1 * 5 + 2 * 5 + 3 * 1 + 4 * 1
+    assert series.mean(10, 12) == 3.5
+    assert series.minimum(5, 12) == 2 and series.maximum(5, 12) == 4
+    assert series.minimum(10.5, 10.5) == 3
+    try:
+        series.append(19, 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A change was appended out of order")
+
+    # Against brute force on a long random walk, appended piece by piece
+    generator = numpy.random.default_rng(0)
+    times = numpy.cumsum(generator.integers(0, 4, 300000)).astype(float)
+    values = numpy.cumsum(generator.normal(size=300000))
+    series = StepSeries(capacity=16)
+    for piece in numpy.array_split(numpy.arange(300000), 7):
+        series.extend(times[piece], values[piece])
+        series.minimum(0, 1)
+    sample_points = generator.uniform(-10, times[-1] + 10, 1000)
+    assert numpy.array_equal(
+        series.value_at(sample_points),
+        zero_order_resample(numpy.vstack([times, values]), sample_points))
+
+    grid = numpy.arange(times[0], times[-1] + 1)
+    held = zero_order_resample(numpy.vstack([times, values]), grid)
+    for _ in range(200):
+        start, end = numpy.sort(generator.integers(0, len(grid), 2))
+        end = max(end, start + 1)
+        window = held[start:end]
+        assert numpy.isclose(series.mean(grid[start], grid[end - 1] + 1),
+                             window.mean())
+        # Changes that last no time still count in the window
+        low = numpy.searchsorted(times, grid[start], side='right') - 1
+        high = numpy.searchsorted(times, grid[end - 1] + 1, side='left')
+        assert series.minimum(grid[start], grid[end - 1] + 1) == \
+            values[low:high].min()
+        assert series.maximum(grid[start], grid[end - 1] + 1) == \
+            values[low:high].max()
+
+
+if __name__ == '__main__':
+    test()
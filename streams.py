@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""
+streams.py
+
+Seeded random number streams for the components of a model.
+
+`RandomStreams` hands out an independent `numpy.random.Generator` for each
+named component, such as 'customers' or 'deliveries', derived from one root
+seed and the component's name.  A component's draws don't depend on which
+other components exist or how often they draw, so changing one part of a
+model leaves the random numbers of the rest alone, and a replication is
+reproduced exactly from its seed.  `RandomStreams.spawn` derives independent
+streams for parallel replications, as `replication.replication_seeds` does.
+
+Models that draw one number at a time use the `Stream` methods, which serve
+draws from a block drawn in one NumPy call, rather than calling the global
+`random` module or the generator for every draw.  Bulk draws can use the
+stream's `generator` directly.
+
+Example
+
+simulation = Simulator(0, simulation_period, seed=seed)
+
+def customer(env):
+    env.stock -= 1
+    env.schedule(env.time + env.stream('customers').exponential(1800), 1,
+                 customer)
+"""
+
+import hashlib
+
+import numpy
+
+
+# Number of draws made at a time
+BLOCK_SIZE = 65536
+
+
+def _name_key(name):
+    # Two 32 bit words identifying `name`, the same in every process
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest()
+    return (int.from_bytes(digest[:4], 'little'),
+            int.from_bytes(digest[4:], 'little'))
+
+
+class Stream(object):
+    """Random numbers for one component, drawn a block at a time.
+
+    Attributes:
+        name: Name of the component
+        generator: The stream's `numpy.random.Generator`
+        block_size: Number of draws made at a time
+    """
+
+    def __init__(self, name, generator, block_size=BLOCK_SIZE):
+        """Initialize the Stream object."""
+        self.name = name
+        self.generator = generator
+        self.block_size = block_size
+        self._exponentials = iter(())
+        self._normals = iter(())
+        self._uniforms = iter(())
+        self._integers = {}
+
+    def exponential(self, scale=1.0):
+        """Return an exponentially distributed number with mean `scale`."""
+        try:
+            return next(self._exponentials) * scale
+        except StopIteration:
+            self._exponentials = iter(self.generator.standard_exponential(
+                self.block_size).tolist())
+            return next(self._exponentials) * scale
+
+    def normal(self, loc=0.0, scale=1.0):
+        """Return a normally distributed number."""
+        try:
+            return loc + next(self._normals) * scale
+        except StopIteration:
+            self._normals = iter(self.generator.standard_normal(
+                self.block_size).tolist())
+            return loc + next(self._normals) * scale
+
+    def uniform(self, low=0.0, high=1.0):
+        """Return a number uniformly distributed from `low` up to `high`."""
+        try:
+            return low + next(self._uniforms) * (high - low)
+        except StopIteration:
+            self._uniforms = iter(self.generator.random(
+                self.block_size).tolist())
+            return low + next(self._uniforms) * (high - low)
+
+    def integers(self, low, high):
+        """Return an integer from `low` up to, but not including, `high`.
+
+        Each range has its own block of draws.
+        """
+        key = (low, high)
+        try:
+            return next(self._integers[key])
+        except (KeyError, StopIteration):
+            self._integers[key] = iter(self.generator.integers(
+                low, high, self.block_size).tolist())
+            return next(self._integers[key])
+
+
+class RandomStreams(object):
+    """Independent random number streams, one per named component.
+
+    Attributes:
+        seed_sequence: Root `numpy.random.SeedSequence` of the streams
+        block_size: Number of draws each `Stream` makes at a time
+    """
+
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        """Initialize the RandomStreams object.
+
+        Args:
+            seed: Root seed, an int, a `numpy.random.SeedSequence` such as
+                one from `replication.replication_seeds`, or None for fresh
+                entropy
+            block_size: Number of draws each `Stream` makes at a time
+        """
+        if not isinstance(seed, numpy.random.SeedSequence):
+            seed = numpy.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.block_size = block_size
+        self._streams = {}
+
+    def stream(self, name):
+        """Return the `Stream` of the component called `name`.
+
+        The same name always gives the same stream for the same root seed.
+        """
+        try:
+            return self._streams[name]
+        except KeyError:
+            root = self.seed_sequence
+            seed = numpy.random.SeedSequence(
+                root.entropy, spawn_key=root.spawn_key + _name_key(name),
+                pool_size=root.pool_size)
+            stream = self._streams[name] = Stream(
+                name, numpy.random.default_rng(seed), self.block_size)
+            return stream
+
+    def spawn(self, number):
+        """Return `number` independent `RandomStreams`, one per replication.
+
+        As with `numpy.random.SeedSequence.spawn`, each call returns new
+        children, and the n-th child spawned from a given seed is always the
+        same.
+        """
+        return [RandomStreams(child, self.block_size)
+                for child in self.seed_sequence.spawn(number)]
+
+
+def test():
+    """ Run a suite of test functions """
+
+    from replication import replication_seeds
+
+    # Streams depend only on the root seed and the name
+    streams = RandomStreams(5)
+    customers = streams.stream('customers')
+    assert streams.stream('customers') is customers
+    first = [customers.exponential(200) for _ in range(10)]
+    other = RandomStreams(5)
+    other.stream('deliveries').exponential()
+    assert [other.stream('customers').exponential(200)
+            for _ in range(10)] == first
+    assert [RandomStreams(6).stream('customers').exponential(200)
+            for _ in range(10)] != first
+
+    # Block draws are the same as drawing from the generator directly
+    generator = numpy.random.default_rng(RandomStreams(5).stream(
+        'customers').generator.bit_generator.seed_seq)
+    assert numpy.allclose(generator.standard_exponential(10) * 200, first)
+
+    # Draws cross block boundaries and stay in range
+    small = RandomStreams(1, block_size=7).stream('rubbish')
+    draws = [small.integers(0, 11) for _ in range(100)]
+    assert min(draws) >= 0 and max(draws) <= 10 and len(set(draws)) == 11
+    assert all(3 <= small.uniform(3, 4) < 4 for _ in range(20))
+    assert abs(numpy.mean([small.normal(10) for _ in range(2000)]) - 10) < 0.2
+
+    # Spawned streams match the replication seeds and are independent
+    children = RandomStreams(7).spawn(3)
+    seeds = replication_seeds(7, 3)
+    assert [child.seed_sequence.spawn_key for child in children] == \
+        [seed.spawn_key for seed in seeds]
+    assert len({child.stream('customers').uniform()
+                for child in children}) == 3
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""
+sweep.py
+
+Run a simulation model over a grid or list of parameters, caching the result
+of every point on disk.
+
+Results are stored as `.npy` files named after a hash of the point's
+parameters, the seed and the model version.  Re-running a sweep only
+simulates the points that aren't in the cache, so adding points to a grid
+only costs the new points.  Changing the model version, which by default is
+a hash of the source code of the collect function and of the module defining
+the model builder, invalidates the cache.  Callbacks the builder schedules
+from other modules aren't covered by the default, so models spread over
+several modules should pass an explicit `model_version`.
+
+Example
+
+def build_model(parameters, seed):
+    simulator = Simulator(0, simulation_period, seed=seed,
+                          reorder_level=parameters['reorder_level'],
+                          carton_size=parameters['carton_size'])
+    ...
+    return simulator
+
+points = parameter_grid(reorder_level=[40, 50, 60], carton_size=[12, 24])
+results = run_sweep(build_model, collect, points, seed=1)
+
+`build_model` and `collect` are sent to worker processes, so they need to be
+functions defined at the top level of a module.
+"""
+
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+
+def parameter_grid(**axes):
+    """Return every combination of the values of the keyword arguments.
+
+    Example:
+        parameter_grid(a=[1, 2], b=['x'])
+        returns [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'x'}]
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(axes[name] for name in names))]
+
+
+def _source_of(function):
+    # The source of the function and of the module defining it, so that
+    # changes to the callbacks a builder schedules also change the version
+    name = function.__module__ + '.' + function.__qualname__
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        return name
+    try:
+        module_source = inspect.getsource(inspect.getmodule(function))
+    except (OSError, TypeError):
+        module_source = ''
+    return '\n'.join((name, source, module_source))
+
+
+def model_version_of(build_model, collect=None):
+    """Return a hash of the source code of `build_model` and `collect`.
+
+    The source of the modules defining them is included, so changing a
+    callback defined next to the builder also changes the version.
+    """
+    sources = [_source_of(build_model)]
+    if collect is not None:
+        sources.append(_source_of(collect))
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(source.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def cache_key(parameters, seed, model_version):
+    """Return the cache file name for a point of a sweep."""
+    description = json.dumps({'parameters': parameters,
+                              'seed': seed,
+                              'model_version': model_version},
+                             sort_keys=True, default=repr)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest() + '.npy'
+
+
+def _run_point(build_model, collect, parameters, seed, path):
+    simulator = build_model(parameters, numpy.random.SeedSequence(seed))
+    simulator.run()
+    result = numpy.asarray(collect(simulator))
+
+    # Write to a temporary file first so that an interrupted sweep never
+    # leaves a partial result in the cache
+    directory = os.path.dirname(path)
+    handle, temporary_path = tempfile.mkstemp(dir=directory, suffix='.npy')
+    with os.fdopen(handle, 'wb') as temporary_file:
+        numpy.save(temporary_file, result)
+    os.replace(temporary_path, path)
+    return path
+
+
+def run_sweep(build_model,
+              collect,
+              points,
+              seed=0,
+              model_version=None,
+              cache_directory='sweep_cache',
+              workers=None):
+    """Run the model at every point of a sweep, reusing cached results.
+
+    Every point is run with the same seed, so differences between points
+    come from the parameters rather than the random numbers.
+
+    Args:
+        build_model: Function taking a parameter dictionary and a
+            `numpy.random.SeedSequence` and returning a `Simulator`
+        collect: Function taking the `Simulator` after its run and returning
+            an array of results
+        points: List of parameter dictionaries, such as the output of
+            `parameter_grid`.  Values must be JSON serializable.
+        seed: Integer seed given to every point
+        model_version: String identifying the model.  Defaults to a hash of
+            the source code of `build_model`, `collect` and the modules
+            defining them.
+        cache_directory: Directory holding the cached results
+        workers: Number of worker processes, the number of CPUs if None.  With
+            one worker the points are run in this process.
+
+    Returns:
+        list: `(parameters, result)` tuples in the order of `points`
+    """
+    if model_version is None:
+        model_version = model_version_of(build_model, collect)
+    os.makedirs(cache_directory, exist_ok=True)
+
+    paths = [os.path.join(cache_directory,
+                          cache_key(parameters, seed, model_version))
+             for parameters in points]
+    missing = [(parameters, path) for parameters, path in zip(points, paths)
+               if not os.path.exists(path)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(missing) < 2:
+        for parameters, path in missing:
+            _run_point(build_model, collect, parameters, seed, path)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_point, build_model, collect,
+                                   parameters, seed, path)
+                       for parameters, path in missing]
+            for future in futures:
+                future.result()
+
+    return [(parameters, numpy.load(path))
+            for parameters, path in zip(points, paths)]
+
+
+_builds = []
+
+
+def _test_model(parameters, seed):
+    from DiscreteEventSimulator import Simulator
+
+    _builds.append(parameters)
+
+    def order(env):
+        env.orders += parameters['carton_size'] * (
+            env.stream('orders').uniform() < parameters['probability'])
+        env.schedule(env.time + 1, 1, order)
+
+    simulator = Simulator(0, 50, seed=seed, orders=0)
+    simulator.schedule(0, 1, order)
+    return simulator
+
+
+def _test_collect(simulator):
+    return [simulator.orders]
+
+
+def _test_collect_cartons(simulator):
+    return [simulator.orders // 12]
+
+
+def test():
+    """ Run a suite of test functions """
+
+    with tempfile.TemporaryDirectory() as directory:
+        points = parameter_grid(carton_size=[12, 24], probability=[0.5])
+        first = run_sweep(_test_model, _test_collect, points,
+                          cache_directory=directory, workers=1)
+        assert len(_builds) == 2
+
+        points = parameter_grid(carton_size=[12, 24], probability=[0.5, 0.9])
+        second = run_sweep(_test_model, _test_collect, points,
+                           cache_directory=directory, workers=1)
+        print([(parameters, result.tolist()) for parameters, result in second])
+        assert len(_builds) == 4
+        assert [result.tolist() for _, result in first] == \
+            [result.tolist() for parameters, result in second
+             if parameters['probability'] == 0.5]
+
+        # A different seed is a different point
+        run_sweep(_test_model, _test_collect, points[:1], seed=1,
+                  cache_directory=directory, workers=1)
+        assert len(_builds) == 5
+
+        # Changing the collect function re-simulates the points
+        recollected = run_sweep(_test_model, _test_collect_cartons,
+                                points[:1], cache_directory=directory,
+                                workers=1)
+        assert len(_builds) == 6
+        assert recollected[0][1].tolist() == \
+            [second[0][1].tolist()[0] // 12]
+
+    # Worker processes give the same results as one process and fill the
+    # cache
+    with tempfile.TemporaryDirectory() as directory:
+        points = parameter_grid(carton_size=[12, 24], probability=[0.5, 0.9])
+        parallel = run_sweep(_test_model, _test_collect, points,
+                             cache_directory=directory, workers=2)
+        assert len(_builds) == 6
+        assert [result.tolist() for _, result in parallel] == \
+            [result.tolist() for _, result in second]
+        cached = run_sweep(_test_model, _test_collect, points,
+                           cache_directory=directory, workers=1)
+        assert len(_builds) == 6
+        assert [result.tolist() for _, result in cached] == \
+            [result.tolist() for _, result in second]
+
+
+if __name__ == '__main__':
+    test()
@@ -1,9 +1,11 @@
 import DiscreteEventSimulator
-import random
 import math
 import sqlite3
 import numpy
 import piece_wise
+import arrivals
+import resources
+import step_series
 import matplotlib.pyplot as plt
 import retail_analyser as ra
 
@@ -16,51 +18,25 @@ def init_SOH_table(db):
     db.commit()
 
 
-def get_SOH_table(db):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM SOH_LOG")
-
-    arr = numpy.array(cur.fetchall())
-    slicedArr = arr[:, 1:3]
-    sortedArr = slicedArr[slicedArr[:, 0].argsort()]
-    return sortedArr.T
-
-
-def get_SOH_at_time(time, database):
-    cur = database.cursor()
-    cur.execute("SELECT STOCK_ON_HAND \
-                 FROM SOH_LOG \
-                 WHERE ADJUSTMENT_TIME <= ? \
-                 ORDER BY ADJUSTMENT_TIME DESC\
-                 LIMIT 1", (time,))
-    return cur.fetchall()[0][0]
-
-
-def log_SOH(time, stockOnHand, database):
-    cur = database.cursor()
-    cur.execute("INSERT INTO SOH_LOG\
-                VALUES(null, ?, ?)",
-                (time, stockOnHand))
-    database.commit()
+def get_SOH_at_time(time, SOHSeries):
+    # Stock on hand at a time, or at each of an array of times
+    return SOHSeries.value_at(time)
 
 
 def order(simulator, database):
-    global StockOnHand
-    orderAmount = 50 - StockOnHand
+    stock = simulator.stock
+    orderAmount = 50 - stock.level
     if (orderAmount < 0):
         orderAmount = 0
     cartonsToOrder = math.ceil(orderAmount / 24.0)
-    StockOnHand = StockOnHand + 24 * cartonsToOrder
-    log_SOH(simulator.time, StockOnHand, database)
+    stock.put(24 * cartonsToOrder)
+    simulator.record('SOH', stock.level)
 
 
 def customer(simulator, database):
-    global StockOnHand
-    StockOnHand -= 1
-    if (StockOnHand < 0):
-        StockOnHand = 0
-    currentTime = simulator.time
-    log_SOH(currentTime, StockOnHand, database)
+    # A customer who finds no stock is a lost sale
+    simulator.stock.try_get(1)
+    simulator.record('SOH', simulator.stock.level)
 
 
 # Create database
@@ -92,31 +68,37 @@ salesData = numpy.array([[(0 * 24 + 0) * 3600, 0],
                          [(6 * 24 + 24) * 3600, 30000],
                          ])
 
-salesProfile = piece_wise.function(salesData)
+# The profile repeats every week
+salesProfile = piece_wise.function(salesData, periodic=True)
 
 
 # Perform Simulation
-s = DiscreteEventSimulator.Simulator()
-for orderNumber in range(0, WeeksToSimulate*7):
-    s.schedule(3600 + orderNumber * 86400, order, s, database)
+s = DiscreteEventSimulator.Simulator(0, simulationPeriod)
+s.stock = resources.Container(s, level=StockOnHand)
 
+# Stock on hand is recorded in memory and copied to the database in batches
+s.recorder('SOH',
+           database=database,
+           insert_sql="INSERT INTO SOH_LOG VALUES(null, ?, ?)")
 
+# An order is placed at 1am every day
+def daily_orders(database):
+    for orderNumber in range(0, WeeksToSimulate*7):
+        yield (3600 + orderNumber * 86400, 0, order, (database,))
 
-dollars = 0
-dollarsPerWeek = 30000
-averageDollarsPerCustomer = 200
 
-while (dollars < WeeksToSimulate * dollarsPerWeek):
+s.add_source(daily_orders(database))
 
-    weeks = numpy.modf(dollars /dollarsPerWeek)
-    secondsIntoWeek = salesProfile.interpolate(weeks[0] * dollarsPerWeek, invert=True)
-    totalTime = weeks[1] * secondsPerWeek + secondsIntoWeek
 
-    customerArrivalTime = totalTime  #secondsPerWeek * (dollars/dollarsPerWeek)
 
-    s.schedule(customerArrivalTime, customer, s, database)
-    dollarsToNextCustomer = int(random.expovariate(1/averageDollarsPerCustomer))
-    dollars += dollarsToNextCustomer
+averageDollarsPerCustomer = 200
+
+# Customers arrive as the cumulative sales pass the total they spend
+customerArrivalTimes = arrivals.arrival_times(
+    salesProfile, simulationPeriod,
+    arrivals.exponential_spend(averageDollarsPerCustomer),
+    s.stream('customers').generator)
+s.schedule_many(customerArrivalTimes, 1, customer, args=(database,))
 
 
 s.run(simulationPeriod)
@@ -124,7 +106,8 @@ s.run(simulationPeriod)
 
 
 # Analyse results
-simulationResults = get_SOH_table(database)
+s.recorder('SOH').flush()
+simulationResults = s.recorder('SOH').data()
 
 
 
@@ -134,8 +117,15 @@ samplesPerWeek = secondsPerWeek/secondsBetweenSamples
 
 periodicSamplePoints = numpy.arange(0, simulationPeriod, secondsBetweenSamples)
 
+# Stock on hand as a step function of time
+SOHSeries = step_series.StepSeries(*simulationResults)
+print("Average SOH", SOHSeries.mean(0, simulationPeriod),
+      "lowest in the last week",
+      SOHSeries.minimum(simulationPeriod - secondsPerWeek, simulationPeriod),
+      "at the end", get_SOH_at_time(simulationPeriod, SOHSeries))
+
 # Resample the simulation results at the specified times
-regularlySampledSOHValue = ra.zero_order_resample(simulationResults, periodicSamplePoints)
+regularlySampledSOHValue = get_SOH_at_time(periodicSamplePoints, SOHSeries)
 
 # Create array of percentiles for aggregate statistics
 percentiles = numpy.array([0, 10, 50, 90, 100])
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""
+time_zones.py
+
+Cached conversion between local wall clock times and POSIX timestamps.
+
+Looking up a pytz time zone and localizing a datetime for every conversion is
+slow.  A `ZoneTable` instead takes the UTC offset transitions of a zone that
+fall within a window of time, such as the span of a simulation, and turns
+them into two sorted tables.  Converting a timestamp to local time, or a
+local wall clock time to a timestamp, is then a bisect plus an addition.
+NumPy arrays of times can be converted in one call.
+
+Local wall clock times are handled as "wall seconds", the number of seconds
+from 1970-01-01 00:00:00 to the wall clock time as if there were no time
+zone.  Conversions give the same results as pytz with the default
+`is_dst=False`.  A wall clock time skipped when daylight saving starts takes
+the offset from before the change, and a wall clock time repeated when
+daylight saving ends takes the standard time offset.  Times outside the
+window are passed to pytz.
+"""
+
+import bisect
+from datetime import datetime, timedelta
+
+import numpy
+import pytz
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# Transitions this close to the window are included in the tables, so that
+# wall clock times near the edges of the window are converted correctly
+MARGIN = 2 * 86400
+
+_zones = {}
+
+
+def get_zone(name):
+    """Return the pytz time zone called `name`, looking it up only once."""
+    try:
+        return _zones[name]
+    except KeyError:
+        zone = _zones[name] = pytz.timezone(name)
+        return zone
+
+
+def wall_seconds(year, month, day, hour, minute, second):
+    """Return the wall seconds of a wall clock time."""
+    return (datetime(year, month, day, hour, minute, second) -
+            EPOCH).total_seconds()
+
+
+def localized_timestamp(name, year, month, day, hour, minute, second):
+    """Convert a wall clock time in the zone `name` to a timestamp.
+
+    This is the uncached pytz conversion that `ZoneTable` reproduces.
+    """
+    zone = get_zone(name)
+    time = datetime(year, month, day, hour, minute, second)
+    return zone.localize(time).timestamp()
+
+
+def timestamp_to_datetime(name, timestamp):
+    """Convert a timestamp to an aware datetime in the zone `name`.
+
+    This is the uncached pytz conversion that `ZoneTable` reproduces.
+    """
+    utc_time = pytz.utc.localize(datetime.utcfromtimestamp(timestamp))
+    zone = get_zone(name)
+    return zone.normalize(utc_time.astimezone(zone))
+
+
+class ZoneTable(object):
+    """UTC offset transition tables of a time zone over a window of time.
+
+    Attributes:
+        name: Name of the time zone
+        zone: The pytz time zone
+        start: Earliest timestamp covered by the tables
+        end: Latest timestamp covered by the tables
+    """
+
+    def __init__(self, name, start, end):
+        """Initialize the ZoneTable object."""
+        self.name = name
+        self.zone = get_zone(name)
+        self.start = start
+        self.end = end
+
+        zone = self.zone
+        if hasattr(zone, '_utc_transition_times'):
+            transition_times = [(time - EPOCH).total_seconds()
+                                for time in zone._utc_transition_times]
+            first = max(0, bisect.bisect_right(transition_times,
+                                               start - MARGIN) - 1)
+            last = bisect.bisect_right(transition_times, end + MARGIN)
+            transition_times = transition_times[first:last]
+            information = zone._transition_info[first:last]
+            tzinfos = [zone._tzinfos[info] for info in information]
+        else:
+            # A zone with a fixed offset
+            transition_times = [float('-inf')]
+            information = [(zone.utcoffset(None), timedelta(0), None)]
+            tzinfos = [zone]
+        offsets = [info[0].total_seconds() for info in information]
+
+        # Timestamp to local time, the first interval reaches back in time
+        self._utc_starts = [float('-inf')] + transition_times[1:]
+        self._utc_offsets = offsets
+        self._tzinfos = tzinfos
+
+        # Local time to timestamp.  Each transition from offset `before` to
+        # `after` changes the offset at one wall clock time
+        local_starts = [float('-inf')]
+        for index in range(1, len(offsets)):
+            before = offsets[index - 1]
+            after = offsets[index]
+            utc_start = transition_times[index]
+            if (after < before and not information[index - 1][1] and
+                    information[index][1]):
+                # Repeated wall clock times keep the offset without daylight
+                # saving
+                local_starts.append(utc_start + before)
+            else:
+                local_starts.append(utc_start + after)
+        self._local_starts = local_starts
+
+        self._utc_starts_array = numpy.array(self._utc_starts)
+        self._utc_offsets_array = numpy.array(offsets)
+        self._local_starts_array = numpy.array(local_starts)
+
+    def localized_timestamp(self, year, month, day, hour, minute, second):
+        """Convert a local wall clock time to a timestamp."""
+        timestamp = self.to_timestamp(
+            wall_seconds(year, month, day, hour, minute, second))
+        if self.start <= timestamp <= self.end:
+            return timestamp
+        return localized_timestamp(self.name, year, month, day, hour, minute,
+                                   second)
+
+    def to_timestamp(self, wall_time):
+        """Convert wall seconds to a timestamp using the tables.
+
+        The result is only guaranteed to match pytz between `start` and
+        `end`.
+        """
+        index = bisect.bisect_right(self._local_starts, wall_time) - 1
+        return wall_time - self._utc_offsets[index]
+
+    def to_datetime(self, timestamp):
+        """Convert a timestamp to an aware datetime in the zone."""
+        if not self.start <= timestamp <= self.end:
+            return timestamp_to_datetime(self.name, timestamp)
+        index = bisect.bisect_right(self._utc_starts, timestamp) - 1
+        local_time = EPOCH + timedelta(seconds=timestamp +
+                                       self._utc_offsets[index])
+        return local_time.replace(tzinfo=self._tzinfos[index])
+
+    def to_wall_seconds(self, timestamp):
+        """Convert a timestamp to wall seconds."""
+        index = bisect.bisect_right(self._utc_starts, timestamp) - 1
+        return timestamp + self._utc_offsets[index]
+
+    def to_timestamps(self, wall_times):
+        """Convert an array of wall clock times to timestamps.
+
+        Args:
+            wall_times: NumPy array of wall seconds or of `datetime64` values
+
+        Returns:
+            numpy.ndarray: float timestamps
+        """
+        wall_times = numpy.asarray(wall_times)
+        if numpy.issubdtype(wall_times.dtype, numpy.datetime64):
+            wall_times = wall_times.astype('datetime64[us]').astype(
+                numpy.int64) / 1e6
+        wall_times = wall_times.astype(float)
+
+        indices = numpy.searchsorted(self._local_starts_array, wall_times,
+                                     side='right') - 1
+        timestamps = wall_times - self._utc_offsets_array[indices]
+
+        # Fall back to pytz outside the window
+        outside = numpy.flatnonzero((timestamps < self.start) |
+                                    (timestamps > self.end))
+        for index in outside.tolist():
+            local_time = EPOCH + timedelta(seconds=wall_times.flat[index])
+            timestamps.flat[index] = self.zone.localize(local_time).timestamp()
+        return timestamps
+
+    def to_wall_seconds_array(self, timestamps):
+        """Convert an array of timestamps to an array of wall seconds."""
+        timestamps = numpy.asarray(timestamps, dtype=float)
+        indices = numpy.searchsorted(self._utc_starts_array, timestamps,
+                                     side='right') - 1
+        wall_times = timestamps + self._utc_offsets_array[indices]
+
+        outside = numpy.flatnonzero((timestamps < self.start) |
+                                    (timestamps > self.end))
+        for index in outside.tolist():
+            local_time = timestamp_to_datetime(self.name,
+                                               timestamps.flat[index])
+            wall_times.flat[index] = (local_time.replace(tzinfo=None) -
+                                      EPOCH).total_seconds()
+        return wall_times
+
+
+def test():
+    """ Run a suite of test functions """
+
+    import random
+
+    start = localized_timestamp('UTC', 2015, 1, 1, 0, 0, 0)
+    end = localized_timestamp('UTC', 2019, 1, 1, 0, 0, 0)
+    generator = random.Random(0)
+
+    for name in ('Australia/Sydney', 'Australia/Brisbane', 'America/New_York',
+                 'Europe/Dublin', 'Australia/Lord_Howe', 'UTC', 'Etc/GMT+5'):
+        table = ZoneTable(name, start, end)
+
+        # Random times and every wall clock time either side of each
+        # transition, including skipped and repeated times
+        wall_times = [generator.uniform(start - 86400, end + 86400) // 60 * 60
+                      for _ in range(2000)]
+        for utc_start, offset in zip(table._utc_starts[1:],
+                                     table._utc_offsets[1:]):
+            for delta in range(-3 * 3600, 3 * 3600, 900):
+                wall_times.append(utc_start + offset + delta)
+
+        for wall_time in wall_times:
+            local_time = EPOCH + timedelta(seconds=wall_time)
+            fields = (local_time.year, local_time.month, local_time.day,
+                      local_time.hour, local_time.minute, local_time.second)
+            expected = localized_timestamp(name, *fields)
+            assert table.localized_timestamp(*fields) == expected, \
+                (name, local_time)
+            assert table.to_datetime(expected) == \
+                timestamp_to_datetime(name, expected)
+            assert str(table.to_datetime(expected)) == \
+                str(timestamp_to_datetime(name, expected))
+
+        expected = [localized_timestamp(name, *(
+            lambda t: (t.year, t.month, t.day, t.hour, t.minute, t.second))(
+            EPOCH + timedelta(seconds=wall_time)))
+            for wall_time in wall_times]
+        assert table.to_timestamps(numpy.array(wall_times)).tolist() == \
+            expected
+
+    print('time zone tables match pytz')
+
+
+if __name__ == '__main__':
+    test()